@@ -0,0 +1,899 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import re
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# The regression budget of the imports of the fast path (e.g. '--toggle-output'), as measured by 'python -X importtime'
+FAST_PATH_IMPORT_BUDGET_MS = 10
+# The slider values of the command matrix, as in the IDE launchers (.run/*.run.xml)
+MATRIX_SLIDER_VALUES = [0, 50, 100]
+# A metric, which changed by more than this fraction against the compared results, is reported as regression
+COMPARE_THRESHOLD = 0.2
+
+# The results of the benchmarks, which record them (see record_result()), by benchmark name and key
+RESULTS = {}
+# Whether the benchmarks, which support it, use a connected G6 instead of the simulated G6 (see '--hardware')
+USE_HARDWARE = False
+
+
+def install_simulated_transport():
+    """
+    Lets the CLI modules use the in-memory simulated G6 (see g6_transport.py) instead of a real device.
+    The runtime files of the CLI (e.g. the device cache) are redirected to a new temporary directory.
+    Must be called before any of the CLI modules is imported.
+    """
+    os.environ['G6_TRANSPORT'] = 'simulated'
+    os.environ['XDG_RUNTIME_DIR'] = tempfile.mkdtemp(prefix='g6-bench-')
+
+
+def record_result(benchmark_name, key, metrics):
+    """
+    Records the metrics of a measurement to be written as JSON results (see '--json').
+    :param benchmark_name: the name of the benchmark, e.g. 'matrix'
+    :param key: the name of the measurement within the benchmark, e.g. the command
+    :param metrics: the dict of metric names to numbers. The names end with their unit, e.g. 'build_us'.
+    """
+    RESULTS.setdefault(benchmark_name, {})[key] = metrics
+
+
+def write_results(json_file_path, iterations, transport_name):
+    """
+    Writes the recorded results together with the commit and the environment they have been measured in.
+    """
+    import subprocess
+
+    result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    results_dict = {
+        'commit': result.stdout.strip() if result.returncode == 0 else None,
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'transport': transport_name,
+        'iterations': iterations,
+        'results': RESULTS
+    }
+    with open(json_file_path, 'w') as file:
+        json.dump(results_dict, file, indent=2)
+
+
+def compare_results(json_file_path):
+    """
+    Compares the recorded results with the results of a former run (e.g. of another commit) and prints every metric,
+    which changed by more than the COMPARE_THRESHOLD. Larger values are regressions, since all metrics are times.
+    :param json_file_path: the JSON results of the former run (see '--json')
+    :return: the number of regressions
+    """
+    with open(json_file_path, 'r') as file:
+        former_dict = json.load(file)
+    print(f'# compared with {json_file_path} (commit {former_dict.get("commit")}, {former_dict.get("created")})')
+    regressions = 0
+    compared = 0
+    for benchmark_name, measurements in RESULTS.items():
+        for key, metrics in measurements.items():
+            former_metrics = former_dict['results'].get(benchmark_name, {}).get(key, {})
+            for metric_name, value in metrics.items():
+                former_value = former_metrics.get(metric_name)
+                if not former_value or value is None:
+                    continue
+                compared += 1
+                change = value / former_value - 1
+                if abs(change) > COMPARE_THRESHOLD:
+                    regressions += change > 0
+                    print(f'  {benchmark_name} {key} {metric_name}: {former_value:.3f} -> {value:.3f} '
+                          f'({change:+.0%}, {"REGRESSION" if change > 0 else "improvement"})')
+    print(f'  {compared} metrics compared, {regressions} regressions')
+    return regressions
+
+
+def run_cli(cli_args):
+    """
+    Runs the main function of the CLI with the given arguments and swallows its console output.
+    :param cli_args: the list of CLI arguments, without the program name
+    :return: the wall time in seconds
+    """
+    import g6_cli
+    argv = sys.argv
+    sys.argv = ['g6_cli.py'] + cli_args
+    try:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            g6_cli.main()
+        return time.perf_counter() - start
+    finally:
+        sys.argv = argv
+
+
+def bench_session(iterations):
+    """
+    Counts the open/close calls and the control transfers per CLI invocation against the simulated G6.
+    :param iterations: how often each invocation is run to measure the wall time
+    """
+    # --force: the same settings are sent again and again, which would be skipped by the device state otherwise
+    invocations = [
+        ['--force', '--set-surround', 'Enabled'],
+        ['--force', '--set-surround', 'Enabled', '--set-bass-value', '50', '--set-crystalizer', 'Enabled'],
+        ['--force', '--set-surround', 'Enabled', '--set-surround-value', '50',
+         '--set-crystalizer', 'Enabled', '--set-crystalizer-value', '50',
+         '--set-bass', 'Enabled', '--set-bass-value', '50',
+         '--set-smart-volume', 'Enabled', '--set-smart-volume-value', '50',
+         '--set-dialog-plus', 'Enabled', '--set-dialog-plus-value', '50'],
+    ]
+    from g6_transport import SIMULATED_G6
+
+    for cli_args in invocations:
+        for device_cache in ['--no-device-cache'], []:
+            SIMULATED_G6.reset_stats()
+            run_cli(cli_args + device_cache)
+            stats = dict(SIMULATED_G6.stats)
+            wall_time = min(run_cli(cli_args + device_cache) for _ in range(iterations))
+            print(' '.join(cli_args + device_cache))
+            print(f"  enumerate: {stats['enumerate']}, open: {stats['open']}, close: {stats['close']}, "
+                  f"descriptor queries: {stats['descriptor']}, writes: {stats['write']}, reads: {stats['read']}, "
+                  f"best wall time: {wall_time * 1000:.3f} ms")
+
+
+def build_legacy_integer_list(audio_feature_hex, value_hex):
+    """
+    The report pipeline before the introduction of frames: format the fields as hex string, validate it with a regex
+    and parse it back to a list of integers, prepended by the report_id.
+    """
+    assembled = (f"{format(0x5a, 'x').zfill(2)}{format(0x1207, 'x').zfill(4)}{format(0x0196, 'x').zfill(4)}"
+                 f"{format(audio_feature_hex, 'x').zfill(2)}{format(value_hex, 'x').zfill(8)}")
+    hex_line = assembled + '0' * 108
+    if not re.fullmatch(r'^[a-f0-9]{128}$', hex_line):
+        raise ValueError(hex_line)
+    hex_line = '00' + hex_line
+    return [int(hex_line[i:i + 2], 16) for i in range(0, len(hex_line), 2)]
+
+
+def bench_frames(iterations):
+    """
+    Compares the frames/sec of the legacy hex-line report pipeline with the packed frames.
+    :param iterations: how often each of the 101 slider values is built
+    """
+    from g6_encoder import encode_value
+    from g6_spec import Frame
+
+    value_words = [encode_value(value) for value in range(0, 101)]
+    count = iterations * len(value_words)
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for value_word in value_words:
+            build_legacy_integer_list(0x19, value_word)
+    legacy_seconds = time.perf_counter() - start
+
+    frame = Frame()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for value_word in value_words:
+            frame.pack(0x5a, 0x1207, 0x0196, 0x19, value_word)
+    frame_seconds = time.perf_counter() - start
+
+    print(f'  hex-line pipeline: {count / legacy_seconds:12.0f} frames/sec')
+    print(f'  packed frame:      {count / frame_seconds:12.0f} frames/sec')
+
+
+def bench_bulk(iterations):
+    """
+    Compares building the frames of the whole command space (every toggle state, slider value and special value of
+    every audio feature) by the single builders in a loop with a single call of Audio.build_frame_pairs(). Checks, that
+    both produce the same bytes.
+    :param iterations: how often the command space is built
+    """
+    from g6_spec import Audio, AudioFeatureEnum, AudioFeatureSpecialValueEnum
+    from g6_table import KIND_PAIR_COUNTS, KIND_SLIDER, KIND_SLIDER_SPECIAL, KIND_TOGGLE
+
+    # without a frame table, so that the single builders actually build the frames
+    audio = Audio()
+    commands = []
+    for audio_feature_enum in AudioFeatureEnum:
+        commands += [(audio_feature_enum, KIND_TOGGLE, enabled) for enabled in [False, True]]
+        commands += [(audio_feature_enum, KIND_SLIDER, value) for value in range(KIND_PAIR_COUNTS[KIND_SLIDER])]
+    commands += [(AudioFeatureEnum.SMART_VOLUME, KIND_SLIDER_SPECIAL, special_value_enum)
+                 for special_value_enum in AudioFeatureSpecialValueEnum]
+    single_builders = {
+        KIND_TOGGLE: (audio.build_hex_lines_toggle, audio.build_frames_toggle),
+        KIND_SLIDER: (audio.build_hex_lines_slider, audio.build_frames_slider),
+        KIND_SLIDER_SPECIAL: (audio.build_hex_lines_slider_special, audio.build_frames_slider_special)
+    }
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        hex_lines = [hex_line for audio_feature_enum, kind, value in commands
+                     for hex_line in single_builders[kind][0](audio_feature_enum, value)]
+    hex_lines_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        frames = [frame for audio_feature_enum, kind, value in commands
+                  for frame in single_builders[kind][1](audio_feature_enum, value)]
+    frames_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        buffer = audio.build_frame_pairs(commands)
+    bulk_seconds = time.perf_counter() - start
+
+    matching = buffer == bytes.fromhex(''.join(hex_lines)) == b''.join(bytes(frame.payload()) for frame in frames)
+    count = iterations * len(commands)
+    print(f'  {len(commands)} commands of the command space, built {iterations} times')
+    for name, seconds in [('hex-line builders', hex_lines_seconds), ('frame builders', frames_seconds),
+                          ('build_frame_pairs', bulk_seconds)]:
+        print(f'  {name + ":":20} {count / seconds:10.0f} commands/sec, {seconds / count * 1e6:7.3f} us/command '
+              f'({hex_lines_seconds / seconds:5.1f}x)')
+        record_result('bulk', name, {'command_us': seconds / count * 1e6})
+    try:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            array = audio.build_frame_pairs(commands, as_numpy=True)
+        numpy_seconds = time.perf_counter() - start
+        matching &= array.shape == (len(commands), 2, 64) and array.tobytes() == buffer
+        print(f'  {"NumPy array:":20} {count / numpy_seconds:10.0f} commands/sec, shape {array.shape}')
+    except ImportError:
+        print('  NumPy array:         NumPy is not installed')
+    print(f'  same bytes as the single builders: {"yes" if matching else "NO"}')
+    return matching
+
+
+def bench_table(iterations):
+    """
+    Compares the commands/sec of the frame builders with the lookups in the precompiled frame table. The table is built
+    to a temporary file, so that the benchmark does not depend on a previous build step.
+    :param iterations: how often the frames of each of the 101 slider values are built or looked up
+    """
+    from g6_spec import Audio, AudioFeatureEnum
+    from g6_table import FrameTable, build_frame_table
+
+    with tempfile.TemporaryDirectory() as temp_dir_path:
+        frame_table_path = os.path.join(temp_dir_path, 'frames.table')
+        start = time.perf_counter()
+        build_frame_table(frame_table_path)
+        build_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        frame_table = FrameTable.open(frame_table_path)
+        open_seconds = time.perf_counter() - start
+
+        count = iterations * 101
+        results = []
+        for audio in [Audio(), Audio(frame_table)]:
+            start = time.perf_counter()
+            for _ in range(iterations):
+                for value in range(0, 101):
+                    audio.build_frames_slider(AudioFeatureEnum.BASS, value)
+            results.append(time.perf_counter() - start)
+        frame_table.close()
+
+    print(f'  build table:   {build_seconds * 1000:8.3f} ms')
+    print(f'  open table:    {open_seconds * 1000:8.3f} ms (mmap and checksum)')
+    print(f'  builder:       {count / results[0]:12.0f} commands/sec')
+    print(f'  table lookup:  {count / results[1]:12.0f} commands/sec')
+
+
+def bench_daemon(iterations):
+    """
+    Compares the latency of a command executed by a new CLI process with a command executed by the g6d daemon, which
+    has been started in a background thread. Also measures the throughput of many concurrent clients.
+    :param iterations: how many commands are sent to the daemon
+    """
+    import asyncio
+    from g6_daemon import G6Daemon, request_stats, send_command
+    from g6_transport import SimulatedTransport
+
+    cli_args = ['--force', '--set-bass-value', '50']
+    socket_path = os.path.join(tempfile.mkdtemp(), 'g6d-bench.sock')
+    daemon = G6Daemon(socket_path, False, SimulatedTransport())
+    with contextlib.redirect_stdout(io.StringIO()):
+        daemon.start()
+    loop = asyncio.new_event_loop()
+    serve_task = loop.create_task(daemon.serve())
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        thread.start()
+        while not os.path.exists(socket_path):
+            time.sleep(0.001)
+
+    try:
+        cli_seconds = min(run_cli(cli_args) for _ in range(iterations))
+
+        latencies = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            send_command(socket_path, cli_args)
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+
+        clients = 8
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as executor:
+            responses = list(executor.map(lambda _: send_command(socket_path, cli_args), range(iterations)))
+        concurrent_seconds = time.perf_counter() - start
+        histograms = request_stats(socket_path)['histograms']
+    finally:
+        loop.call_soon_threadsafe(serve_task.cancel)
+        thread.join(timeout=1)
+        with contextlib.redirect_stdout(io.StringIO()):
+            daemon.stop()
+
+    print(f'  in-process CLI main() (without interpreter start): best {cli_seconds * 1000:.3f} ms')
+    print(f'  via daemon: best {latencies[0] * 1000:.3f} ms, median {latencies[len(latencies) // 2] * 1000:.3f} ms')
+    print(f'  {clients} concurrent clients: {iterations / concurrent_seconds:.0f} commands/sec, '
+          f'failed: {sum(1 for response in responses if not response["ok"])}')
+    for phase in ['write', 'first_ack', 'drain']:
+        histogram = histograms[phase]
+        print(f'  daemon histogram {phase + ":":10} {histogram["count"]:6} samples, p50 <= {histogram["p50_us"]} us, '
+              f'p99 <= {histogram["p99_us"]} us')
+
+
+def bench_quiet(iterations):
+    """
+    Compares the wall time of a CLI invocation, which prints every frame and acknowledgement, with '--quiet' (nothing is
+    formatted at all) and with '--quiet --trace' (the phases are recorded and written as JSON lines).
+    :param iterations: how often each variant is run
+    """
+    cli_args = ['--force', '--set-output', 'Headphones', '--set-surround', 'Enabled', '--set-bass-value', '50']
+    trace_file_path = os.path.join(os.environ['XDG_RUNTIME_DIR'], 'g6-bench-trace.jsonl')
+    for name, extra_args in [('verbose', []), ('--quiet', ['--quiet']),
+                             ('--quiet --trace', ['--quiet', '--trace', trace_file_path])]:
+        seconds = min(run_cli(cli_args + extra_args) for _ in range(iterations))
+        print(f'  {name + ":":17} best {seconds * 1000:.3f} ms')
+
+
+def bench_toggle(iterations):
+    """
+    Fires hundreds of concurrent output toggles against the simulated G6, half of them by the fast path (g6_fast.py) and
+    half of them by the full CLI, and checks, that the final device state matches the output of the simulated G6.
+    Without the lock of the device state, concurrent toggles would read the same state and send the same payload.
+    :param iterations: the number of concurrent toggles (at least 200)
+    :return: false, if the device state is inconsistent
+    """
+    import g6_cli
+    import g6_fast
+    from g6_state import DeviceState
+    from g6_transport import SIMULATED_G6
+
+    toggles = max(iterations, 200)
+    run_cli(['--force', '--set-output', 'Speakers'])
+    state_file_path = g6_cli.get_state_file_path(SIMULATED_G6.serial_number)
+
+    def toggle(index):
+        if index % 2 == 0 and g6_fast.main(['--toggle-output']):
+            return
+        g6_cli.main()
+
+    argv = sys.argv
+    sys.argv = ['g6_cli.py', '--toggle-output']
+    # let the reports take a while, so that the toggles really overlap
+    SIMULATED_G6.response_latency_seconds = 0.0002
+    try:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=16) as executor:
+            list(executor.map(toggle, range(toggles)))
+        seconds = time.perf_counter() - start
+    finally:
+        sys.argv = argv
+        SIMULATED_G6.response_latency_seconds = 0
+
+    expected_output = 'Speakers' if toggles % 2 == 0 else 'Headphones'
+    state_output = DeviceState.load(state_file_path).output
+    consistent = state_output == SIMULATED_G6.output == expected_output
+    print(f'  {toggles} concurrent toggles: {toggles / seconds:.0f} toggles/sec')
+    print(f'  expected output: {expected_output}, device state: {state_output}, simulated G6: {SIMULATED_G6.output}'
+          f' -> {"consistent" if consistent else "INCONSISTENT"}')
+    return consistent
+
+
+def bench_devices(iterations):
+    """
+    Applies the same command set to several simulated G6s with '--all-devices' and compares the total wall time with
+    the per-device times. Since the devices are driven concurrently, the wall time should be close to the slowest
+    device instead of the sum of all devices.
+    :param iterations: how often the command set is applied
+    """
+    import g6_cli
+    from g6_spec import Audio
+    from g6_transport import SIMULATED_G6S, SimulatedG6, SimulatedTransport
+
+    device_count = 4
+    cli_args = ['--all-devices', '--force', '--set-output', 'Headphones', '--set-bass', 'Enabled',
+                '--set-bass-value', '50']
+    attached_g6s = list(SIMULATED_G6S)
+    SIMULATED_G6S[1:] = [SimulatedG6(f'simulated{index}', f'SIMULATED{index + 1:04d}')
+                         for index in range(1, device_count)]
+    for simulated_g6 in SIMULATED_G6S:
+        simulated_g6.response_latency_seconds = 0.001
+    try:
+        args = g6_cli.parse_cli_args(cli_args)
+        audio = Audio()
+        runs = []
+        for _ in range(max(1, iterations // 10)):
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                results = g6_cli.execute_cli_args_on_all_devices(SimulatedTransport(), audio, args)
+            runs.append((time.perf_counter() - start, [seconds for _, _, _, seconds in results],
+                         sum(1 for _, _, error, _ in results if error is not None)))
+    finally:
+        for simulated_g6 in SIMULATED_G6S:
+            simulated_g6.response_latency_seconds = 0
+        SIMULATED_G6S[:] = attached_g6s
+
+    wall_seconds, device_seconds, failed = min(runs)
+    print(f'  {device_count} devices: wall time {wall_seconds * 1000:.3f} ms, slowest device '
+          f'{max(device_seconds) * 1000:.3f} ms, sum of all devices {sum(device_seconds) * 1000:.3f} ms, '
+          f'failed: {failed}')
+
+
+def bench_replay(iterations):
+    """
+    Replays the capture of the output switch to headphones (converted from its hex-line payload) to the simulated G6
+    with an in-flight window of 1 (every response is awaited before the next write) and of 8, and checks, that the
+    responses match the capture.
+    :param iterations: how often the capture is replayed per window
+    """
+    from g6_capture import Replayer, convert_hex_lines
+    from g6_transport import SIMULATED_G6, SimulatedTransport
+    from g6_util import read_payload_as_hex_lines
+
+    payload_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'payloads',
+                                'toggle-output-to-headphones.hex')
+    capture_frames = convert_hex_lines(read_payload_as_hex_lines(payload_path))
+    device = SimulatedTransport().device()
+    device.open_path(SIMULATED_G6.device_path)
+    SIMULATED_G6.response_latency_seconds = 0.0002
+    matching = True
+    try:
+        for window in [1, 8]:
+            runs = []
+            for _ in range(max(1, iterations // 10)):
+                start = time.perf_counter()
+                results = Replayer(device, window).replay(capture_frames)
+                runs.append(time.perf_counter() - start)
+                matching &= not any(result.is_timeout() or result.is_diverged() for result in results)
+            print(f'  window {window}: {len(capture_frames) / min(runs):.0f} frames/sec')
+    finally:
+        SIMULATED_G6.response_latency_seconds = 0
+        device.close()
+    print(f'  responses {"match" if matching else "DIVERGE FROM"} the capture')
+    return matching
+
+
+def bench_stream(iterations):
+    """
+    Streams slider updates and toggles through a pipe into '--stream' (see g6_stream.py) against the simulated G6
+    acknowledging every report after 1 ms: as fast as possible and paced like a rotary encoder at 500 updates/sec.
+    Measures the throughput, the number of bursts sent and the lag from reading a command until its burst has been
+    sent. Checks, that the simulated G6 and the device state end up at the last value of every setting.
+    :param iterations: the number of commands is 20 times (as fast as possible) or twice (paced) the iterations
+    """
+    import g6_cli
+    from g6_encoder import encode_value
+    from g6_session import G6Session
+    from g6_spec import Audio, AudioBatch, AudioFeatureEnum
+    from g6_state import DeviceState
+    from g6_stream import StreamExecutor
+    from g6_transport import SIMULATED_G6, SimulatedTransport
+
+    def write_lines(write_fd, lines, interval_seconds):
+        with os.fdopen(write_fd, 'w') as stream_file:
+            for line in lines:
+                stream_file.write(line)
+                stream_file.flush()
+                if interval_seconds:
+                    time.sleep(interval_seconds)
+
+    consistent = True
+    SIMULATED_G6.response_latency_seconds = 0.001
+    try:
+        for name, command_count, interval_seconds in [('as fast as possible', iterations * 20, 0),
+                                                      ('500 updates/sec', iterations * 2, 0.002)]:
+            # every tenth and the last command toggle the surround, so that even short streams end up with both
+            lines = [f'bass {index % 101}\n' if index % 10 and index < command_count
+                     else f'surround {"on" if index % 20 else "off"}\n' for index in range(1, command_count + 1)]
+            last_bass = [int(line.split()[1]) for line in lines if line.startswith('bass')][-1]
+            last_surround = [line.split()[1] == 'on' for line in lines if line.startswith('surround')][-1]
+
+            read_fd, write_fd = os.pipe()
+            with contextlib.redirect_stdout(io.StringIO()):
+                device_path = g6_cli.detect_device(SimulatedTransport())
+                with G6Session(device_path, False, transport=SimulatedTransport(), verbose=False) as session:
+                    executor = StreamExecutor(session, Audio())
+                    writer = threading.Thread(target=write_lines, args=(write_fd, lines, interval_seconds))
+                    start = time.perf_counter()
+                    writer.start()
+                    with os.fdopen(read_fd, 'r') as stream_file:
+                        executor.run([stream_file])
+                    seconds = time.perf_counter() - start
+                    writer.join()
+                    state = DeviceState.load(g6_cli.get_state_file_path(session.serial_number))
+
+            lags = sorted(executor.lags)
+            matching = SIMULATED_G6.registers.get(0x19) == encode_value(last_bass) \
+                and SIMULATED_G6.registers.get(0x00) == encode_value(100 if last_surround else 0) \
+                and state.get_audio_feature(AudioFeatureEnum.BASS, AudioBatch.SLOT_SLIDER) == last_bass \
+                and state.get_audio_feature(AudioFeatureEnum.SURROUND, AudioBatch.SLOT_TOGGLE) == last_surround
+            consistent &= matching
+            print(f'  {name}: {len(lines)} commands in {seconds * 1000:.3f} ms ({len(lines) / seconds:.0f} '
+                  f'commands/sec), {executor.burst_count} bursts, {executor.coalescer.coalesced_count} coalesced')
+            print(f'    lag until sent: median {lags[len(lags) // 2] * 1000:.3f} ms, max {lags[-1] * 1000:.3f} ms, '
+                  f'final state {"matches" if matching else "DOES NOT MATCH"} the last input')
+    finally:
+        SIMULATED_G6.response_latency_seconds = 0
+    return consistent
+
+
+def bench_watch(iterations):
+    """
+    Watches the simulated G6 by a DeviceWatcher (see g6_watch.py) in a background thread, while its output button is
+    pressed and the bass is changed by the CLI. Measures the latency from the button press until the event has been
+    decoded, checks that every change is reported and that the device state follows the button, and measures the CPU
+    time and the reads of the watcher while the G6 is idle. The values of the bass are decoded from the responses to the
+    COMMIT reports, which the simulated G6 answers with the current value (unverified on a real G6, see ReportDecoder).
+    :param iterations: how often the button is pressed and the bass is changed
+    """
+    import queue
+    import g6_cli
+    from g6_spec import Audio
+    from g6_state import DeviceState
+    from g6_transport import SIMULATED_G6, SimulatedTransport
+    from g6_watch import EVENT_OUTPUT_CHANGED, EVENT_VALUE_CHANGED, DeviceWatcher
+
+    idle_seconds = 1
+    with contextlib.redirect_stdout(io.StringIO()):
+        device_path = g6_cli.detect_device(SimulatedTransport())
+    events = queue.Queue()
+    watcher = DeviceWatcher(SimulatedTransport(), device_path, Audio(), decode_values=True)
+    thread = threading.Thread(target=watcher.watch, args=(lambda event: events.put((time.perf_counter(), event)),))
+    thread.start()
+    consistent = True
+    try:
+        # let the watcher open its handle before the first press
+        while not SIMULATED_G6.handles:
+            time.sleep(0.001)
+        latencies = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            output = SIMULATED_G6.press_output_button()
+            received, event = events.get(timeout=1)
+            latencies.append(received - start)
+            consistent &= event.kind == EVENT_OUTPUT_CHANGED and event.value == output
+        state = DeviceState.load(g6_cli.get_state_file_path(SIMULATED_G6.serial_number))
+        consistent &= state.output == SIMULATED_G6.output
+
+        values = [index % 101 for index in range(1, iterations + 1)]
+        for value in values:
+            run_cli(['--force', '--set-bass-value', str(value)])
+        reported = []
+        with contextlib.suppress(queue.Empty):
+            while len(reported) < len(values):
+                _, event = events.get(timeout=1)
+                if event.kind == EVENT_VALUE_CHANGED:
+                    reported.append(event.value)
+        consistent &= reported == values
+
+        reads = SIMULATED_G6.stats['read']
+        cpu_start = time.process_time()
+        time.sleep(idle_seconds)
+        idle_cpu_seconds = time.process_time() - cpu_start
+        idle_reads = SIMULATED_G6.stats['read'] - reads
+    finally:
+        watcher.stop()
+        thread.join()
+
+    latencies.sort()
+    following = state.output == SIMULATED_G6.output
+    print(f'  output button: {iterations} presses, event latency median {latencies[len(latencies) // 2] * 1e6:.1f} us, '
+          f'max {latencies[-1] * 1e6:.1f} us, device state {"follows" if following else "DOES NOT FOLLOW"} the button')
+    print(f'  CLI changes: {len(values)} bass values set, {len(reported)} value_changed events')
+    print(f'  idle for {idle_seconds} s: {idle_cpu_seconds * 1000:.3f} ms CPU time of the process, {idle_reads} reads '
+          f'of the watcher')
+    print(f'  every change reported: {"yes" if consistent else "NO"}')
+    return consistent
+
+
+def find_hardware_transport():
+    """
+    :return: the name of the first transport, which reaches a connected G6, or None
+    """
+    import g6_cli
+    from g6_transport import TRANSPORT_HIDAPI, TRANSPORT_HIDRAW, get_transport
+
+    for name in [TRANSPORT_HIDAPI, TRANSPORT_HIDRAW]:
+        try:
+            g6_cli.enumerate_devices(get_transport(name))
+            return name
+        except (ImportError, IOError):
+            continue
+    return None
+
+
+def build_command_matrix(audio):
+    """
+    Builds every command of the CLI, which sets a single setting: each audio feature with its toggle values, the
+    slider values of MATRIX_SLIDER_VALUES and its special values, as well as both outputs.
+    :param audio: the Audio to build the frames with
+    :return: the list of tuples (name, CLI arguments, function building the frames)
+    """
+    import g6_cli
+    from g6_spec import AudioFeatureEnum, AudioFeatureSpecialValueEnum
+
+    matrix = []
+    for output in [g6_cli.OUTPUT_SPEAKERS, g6_cli.OUTPUT_HEADPHONES]:
+        matrix.append((f'output {output}', ['--set-output', output],
+                       lambda output=output: g6_cli.read_output_payload_as_frames(output, audio.frame_table)))
+    for audio_feature_enum in AudioFeatureEnum:
+        option = '--set-' + audio_feature_enum.name.lower().replace('_', '-')
+        for enabled in [True, False]:
+            value_name = 'Enabled' if enabled else 'Disabled'
+            matrix.append((f'{audio_feature_enum.name} toggle {value_name}', [option, value_name],
+                           lambda feature=audio_feature_enum, enabled=enabled:
+                           audio.build_frames_toggle(feature, enabled)))
+        for value in MATRIX_SLIDER_VALUES:
+            matrix.append((f'{audio_feature_enum.name} slider {value}', [option + '-value', str(value)],
+                           lambda feature=audio_feature_enum, value=value: audio.build_frames_slider(feature, value)))
+    for special_value_enum, value_name in [(AudioFeatureSpecialValueEnum.SMART_VOLUME_NIGHT, 'Night'),
+                                           (AudioFeatureSpecialValueEnum.SMART_VOLUME_LOUD, 'Loud')]:
+        matrix.append((f'SMART_VOLUME special {value_name}', ['--set-smart-volume-special-value', value_name],
+                       lambda special_value_enum=special_value_enum:
+                       audio.build_frames_slider_special(AudioFeatureEnum.SMART_VOLUME, special_value_enum)))
+    return matrix
+
+
+def bench_matrix(iterations):
+    """
+    Sweeps the full command matrix (see build_command_matrix()) and measures per command: the cost of building its
+    frames, the wall time of the CLI invocation (in-process, with '--force', so that no command is skipped by the
+    device state) and the round trip of its frames through an opened session (from the first write until the last
+    acknowledgement). Uses the simulated G6, or a connected G6 with '--hardware'. The results are recorded for '--json'.
+    :param iterations: how often the frames of every command are built. The CLI and the device are measured a tenth as
+                       often.
+    """
+    import g6_cli
+    from g6_session import G6Session
+    from g6_spec import Audio
+    from g6_table import FrameTable
+    from g6_transport import TRANSPORT_SIMULATED, get_transport
+
+    transport_name = TRANSPORT_SIMULATED
+    if USE_HARDWARE:
+        transport_name = find_hardware_transport()
+        if transport_name is None:
+            print('  no G6 connected')
+            return False
+    transport = get_transport(transport_name)
+    # the frame table stays mapped like in the CLI, since the built frames are views into it
+    audio = Audio(FrameTable.open())
+    matrix = build_command_matrix(audio)
+    device_iterations = max(1, iterations // 10)
+    with contextlib.redirect_stdout(io.StringIO()):
+        device_path = g6_cli.enumerate_device(transport)
+
+    print(f'  {len(matrix)} commands on the {transport_name} transport, frame table: '
+          f'{"yes" if audio.frame_table is not None else "no"}')
+    print(f'  {"command":32} {"frames":>6} {"build us":>10} {"cli ms":>10} {"round trip ms":>14}')
+    acknowledged = True
+    with G6Session(device_path, False, transport=transport, verbose=False) as session:
+        for name, cli_args, build_frames in matrix:
+            start = time.perf_counter()
+            for _ in range(iterations):
+                frames = build_frames()
+            build_seconds = (time.perf_counter() - start) / iterations
+            cli_seconds = min(run_cli(cli_args + ['--force', '--transport', transport_name])
+                              for _ in range(device_iterations))
+            round_trips = []
+            for _ in range(device_iterations):
+                start = time.perf_counter()
+                acknowledgements = session.send(frames, pipelined=True)
+                round_trips.append(time.perf_counter() - start)
+                acknowledged &= all(acknowledgement.is_acknowledged() for acknowledgement in acknowledgements)
+            round_trip_seconds = sorted(round_trips)[len(round_trips) // 2]
+            print(f'  {name:32} {len(frames):6} {build_seconds * 1e6:10.3f} {cli_seconds * 1000:10.3f} '
+                  f'{round_trip_seconds * 1000:14.3f}')
+            record_result('matrix', name, {'build_us': build_seconds * 1e6, 'cli_ms': cli_seconds * 1000,
+                                           'round_trip_ms': round_trip_seconds * 1000})
+    print(f'  all frames acknowledged: {"yes" if acknowledged else "NO"}')
+    return acknowledged
+
+
+def bench_ramp(iterations):
+    """
+    Runs a ramp of the Bass slider from 0 to 100 over 500 ms against simulated G6s with different response latencies,
+    and evaluates the recorded write timestamps: the number of steps and commits, the step interval and the overrun of
+    the ramp's duration.
+    :param iterations: how often each ramp is run, the best run is reported
+    """
+    from g6_ramp import Ramp, RampScheduler
+    from g6_session import G6Session
+    from g6_spec import Audio, AudioFeatureEnum
+    from g6_transport import SIMULATED_G6, SimulatedTransport
+
+    audio = Audio()
+    duration_seconds = 0.5
+    for response_latency_ms in [0, 5, 30]:
+        SIMULATED_G6.response_latency_seconds = response_latency_ms / 1000
+        runs = []
+        for _ in range(max(1, iterations // 20)):
+            SIMULATED_G6.reset_stats()
+            with contextlib.redirect_stdout(io.StringIO()):
+                with G6Session(SIMULATED_G6.device_path, False, transport=SimulatedTransport()) as session:
+                    scheduler = RampScheduler(session, audio)
+                    start = time.monotonic()
+                    scheduler.run([Ramp(AudioFeatureEnum.BASS, 0, 100)], duration_seconds)
+                    elapsed = time.monotonic() - start
+            # the reports of a step are written at once, from the first to the last step
+            timestamps = SIMULATED_G6.write_timestamps
+            mean_interval = (timestamps[-1] - timestamps[0]) / max(scheduler.steps - 1, 1)
+            runs.append((elapsed - duration_seconds, scheduler.steps, scheduler.commits, mean_interval))
+        overrun, steps, commits, mean_interval = min(runs)
+        print(f'  ack latency {response_latency_ms:3d} ms: {steps:3d} steps, {commits:2d} commits, mean step interval '
+              f'{mean_interval * 1000:7.3f} ms, overrun of the 500 ms ramp: {overrun * 1000:.3f} ms')
+    SIMULATED_G6.response_latency_seconds = 0
+
+
+def bench_transport(iterations):
+    """
+    Compares the hidapi and the hidraw transport on the real G6: the startup time (import of the transport and
+    enumeration of the G6, measured in a new process) and the per-frame latency (a read request and its
+    acknowledgement). A transport, which is not available on this system, is skipped.
+    :param iterations: how often each measurement is repeated
+    """
+    import subprocess
+    from g6_cli import G6_INTERFACE, G6_PRODUCT_ID, G6_VENDOR_ID
+    from g6_session import G6Session
+    from g6_spec import Audio, AudioFeatureEnum
+    from g6_transport import TRANSPORT_HIDAPI, TRANSPORT_HIDRAW, get_transport
+
+    startup_script = ('import time; start = time.perf_counter(); import g6_transport; '
+                      'g6_transport.get_transport({name!r}).enumerate({vendor_id}, {product_id}); '
+                      'print(time.perf_counter() - start)')
+    _, _, read_frame = Audio().build_frames_read(AudioFeatureEnum.BASS)[1]
+    for name in [TRANSPORT_HIDAPI, TRANSPORT_HIDRAW]:
+        script = startup_script.format(name=name, vendor_id=G6_VENDOR_ID, product_id=G6_PRODUCT_ID)
+        startup_seconds = []
+        for _ in range(max(1, iterations // 10)):
+            result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__)))
+            if result.returncode != 0:
+                break
+            startup_seconds.append(float(result.stdout))
+        if not startup_seconds:
+            print(f'  {name}: not available ({result.stderr.strip().splitlines()[-1]})')
+            continue
+        print(f'  {name}: startup (import + enumerate) best {min(startup_seconds) * 1000:.3f} ms')
+
+        transport = get_transport(name)
+        device_paths = [device_dict['path'] for device_dict in transport.enumerate(G6_VENDOR_ID, G6_PRODUCT_ID)
+                        if device_dict['interface_number'] == G6_INTERFACE]
+        if not device_paths:
+            print(f'  {name}: no G6 connected, the per-frame latency is not measured')
+            continue
+        latencies = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            with G6Session(device_paths[0], False, transport=transport) as session:
+                for _ in range(iterations):
+                    latencies += [ack.latency_seconds for ack in session.send([read_frame]) if ack.is_acknowledged()]
+        latencies.sort()
+        if latencies:
+            print(f'  {name}: per-frame latency best {latencies[0] * 1000:.3f} ms, '
+                  f'median {latencies[len(latencies) // 2] * 1000:.3f} ms')
+        else:
+            print(f'  {name}: no acknowledgements received')
+
+
+def measure_import_time(cli_args):
+    """
+    Runs the CLI in a new process with 'python -X importtime' and sums up the import times of the modules, which are
+    imported by the CLI (i.e. after the interpreter startup, which ends with the import of 'site').
+    :param cli_args: the list of CLI arguments, without the program name
+    :return: a tuple of (import time in seconds, wall time of the process in seconds)
+    """
+    import subprocess
+    cli_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'g6_cli.py')
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', cli_path] + cli_args, capture_output=True, text=True)
+    wall_seconds = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f'The CLI failed with the arguments {cli_args}: {result.stderr}')
+    import_microseconds = 0
+    after_site = False
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # only count the top level imports, since their cumulative time includes the nested ones
+        if after_site and not name.startswith('  '):
+            import_microseconds += int(cumulative)
+        after_site = after_site or name.strip() == 'site'
+    return import_microseconds / 1000000, wall_seconds
+
+
+def bench_startup(iterations):
+    """
+    Compares the startup of the fast path ('--toggle-output', see g6_fast.py) with the full CLI (the same command with
+    '--force', which is not served by the fast path) in new processes against the simulated G6.
+    Fails, if the imports of the fast path exceed the FAST_PATH_IMPORT_BUDGET_MS.
+    :param iterations: how often each process is started, the best run is reported
+    :return: false, if the budget has been exceeded
+    """
+    import compileall
+    # let the modules be imported from their bytecode, even if PYTHONDONTWRITEBYTECODE is set
+    compileall.compile_dir(os.path.dirname(os.path.abspath(__file__)), maxlevels=0, quiet=1)
+    # the fast path relies on the device cache and the device state, which are written by the full CLI
+    run_cli(['--force', '--set-output', 'Speakers'])
+
+    results = {}
+    for name, cli_args in [('fast path', ['--toggle-output']), ('full CLI', ['--force', '--toggle-output'])]:
+        runs = [measure_import_time(cli_args) for _ in range(max(1, iterations // 10))]
+        import_seconds = min(import_seconds for import_seconds, _ in runs)
+        wall_seconds = min(wall_seconds for _, wall_seconds in runs)
+        results[name] = import_seconds
+        print(f'  {name + ":":10} imports best {import_seconds * 1000:7.3f} ms, '
+              f'process wall time best {wall_seconds * 1000:7.3f} ms')
+    within_budget = results['fast path'] * 1000 <= FAST_PATH_IMPORT_BUDGET_MS
+    print(f'  fast path import budget of {FAST_PATH_IMPORT_BUDGET_MS} ms: {"ok" if within_budget else "EXCEEDED"}')
+    return within_budget
+
+
+BENCHMARKS = {
+    'session': bench_session,
+    'frames': bench_frames,
+    'bulk': bench_bulk,
+    'table': bench_table,
+    'daemon': bench_daemon,
+    'quiet': bench_quiet,
+    'toggle': bench_toggle,
+    'devices': bench_devices,
+    'replay': bench_replay,
+    'stream': bench_stream,
+    'watch': bench_watch,
+    'matrix': bench_matrix,
+    'ramp': bench_ramp,
+    'transport': bench_transport,
+    'startup': bench_startup,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SoundBlaster X G6 CLI benchmarks (using the simulated G6)')
+    parser.add_argument('benchmark', type=str, choices=list(BENCHMARKS.keys()) + ['all'],
+                        help='The benchmark to run')
+    parser.add_argument('--iterations', required=False, type=int, default=100,
+                        help='How often every measurement is repeated')
+    parser.add_argument('--hardware', required=False, action='store_true',
+                        help='Measures the command matrix on a connected G6 instead of the simulated G6. '
+                             'Sets all of its audio features and its output!')
+    parser.add_argument('--json', required=False, type=str, metavar='FILE',
+                        help='Writes the recorded results as JSON file, e.g. to compare them with another commit.')
+    parser.add_argument('--compare', required=False, type=str, metavar='FILE',
+                        help='Compares the recorded results with the JSON results of a former run.')
+    args = parser.parse_args()
+
+    global USE_HARDWARE
+    USE_HARDWARE = args.hardware
+    install_simulated_transport()
+    names = list(BENCHMARKS.keys()) if args.benchmark == 'all' else [args.benchmark]
+    failed = []
+    for name in names:
+        print(f'# {name}')
+        if BENCHMARKS[name](args.iterations) is False:
+            failed.append(name)
+    if args.json is not None:
+        write_results(args.json, args.iterations, 'hardware' if args.hardware else 'simulated')
+        print(f'Results written: {args.json}')
+    if args.compare is not None:
+        compare_results(args.compare)
+    if failed:
+        sys.exit(f'The benchmarks failed: {failed}')
+
+
+if __name__ == "__main__":
+    main()
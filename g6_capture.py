@@ -0,0 +1,309 @@
+import argparse
+import os
+import struct
+import time
+
+from g6_spec import Frame
+from g6_transport import TRANSPORT_NAMES, get_transport
+from g6_util import read_payload_as_hex_lines, write_file_atomically
+
+# The extension of a capture file
+CAPTURE_EXTENSION = '.g6cap'
+# The header of a capture: magic, version, number of frames
+CAPTURE_MAGIC = b'G6CP'
+CAPTURE_VERSION = 1
+CAPTURE_HEADER_FORMAT = '>4sHI'
+# The header of a captured frame: the delay after the previous frame in microseconds and the length of the expected
+# response, which follows the 64 byte payload. The response of the G6 has to start with the expected response, an
+# empty expected response accepts any response.
+CAPTURE_FRAME_HEADER_FORMAT = '>IB'
+# The number of leading payload bytes, which the G6 echoes in its acknowledgement (see g6_spec.Frame.is_response_to())
+ACKNOWLEDGED_HEADER_LENGTH = 6
+# The number of frames, which are written before their responses are awaited by default
+REPLAY_WINDOW = 8
+# How long to wait for the response of the oldest frame in flight
+REPLAY_RESPONSE_TIMEOUT_MS = 100
+
+
+class CaptureFrame:
+    """
+    A single report of a capture: its payload, the delay after the previous report, as it has been captured, and the
+    expected response of the G6.
+    """
+
+    def __init__(self, payload, delay_seconds=0.0, expected_response=b''):
+        """
+        :param payload: the 64 byte payload without the report_id
+        :param delay_seconds: the delay after the previous report
+        :param expected_response: the bytes, the response of the G6 has to start with (up to 64 bytes)
+        """
+        if len(payload) != Frame.PAYLOAD_LENGTH:
+            raise ValueError(f'Argument \'payload\' should consist of {Frame.PAYLOAD_LENGTH} bytes, '
+                             f'but was {len(payload)} bytes long!')
+        if len(expected_response) > Frame.PAYLOAD_LENGTH:
+            raise ValueError(f'Argument \'expected_response\' should consist of {Frame.PAYLOAD_LENGTH} bytes at most, '
+                             f'but was {len(expected_response)} bytes long!')
+        self.frame = Frame.from_payload(payload)
+        self.delay_seconds = delay_seconds
+        self.expected_response = bytes(expected_response)
+
+    def payload(self):
+        return bytes(self.frame.payload())
+
+    def to_bytes(self):
+        header = struct.pack(CAPTURE_FRAME_HEADER_FORMAT, min(round(self.delay_seconds * 1e6), 0xffffffff),
+                             len(self.expected_response))
+        return header + self.payload() + self.expected_response
+
+
+def write_capture(capture_file_path, capture_frames):
+    """
+    Write the frames as binary capture file.
+    :param capture_file_path: the path to write the capture to
+    :param capture_frames: the list of CaptureFrames
+    """
+    header = struct.pack(CAPTURE_HEADER_FORMAT, CAPTURE_MAGIC, CAPTURE_VERSION, len(capture_frames))
+    write_file_atomically(capture_file_path, header + b''.join(frame.to_bytes() for frame in capture_frames))
+
+
+def read_capture(capture_file_path):
+    """
+    Read a binary capture file.
+    Raises a ValueError, if the file has an unexpected format or version.
+    :param capture_file_path: the path to the capture file
+    :return: the list of CaptureFrames
+    """
+    with open(capture_file_path, 'rb') as file:
+        data = file.read()
+    try:
+        magic, version, frame_count = struct.unpack_from(CAPTURE_HEADER_FORMAT, data, 0)
+        if magic != CAPTURE_MAGIC or version != CAPTURE_VERSION:
+            raise ValueError(f'The file {capture_file_path} is no capture of version {CAPTURE_VERSION}!')
+        offset = struct.calcsize(CAPTURE_HEADER_FORMAT)
+        capture_frames = []
+        for _ in range(frame_count):
+            delay_us, expected_length = struct.unpack_from(CAPTURE_FRAME_HEADER_FORMAT, data, offset)
+            offset += struct.calcsize(CAPTURE_FRAME_HEADER_FORMAT)
+            payload = data[offset:offset + Frame.PAYLOAD_LENGTH]
+            offset += Frame.PAYLOAD_LENGTH
+            expected_response = data[offset:offset + expected_length]
+            offset += expected_length
+            capture_frames.append(CaptureFrame(payload, delay_us / 1e6, expected_response))
+    except struct.error as ex:
+        raise ValueError(f'The capture {capture_file_path} is truncated!') from ex
+    if offset != len(data):
+        raise ValueError(f'The capture {capture_file_path} has {len(data) - offset} unexpected trailing bytes!')
+    return capture_frames
+
+
+def convert_hex_lines(hex_lines, delay_seconds=0.0):
+    """
+    Convert the hex-lines of a payload file into capture frames. The hex-lines carry no timing, so every frame gets the
+    same delay. The G6 is expected to acknowledge every report by echoing its header.
+    :param hex_lines: the list of 64 byte payloads as hex-lines
+    :param delay_seconds: the delay after every previous report
+    :return: the list of CaptureFrames
+    """
+    capture_frames = []
+    for hex_line in hex_lines:
+        payload = bytes(Frame.from_hex_line(hex_line).payload())
+        capture_frames.append(CaptureFrame(payload, delay_seconds, payload[:ACKNOWLEDGED_HEADER_LENGTH]))
+    return capture_frames
+
+
+class ReplayResult:
+    """
+    The outcome of a single replayed frame: the response of the G6 (or None on timeout) and its latency.
+    """
+
+    def __init__(self, index, capture_frame, response, sent, received):
+        self.index = index
+        self.capture_frame = capture_frame
+        self.response = response
+        self.sent = sent
+        self.received = received
+
+    def latency_seconds(self):
+        return self.received - self.sent
+
+    def is_timeout(self):
+        return self.response is None
+
+    def is_diverged(self):
+        """
+        :return: true, if the G6 responded different than expected by the capture
+        """
+        return self.response is not None and not self.response.startswith(self.capture_frame.expected_response)
+
+    def describe_divergence(self):
+        """
+        :return: a description of the first byte, the response diverged from the capture at
+        """
+        expected = self.capture_frame.expected_response
+        offset = next(i for i in range(len(expected)) if i >= len(self.response) or self.response[i] != expected[i])
+        return (f'frame {self.index}: response diverged at byte {offset}: expected '
+                f'{expected[offset:offset + 8].hex()}, but was {self.response[offset:offset + 8].hex()} '
+                f'(request {self.capture_frame.payload()[:ACKNOWLEDGED_HEADER_LENGTH].hex()})')
+
+
+class Replayer:
+    """
+    Replays a capture to an opened device as fast as possible: up to 'window' frames are written, before the response of
+    the oldest frame in flight is awaited. The responses are checked, while the next frames are already on their way,
+    instead of draining the response of every frame before writing the next one.
+
+    The responses are matched to the frames in flight by their echoed header (see g6_spec.Frame.is_response_to()), so
+    that a lost response only times out its own frame instead of shifting every later response to the wrong frame. A
+    response, which echoes none of the frames in flight, is attributed to the oldest one, since the G6 works through the
+    reports one after another. A frame, whose response does not arrive within the response timeout, is reported as
+    timed out.
+    """
+
+    def __init__(self, device, window=REPLAY_WINDOW, response_timeout_ms=REPLAY_RESPONSE_TIMEOUT_MS,
+                 honor_timing=False):
+        """
+        :param device: the opened device handle of a Transport (see g6_transport.py)
+        :param window: the maximum number of frames in flight. 1 waits for every response before the next write.
+        :param response_timeout_ms: how long to wait for the response of the oldest frame in flight
+        :param honor_timing: whether to keep the captured delays between the frames
+        """
+        if window < 1:
+            raise ValueError(f'Argument \'window\' should be at least \'1\', but was \'{window}\'!')
+        self.device = device
+        self.window = window
+        self.response_timeout_ms = response_timeout_ms
+        self.honor_timing = honor_timing
+
+    def replay(self, capture_frames):
+        """
+        :param capture_frames: the list of CaptureFrames to replay
+        :return: the list of ReplayResults in the order of the frames
+        """
+        results = []
+        in_flight = []
+        next_index = 0
+        last_sent = None
+        while next_index < len(capture_frames) or in_flight:
+            # fill the window
+            while next_index < len(capture_frames) and len(in_flight) < self.window:
+                capture_frame = capture_frames[next_index]
+                if self.honor_timing and last_sent is not None:
+                    remaining = last_sent + capture_frame.delay_seconds - time.perf_counter()
+                    if remaining > 0:
+                        time.sleep(remaining)
+                self.device.write(capture_frame.frame.buffer)
+                last_sent = time.perf_counter()
+                in_flight.append((next_index, capture_frame, last_sent))
+                next_index += 1
+            # await the next response until the timeout of the oldest frame in flight
+            index, capture_frame, sent = in_flight[0]
+            remaining_ms = int((sent + self.response_timeout_ms / 1000 - time.perf_counter()) * 1000)
+            data = self.device.read(Frame.PAYLOAD_LENGTH, remaining_ms) if remaining_ms > 0 else None
+            received = time.perf_counter()
+            if not data:
+                in_flight.pop(0)
+                results.append(ReplayResult(index, capture_frame, None, sent, received))
+                continue
+            response_frame = Frame.from_payload(data)
+            matched = next((position for position, (_, in_flight_frame, _) in enumerate(in_flight)
+                            if response_frame.is_response_to(in_flight_frame.frame)), 0)
+            index, capture_frame, sent = in_flight.pop(matched)
+            results.append(ReplayResult(index, capture_frame, bytes(data), sent, received))
+        results.sort(key=lambda result: result.index)
+        return results
+
+
+def record_capture(results):
+    """
+    Turn the results of a replay into a capture, which expects exactly the responses and keeps the timing of the
+    replay, e.g. to detect regressions of the device against a known good replay.
+    :param results: the list of ReplayResults
+    :return: the list of CaptureFrames
+    """
+    capture_frames = []
+    last_sent = None
+    for result in results:
+        delay_seconds = 0.0 if last_sent is None else result.sent - last_sent
+        last_sent = result.sent
+        capture_frames.append(CaptureFrame(result.capture_frame.payload(), delay_seconds, result.response or b''))
+    return capture_frames
+
+
+def print_replay_report(results, seconds):
+    """
+    Print the throughput of a replay and every divergence from the capture.
+    :param results: the list of ReplayResults
+    :param seconds: the wall time of the replay
+    """
+    timeouts = [result for result in results if result.is_timeout()]
+    divergences = [result for result in results if result.is_diverged()]
+    latencies = sorted(result.latency_seconds() for result in results if not result.is_timeout())
+    print(f'Replayed {len(results)} frames in {seconds * 1000:.3f} ms: {len(results) / seconds:.0f} frames/sec')
+    if latencies:
+        print(f'Response latency: median {latencies[len(latencies) // 2] * 1000:.3f} ms, '
+              f'max {latencies[-1] * 1000:.3f} ms')
+    print(f'Matching the capture: {len(results) - len(timeouts) - len(divergences)}, diverged: {len(divergences)}, '
+          f'timed out: {len(timeouts)}')
+    for result in divergences:
+        print(f'  {result.describe_divergence()}')
+    for result in timeouts:
+        print(f'  frame {result.index}: no response within the timeout '
+              f'(request {result.capture_frame.payload()[:ACKNOWLEDGED_HEADER_LENGTH].hex()})')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SoundBlaster X G6 payload captures: convert, show and replay')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    convert_parser = subparsers.add_parser('convert', help='Converts a hex-line payload file into a capture')
+    convert_parser.add_argument('hex_file', type=str, help='The hex-line payload file, e.g. payloads/*.hex')
+    convert_parser.add_argument('capture_file', type=str, nargs='?',
+                                help=f'The capture file to write. Default: the hex_file with extension '
+                                     f'\'{CAPTURE_EXTENSION}\'')
+    convert_parser.add_argument('--delay-ms', type=float, default=0.0,
+                                help='The delay between the frames, since the hex-lines carry no timing. Default: 0')
+    show_parser = subparsers.add_parser('show', help='Prints the frames of a capture')
+    show_parser.add_argument('capture_file', type=str)
+    replay_parser = subparsers.add_parser('replay', help='Replays a capture to the G6 and reports the divergences')
+    replay_parser.add_argument('capture_file', type=str)
+    replay_parser.add_argument('--window', type=int, default=REPLAY_WINDOW,
+                               help=f'The maximum number of frames in flight. Default: {REPLAY_WINDOW}')
+    replay_parser.add_argument('--honor-timing', action='store_true',
+                               help='Keeps the captured delays between the frames, instead of replaying them as fast '
+                                    'as possible.')
+    replay_parser.add_argument('--record', type=str, metavar='CAPTURE_FILE',
+                               help='Writes the responses and the timing of the replay as new capture.')
+    replay_parser.add_argument('--transport', type=str, default=None, choices=TRANSPORT_NAMES,
+                               help='The way to reach the G6: \'hidapi\' (default), \'hidraw\' or \'simulated\'.')
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        capture_file_path = args.capture_file or os.path.splitext(args.hex_file)[0] + CAPTURE_EXTENSION
+        capture_frames = convert_hex_lines(read_payload_as_hex_lines(args.hex_file), args.delay_ms / 1000)
+        write_capture(capture_file_path, capture_frames)
+        print(f'Converted {len(capture_frames)} frames: {capture_file_path}')
+    elif args.command == 'show':
+        for index, capture_frame in enumerate(read_capture(args.capture_file)):
+            print(f'{index:4} +{capture_frame.delay_seconds * 1000:9.3f} ms  {capture_frame.payload().hex()}  '
+                  f'expect: {capture_frame.expected_response.hex() or "any"}')
+    elif args.command == 'replay':
+        # the device detection of the CLI is only required for replays
+        from g6_cli import DEFAULT_TRANSPORT, detect_device
+
+        capture_frames = read_capture(args.capture_file)
+        transport = get_transport(args.transport or DEFAULT_TRANSPORT)
+        device = transport.device()
+        device.open_path(detect_device(transport))
+        try:
+            start = time.perf_counter()
+            results = Replayer(device, args.window, honor_timing=args.honor_timing).replay(capture_frames)
+            seconds = time.perf_counter() - start
+        finally:
+            device.close()
+        print_replay_report(results, seconds)
+        if args.record is not None:
+            write_capture(args.record, record_capture(results))
+            print(f'Recorded the replay: {args.record}')
+
+
+if __name__ == "__main__":
+    main()
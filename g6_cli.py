@@ -1,11 +1,32 @@
-import argparse
 import os.path
-import re
+import sys
+
+import g6_fast
+
+# serve the hot commands (e.g. '--toggle-output') by a minimal code path, before the rest of the CLI gets imported
+if __name__ == "__main__" and g6_fast.main(sys.argv[1:]):
+    sys.exit(0)
+
+import argparse
+import contextlib
+import json
 import tempfile
-import hid
+import time
 
-from g6_spec import Audio, AudioFeatureEnum, AudioFeatureSpecialValueEnum
-from g6_util import read_payload_as_hex_lines
+from g6_encoder import VALUE_MAX, VALUE_MIN, decode_value, encode_value, verify_payload_number_values
+from g6_fast import DEVICE_CACHE_FILE_NAME, LAST_PROFILE_FILE_NAME_FORMAT, LOCK_FILE_EXTENSION, OUTPUT_HEADPHONES, \
+    OUTPUT_SPEAKERS, PAYLOAD_DIR_PATH, STATE_FILE_NAME_FORMAT, TOGGLE_STATE_FILE_NAME_FORMAT, get_device_key, \
+    get_output_payload_path
+from g6_profile import AUDIO_FEATURE_NAMES, ENTRY_KIND_OUTPUT, build_profile_frames, diff_profile, load_profile, \
+    read_profile_frames, write_profile_frames
+from g6_ramp import Ramp, RampScheduler
+from g6_session import G6Session
+from g6_spec import Audio, AudioBatch, Frame, AudioFeatureEnum, AudioFeatureSpecialValueEnum
+from g6_state import DeviceState
+from g6_table import FrameTable
+from g6_trace import Tracer, TracingTransport
+from g6_transport import TRANSPORT_HIDRAW, TRANSPORT_NAMES, get_transport
+from g6_util import FileLock, read_payload_as_hex_lines, write_text_file_atomically
 
 # G6 specific USB information
 G6_VENDOR_ID = 0x041e
@@ -13,31 +34,79 @@ G6_PRODUCT_ID = 0x3256
 # The G6 has four interface (2 Audio and 2 HDI), the endpoint of the fourth interface is used by SoundBlaster Connect.
 # So will we, since data sent to the third interface is ignored by the device.
 G6_INTERFACE = 4
-# The name of the temporary file to remember the last toggle state in. If the file could not be found. The program
-# lets the G6 to toggle to Speakers by default.
-TOGGLE_STATE_TEMP_FILE_NAME = 'g6-cli-toggle-state'
-TOGGLE_STATE_SPEAKERS = 'Speakers'
-TOGGLE_STATE_HEADPHONES = 'Headphones'
-# The payloads available to send to the G6
-PAYLOAD_DIR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'payloads')
-PAYLOAD_TOGGLE_TO_HEADPHONES_PATH = os.path.join(PAYLOAD_DIR_PATH, 'toggle-output-to-headphones.hex')
-PAYLOAD_TOGGLE_TO_SPEAKERS_PATH = os.path.join(PAYLOAD_DIR_PATH, 'toggle-output-to-speakers.hex')
+# The toggle states. The last toggle state is remembered per device in a runtime file (see
+# get_toggle_state_file_path()). If the file could not be found. The program lets the G6 to toggle to Speakers.
+TOGGLE_STATE_SPEAKERS = OUTPUT_SPEAKERS
+TOGGLE_STATE_HEADPHONES = OUTPUT_HEADPHONES
+# The payloads available to send to the G6 (the output payloads are shared with the fast path in g6_fast.py)
 PAYLOAD_NUMBER_VALUES_PATH = os.path.join(PAYLOAD_DIR_PATH, '0-100.hex')
-PAYLOAD_HEX_LINE_PATTERN = r'^[a-f0-9]{128}$'
+# The profiles available to apply to the G6 (see g6_profile.py)
+PROFILE_DIR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles')
+# The directory for runtime files (e.g. the unix socket of the g6d daemon and the device cache)
+RUNTIME_DIR_PATH = os.environ.get('XDG_RUNTIME_DIR', tempfile.gettempdir())
+# The unix socket of the g6d daemon
+DAEMON_SOCKET_PATH = os.path.join(RUNTIME_DIR_PATH, 'g6d.sock')
+# The CLI arguments, which do not result in any communication with the device
+NON_DEVICE_ARGUMENTS = ['dry_run', 'force', 'verify_payloads', 'show_state', 'no_device_cache', 'via_daemon',
+                        'daemon_socket', 'over', 'transport', 'device', 'all_devices', 'trace', 'quiet',
+                        'minimal_output_payload']
+# The transport to reach the G6 with, if not given by '--transport' (see g6_transport.py)
+DEFAULT_TRANSPORT = os.environ.get('G6_TRANSPORT', 'hidapi')
 # The udev rule to create in /etc/udev/rules.d/50-soundblaster-x-g6.rules
 UDEV_RULE = r'SUBSYSTEM=="usb", ATTRS{idVendor}=="041e", ATTRS{idProduct}=="3256", TAG+="uaccess"'
+# The additional udev rule, which is required to access the G6's hidraw node with '--transport hidraw'
+UDEV_RULE_HIDRAW = r'KERNEL=="hidraw*", ATTRS{idVendor}=="041e", ATTRS{idProduct}=="3256", TAG+="uaccess"'
+
+
+def parse_slider_value(value):
+    """
+    Parse the value of a slider argument, e.g. '--set-bass-value 42.5'. Used as argparse type.
+    :param value: the value as given on the command line
+    :return: the value as int, if it is a whole number, otherwise as float
+    """
+    try:
+        number = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid number: \'{value}\'')
+    if not VALUE_MIN <= number <= VALUE_MAX:
+        raise argparse.ArgumentTypeError(f'should be between \'{VALUE_MIN}\' and \'{VALUE_MAX}\', but was \'{value}\'')
+    return int(number) if number.is_integer() else number
+
+
+class OutputArgumentParser(argparse.ArgumentParser):
+    """
+    An ArgumentParser, which prints its help, usage and error messages to the given text stream instead of sys.stdout
+    and sys.stderr, e.g. to return them to a client of the g6d daemon.
+    """
+
+    def __init__(self, output, **kwargs):
+        super().__init__(**kwargs)
+        self.output = output
+
+    def print_usage(self, file=None):
+        super().print_usage(self.output)
+
+    def print_help(self, file=None):
+        super().print_help(self.output)
+
+    def exit(self, status=0, message=None):
+        if message:
+            self.output.write(message)
+        sys.exit(status)
 
 
-def parse_cli_args():
+def parse_cli_args(cli_args=None, output=None):
     """
     Parse the CLI arguments using argparse.
     Prints the CLI help to console and raises an error, if the arguments are invalid.
+    :param cli_args: the list of CLI arguments to parse. If not given, the program's arguments are parsed.
+    :param output: the text stream to print the help and the errors to or None for the console
     :return: the parsed cli args object
     """
-    numbers = [i for i in range(0, 101)]
     enabled_disabled = ['Enabled', 'Disabled']
 
-    parser = argparse.ArgumentParser(description='SoundBlaster X G6 CLI')
+    parser = argparse.ArgumentParser(description='SoundBlaster X G6 CLI') if output is None \
+        else OutputArgumentParser(output, description='SoundBlaster X G6 CLI')
     #
     # Base options
     #
@@ -47,46 +116,133 @@ def parse_cli_args():
     # --set-output
     parser.add_argument('--set-output', required=False, type=str,
                         choices=[TOGGLE_STATE_SPEAKERS, TOGGLE_STATE_HEADPHONES])
+    # --minimal-output-payload
+    parser.add_argument('--minimal-output-payload', required=False, action='store_true',
+                        help='Sends the minimised output payload (see g6_minimize.py) instead of the full payload as '
+                             'captured from SoundBlaster Command. Experimental: the minimised payloads have only been '
+                             'derived against the simulated G6, which models nothing but the output report, and are '
+                             'not confirmed on a real G6 (see payloads/set-output-verification.json).')
     # --dry-run
     parser.add_argument('--dry-run', required=False, action='store_true',
                         help='Used to verify the available hex_line files, without making '
                              'any calls against the G6 device.')
+    # --force
+    parser.add_argument('--force', required=False, action='store_true',
+                        help='Sends all given sound effects and profiles to the G6, even if it is already set to them '
+                             'according to the last known device state. The output is always sent.')
+    # --show-state
+    parser.add_argument('--show-state', required=False, action='store_true',
+                        help='Prints the last known device state, which has been written to the G6 by this CLI.')
+    # --verify-payloads
+    parser.add_argument('--verify-payloads', required=False, action='store_true',
+                        help='Verifies the computed slider value encodings against the captured payload file '
+                             '\'payloads/0-100.hex\'.')
+    # --no-device-cache
+    parser.add_argument('--no-device-cache', required=False, action='store_true',
+                        help='Enumerates all USB HID devices to detect the G6, instead of using the cached device '
+                             'path.')
+    # --transport
+    parser.add_argument('--transport', required=False, type=str, choices=TRANSPORT_NAMES, default=DEFAULT_TRANSPORT,
+                        help='The way to reach the G6: \'hidapi\' (default), \'hidraw\' (Linux only, faster startup '
+                             'and lower latency, without hidapi) '
+                             'or \'simulated\' (an in-memory G6 for testing without hardware). The default can be '
+                             'set by the environment variable G6_TRANSPORT.')
+    # --device, --all-devices
+    parser.add_argument('--device', required=False, type=str, metavar='SERIAL_OR_PATH',
+                        help='Selects the G6 by its serial number or device path, if several G6s are connected. '
+                             'Otherwise, the first detected G6 is used.')
+    parser.add_argument('--all-devices', required=False, action='store_true',
+                        help='Sends the given arguments to every connected G6 concurrently and reports the result '
+                             'and the timing per device.')
+    # --trace, --quiet
+    parser.add_argument('--trace', required=False, type=str, metavar='FILE',
+                        help='Records the timestamps of every phase of the exchanges with the G6 (enumerate, open, '
+                             'descriptor, write, first_ack, drain, close) to FILE: as Chrome trace-event file, if FILE '
+                             'ends with \'.json\' (chrome://tracing, Perfetto), otherwise as JSON lines.')
+    parser.add_argument('--quiet', required=False, action='store_true',
+                        help='Prints nothing at all. The frames and their acknowledgements are not even formatted.')
+    # --via-daemon
+    parser.add_argument('--via-daemon', required=False, action='store_true',
+                        help='Sends the given arguments to the running g6d daemon (see g6_daemon.py), instead of '
+                             'opening the G6 device in this process.')
+    parser.add_argument('--daemon-socket', required=False, type=str, default=DAEMON_SOCKET_PATH,
+                        help='The path to the unix socket of the g6d daemon. Default: \'$XDG_RUNTIME_DIR/g6d.sock\'')
+    # --stream
+    parser.add_argument('--stream', required=False, type=str, nargs='?', const='-', metavar='FILE',
+                        help='Keeps the G6 open and applies the commands read line by line from stdin or FILE (e.g. a '
+                             'FIFO), like \'bass 42\', \'bass 42.5\', \'surround on\', \'smart-volume night\' or '
+                             '\'output headphones\'. Commands arriving while the G6 is busy are coalesced: only the '
+                             'newest value of every setting is sent.')
+    # --watch
+    parser.add_argument('--watch', required=False, action='store_true',
+                        help='Prints the changes of the G6 as JSON lines until Ctrl+C, e.g. the output switched by its '
+                             'front panel, and keeps the last known output in sync. The values of the sound effects '
+                             'are not decoded yet (unverified on a real G6). With \'--via-daemon\', the events are '
+                             'pushed by the daemon.')
+    # --apply-profile
+    parser.add_argument('--apply-profile', required=False, type=str, metavar='NAME',
+                        help='Applies the output and the sound effects of the profile file \'profiles/NAME.json\' (or '
+                             '\'.toml\'). Only the settings, which differ from the last applied profile, are sent.')
+    # --ramp, --over
+    parser.add_argument('--ramp', required=False, type=str, nargs=2, action='append', metavar=('EFFECT', 'START..END'),
+                        help='Fades the value of the given sound effect from START to END '
+                             '(e.g. \'--ramp bass 0..80\'). '
+                             f'EFFECT is one of: {[name.lower() for name in AUDIO_FEATURE_NAMES.keys()]}. '
+                             'May be given multiple times to fade several sound effects at once.')
+    parser.add_argument('--over', required=False, type=parse_duration, default='500ms',
+                        help='The duration of the fades given by \'--ramp\', in milliseconds (\'500ms\') or seconds '
+                             '(\'2s\'). Default: \'500ms\'')
+    # --get, --get-all
+    parser.add_argument('--get', required=False, type=str, action='append', choices=list(AUDIO_FEATURE_NAMES.keys()),
+                        help='Reads the current toggle and slider values of the given sound effect from the G6 '
+                             '(experimental: unverified on a real G6). May be given multiple times.')
+    parser.add_argument('--get-all', required=False, action='store_true',
+                        help='Reads the current toggle and slider values of all sound effects from the G6 '
+                             '(experimental: unverified on a real G6).')
     #
     # Sound Effects
     #
     # --set-surround
     parser.add_argument('--set-surround', required=False, type=str, choices=enabled_disabled,
                         help='Enables or disables the Surround sound effect: [\'Enabled\', \'Disabled\']')
-    parser.add_argument('--set-surround-value', required=False, type=int, choices=numbers,
-                        help='Set the value for the Surround sound effect as integer: [0 .. 100].')
+    parser.add_argument('--set-surround-value', required=False, type=parse_slider_value, metavar='VALUE',
+                        help='Set the value for the Surround sound effect as number, e.g. 42.5: [0 .. 100].')
     # --set-crystalizer
     parser.add_argument('--set-crystalizer', required=False, type=str, choices=enabled_disabled,
                         help='Enables or disables the Crystalizer sound effect: [\'Enabled\', \'Disabled\']')
-    parser.add_argument('--set-crystalizer-value', required=False, type=int, choices=numbers,
-                        help='Set the value for the Crystalizer sound effect as integer: [0 .. 100].')
+    parser.add_argument('--set-crystalizer-value', required=False, type=parse_slider_value, metavar='VALUE',
+                        help='Set the value for the Crystalizer sound effect as number, e.g. 42.5: [0 .. 100].')
     # --set-bass
     parser.add_argument('--set-bass', required=False, type=str, choices=enabled_disabled,
                         help='Enables or disables the Bass sound effect: [\'Enabled\', \'Disabled\']')
-    parser.add_argument('--set-bass-value', required=False, type=int, choices=numbers,
-                        help='Set the value for the Bass sound effect as integer: [0 .. 100].')
+    parser.add_argument('--set-bass-value', required=False, type=parse_slider_value, metavar='VALUE',
+                        help='Set the value for the Bass sound effect as number, e.g. 42.5: [0 .. 100].')
     # --set-smart-volume
     parser.add_argument('--set-smart-volume', required=False, type=str, choices=enabled_disabled,
                         help='Enables or disables the Smart-Volume sound effect: [\'Enabled\', \'Disabled\']')
-    parser.add_argument('--set-smart-volume-value', required=False, type=int, choices=numbers,
-                        help='Set the value for the Smart-Volume sound effect as value: [0 .. 100].')
+    parser.add_argument('--set-smart-volume-value', required=False, type=parse_slider_value, metavar='VALUE',
+                        help='Set the value for the Smart-Volume sound effect as number, e.g. 42.5: [0 .. 100].')
     parser.add_argument('--set-smart-volume-special-value', required=False, type=str, choices=['Night', 'Loud'],
                         help='Set the value for the Smart-Volume sound effect as string: \'Night\', \'Loud\'. '
                              'Supersedes the value from \'--set-smart-volume-value\'!')
     # --set-dialog-plus
     parser.add_argument('--set-dialog-plus', required=False, type=str, choices=enabled_disabled,
                         help='Enables or disables the Dialog-Plus sound effect: [\'Enabled\', \'Disabled\']')
-    parser.add_argument('--set-dialog-plus-value', required=False, type=int, choices=numbers,
-                        help='Set the value for the Dialog-Plus sound effect as integer: : [0 .. 100].')
+    parser.add_argument('--set-dialog-plus-value', required=False, type=parse_slider_value, metavar='VALUE',
+                        help='Set the value for the Dialog-Plus sound effect as number, e.g. 42.5: [0 .. 100].')
 
     # parse args and verify
-    args = parser.parse_args()
+    args = parser.parse_args(cli_args)
     if args.toggle_output is False \
             and args.set_output is None \
+            and args.verify_payloads is False \
+            and args.show_state is False \
+            and args.apply_profile is None \
+            and args.stream is None \
+            and args.watch is False \
+            and args.ramp is None \
+            and args.get is None \
+            and args.get_all is False \
             and args.set_surround is None \
             and args.set_surround_value is None \
             and args.set_crystalizer is None \
@@ -99,19 +255,83 @@ def parse_cli_args():
             and args.set_dialog_plus is None \
             and args.set_dialog_plus_value is None:
         message = 'No meaningful argument has been specified!'
-        print(message)
+        print(message, file=output)
         parser.print_help()
         raise ValueError(message)
     elif args.toggle_output is True and args.set_output is not None:
         message = 'Only one of the following CLI arguments may be specified: \'--toggle-output', '--set-output\'!'
-        print(message)
+        print(message, file=output)
+        parser.print_help()
+        raise ValueError(message)
+    elif args.all_devices is True and args.device is not None:
+        message = 'Only one of the following CLI arguments may be specified: \'--device\', \'--all-devices\'!'
+        print(message, file=output)
+        parser.print_help()
+        raise ValueError(message)
+    elif args.all_devices is True and args.stream is not None:
+        message = 'Only one of the following CLI arguments may be specified: \'--stream\', \'--all-devices\'!'
+        print(message, file=output)
+        parser.print_help()
+        raise ValueError(message)
+    elif args.watch is True and (args.all_devices is True or args.stream is not None):
+        message = 'Only one of the following CLI arguments may be specified: \'--watch\', \'--stream\', ' \
+                  '\'--all-devices\'!'
+        print(message, file=output)
         parser.print_help()
         raise ValueError(message)
 
+    # convert the fades to Ramps, so that invalid fades are reported before the device is opened
+    if args.ramp is not None:
+        try:
+            args.ramp = [to_ramp(effect, start_end) for effect, start_end in args.ramp]
+        except ValueError as ex:
+            parser.error(str(ex))
+
     return args
 
 
-def detect_device():
+def parse_duration(duration):
+    """
+    Parse a duration CLI argument, e.g. '500ms' or '2s'.
+    :param duration: the duration as string, having the unit 'ms' or 's'
+    :return: the duration in seconds as float
+    """
+    try:
+        if duration.endswith('ms'):
+            seconds = float(duration[:-2]) / 1000
+        elif duration.endswith('s'):
+            seconds = float(duration[:-1])
+        else:
+            raise ValueError()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'Expected a duration like \'500ms\' or \'2s\', but was \'{duration}\'!')
+    if seconds < 0:
+        raise argparse.ArgumentTypeError(f'The duration must not be negative, but was \'{duration}\'!')
+    return seconds
+
+
+def to_ramp(effect, start_end):
+    """
+    Converts the values of a '--ramp' CLI argument to a Ramp or raises a ValueError, if they are invalid.
+    :param effect: the name of the sound effect, e.g. 'bass' (case-insensitive)
+    :param start_end: the start and end value, e.g. '0..80' or '0..42.5' (see parse_slider_value())
+    :return: the Ramp
+    """
+    audio_feature_names = {name.lower(): audio_feature_enum for name, audio_feature_enum in AUDIO_FEATURE_NAMES.items()}
+    if effect.lower() not in audio_feature_names:
+        raise ValueError(f'Expected one of the following sound effects for --ramp: '
+                         f'{list(audio_feature_names.keys())}, but was \'{effect}\'!')
+    values = start_end.split('..')
+    if len(values) != 2:
+        raise ValueError(f'Expected the values of --ramp as \'START..END\', e.g. \'0..80\', but was \'{start_end}\'!')
+    try:
+        start_value, end_value = (parse_slider_value(value) for value in values)
+    except argparse.ArgumentTypeError as ex:
+        raise ValueError(f'Invalid value of --ramp: {ex}!')
+    return Ramp(audio_feature_names[effect.lower()], start_value, end_value)
+
+
+def detect_device(transport, use_cache=True, device_selector=None):
     """
     Tries to detect the SoundBlaster X G6 device and returns the device path to it.
 
@@ -130,16 +350,65 @@ def detect_device():
     - Interface 4
 
     A tree output of all connected USB devices can be generated with the command `lsusb -t`.
+
+    The detected device_path is remembered in the device cache file. On the next run, the cached device_path is
+    verified by opening the device once. Only if this fails, all devices are enumerated again. A device, which is
+    selected by its serial number or device path, is always enumerated and not cached.
+    :param transport: the Transport to enumerate the devices with (see g6_transport.py)
+    :param use_cache: whether to try the cached device_path before enumerating the devices.
+    :param device_selector: the serial number or the device path of the G6 to select, if several G6s are connected.
+    :return: The unique device_path to the G6.
+    """
+    if device_selector is not None:
+        return enumerate_device(transport, device_selector)
+    if use_cache:
+        device_path = read_device_cache(transport)
+        if device_path is not None:
+            if is_device_path_available(transport, device_path):
+                print(f'Device detected at cached path: {device_path}')
+                return device_path
+            invalidate_device_cache()
+    device_path = enumerate_device(transport)
+    write_device_cache(transport, device_path)
+    return device_path
+
+
+def enumerate_device(transport, device_selector=None):
+    """
+    Enumerates the connected USB HID devices to find the fourth interface of the G6. See detect_device().
+    :param transport: the Transport to enumerate the devices with (see g6_transport.py)
+    :param device_selector: the serial number or the device path of the G6 to select. The first G6, if not given.
     :return: The unique device_path to the G6.
     """
+    device_dicts = enumerate_devices(transport)
+    for device_dict in device_dicts:
+        if device_selector is None \
+                or device_selector in [device_dict['serial_number'], device_dict['path'].decode()]:
+            device_path = device_dict['path']
+            print(f'Device detected at path: {device_path}')
+            return device_path
+    raise IOError(
+        f"No SoundBlaster X G6 device matches the serial number or device path '{device_selector}'. Connected G6 "
+        f"devices: {[(device_dict['serial_number'], device_dict['path'].decode()) for device_dict in device_dicts]}")
+
+
+def enumerate_devices(transport):
+    """
+    Enumerates the connected USB HID devices to find the fourth interface of every connected G6. See detect_device().
+    :param transport: the Transport to enumerate the devices with (see g6_transport.py)
+    :return: the list of device dicts of the fourth interfaces, having at least the keys 'path' and 'serial_number'.
+             At least one device dict is returned.
+    """
     device_found = False
-    for device_dict in hid.enumerate():
-        if device_dict['vendor_id'] == G6_VENDOR_ID and device_dict['product_id']:
+    device_dicts = []
+    # let the transport filter by vendor_id and product_id, instead of walking through every HID device on the bus
+    for device_dict in transport.enumerate(G6_VENDOR_ID, G6_PRODUCT_ID):
+        if device_dict['vendor_id'] == G6_VENDOR_ID and device_dict['product_id'] == G6_PRODUCT_ID:
             device_found = True
-            if G6_PRODUCT_ID and device_dict['interface_number'] == G6_INTERFACE:
-                device_path = device_dict['path']
-                print(f'Device detected at path: {device_path}')
-                return device_path
+            if device_dict['interface_number'] == G6_INTERFACE:
+                device_dicts.append(device_dict)
+    if device_dicts:
+        return device_dicts
     if device_found:
         raise IOError(
             f"The SoundBlaster X G6 device could be found having vendor_id='{G6_VENDOR_ID:#x}' and product_id"
@@ -152,11 +421,71 @@ def detect_device():
             f"device (missing udev-rules in linux)?")
 
 
-def list_all_devices():
+def is_device_path_available(transport, device_path):
+    """
+    Checks, whether the device can be opened by the given device_path.
+    :param transport: the Transport to open the device with (see g6_transport.py)
+    :param device_path: the device_path to check
+    :return: true, if the device could be opened
+    """
+    device = transport.device()
+    try:
+        device.open_path(device_path)
+    except IOError:
+        return False
+    device.close()
+    return True
+
+
+def get_device_cache_key(transport):
+    # the device paths of the transports differ, e.g. '5-2.1:1.4' (hidapi) and '/dev/hidraw3' (hidraw)
+    return f'{transport.name}:{G6_VENDOR_ID:04x}:{G6_PRODUCT_ID:04x}:{G6_INTERFACE}'
+
+
+def read_device_cache(transport):
+    """
+    Read the device_path of the G6 from the device cache file.
+    :param transport: the Transport, the device_path has been detected with
+    :return: the cached device_path or None, if there is none
+    """
+    device_cache_file_path = os.path.join(RUNTIME_DIR_PATH, DEVICE_CACHE_FILE_NAME)
+    try:
+        with open(device_cache_file_path, 'r') as file:
+            device_path = json.load(file).get(get_device_cache_key(transport))
+    except (OSError, ValueError):
+        return None
+    return device_path.encode() if isinstance(device_path, str) else None
+
+
+def write_device_cache(transport, device_path):
+    """
+    Write the device_path of the G6 to the device cache file.
+    :param transport: the Transport, the device_path has been detected with
+    :param device_path: the detected device_path
+    """
+    device_cache_file_path = os.path.join(RUNTIME_DIR_PATH, DEVICE_CACHE_FILE_NAME)
+    try:
+        write_text_file_atomically(device_cache_file_path,
+                                   json.dumps({get_device_cache_key(transport): device_path.decode()}))
+    except OSError as ex:
+        print(f'Unable to write the device cache file {device_cache_file_path}: {ex}')
+
+
+def invalidate_device_cache():
+    """
+    Remove the device cache file, e.g. after the device has been unplugged.
+    """
+    device_cache_file_path = os.path.join(RUNTIME_DIR_PATH, DEVICE_CACHE_FILE_NAME)
+    if os.path.exists(device_cache_file_path):
+        os.remove(device_cache_file_path)
+
+
+def list_all_devices(transport):
     """
     Simply prints information of all detected usb devices to the console
+    :param transport: the Transport to enumerate the devices with (see g6_transport.py)
     """
-    for device_dict in hid.enumerate():
+    for device_dict in transport.enumerate():
         keys = list(device_dict.keys())
         keys.sort()
         for key in keys:
@@ -164,6 +493,15 @@ def list_all_devices():
         print()
 
 
+def read_payload_as_frames(payload_file_path):
+    """
+    Read a payload hex-line file and convert each of its lines to a frame.
+    :param payload_file_path: the file path to the payload hex-line file
+    :return: the list of frames, designated being sent to the G6.
+    """
+    return [Frame.from_hex_line(hex_line) for hex_line in read_payload_as_hex_lines(payload_file_path)]
+
+
 def read_toggle_state_file(toggle_state_file_path):
     """
     Read the toggle state from the temporary file to determine the state from previous runs.
@@ -180,114 +518,189 @@ def write_toggle_state_file(toggle_state_file_path, toggle_state_value):
     :param toggle_state_file_path: The path to the file for remembering the last set toggle state.
     :param toggle_state_value: The toggle state to write to the file. Should be either 'Speakers' or 'Headphones'.
     """
-    with open(toggle_state_file_path, 'w') as file:
-        file.write(str(toggle_state_value))
+    write_text_file_atomically(toggle_state_file_path, str(toggle_state_value))
+
+
+def warn_unconfirmed_minimal_payload(toggle_state, output=None):
+    """
+    Warns, if the minimised payload of the given output has not been confirmed on a real G6 by g6_minimize.py yet.
+    :param toggle_state: the output to send the minimised payload for: 'Speakers' or 'Headphones'
+    :param output: the text stream to print to or None for sys.stdout
+    """
+    # only required for '--minimal-output-payload'
+    from g6_minimize import VERIFIED_BY_HARDWARE, read_payload_verification
+    verification = read_payload_verification().get(toggle_state, {})
+    if verification.get('checker') != VERIFIED_BY_HARDWARE:
+        print(f'Warning: the minimised payload for the {toggle_state} has not been confirmed on a real G6 yet. '
+              f'Confirm it with: python g6_minimize.py --hardware --write', file=output)
+
+
+def read_output_payload_as_frames(toggle_state, frame_table=None, minimal=False):
+    """
+    Read the payload to set the G6's output. The payload is taken from the frame table, if available.
+    :param toggle_state: the output to set. Should be either 'Speakers' or 'Headphones'.
+    :param frame_table: the FrameTable (see g6_table.py) or None, to read the payload from its hex-line file
+    :param minimal: whether to read the minimised payload instead of the payload as captured from SoundBlaster Command
+    :return: the list of frames, designated being sent to the G6.
+    """
+    if frame_table is not None:
+        return [Frame.from_buffer(record) for record in frame_table.get_output_records(toggle_state, minimal)]
+    return read_payload_as_frames(get_output_payload_path(toggle_state, minimal))
+
+
+def get_state_file_path(serial_number):
+    """
+    :param serial_number: the serial number of the G6
+    :return: the path to the file to persist the shadow state of the device in (see g6_state.py)
+    """
+    return os.path.join(RUNTIME_DIR_PATH, STATE_FILE_NAME_FORMAT.format(device_key=get_device_key(serial_number)))
+
+
+def get_toggle_state_file_path(serial_number):
+    """
+    :param serial_number: the serial number of the G6
+    :return: the path to the file to remember the last toggle state of the device in
+    """
+    return os.path.join(RUNTIME_DIR_PATH,
+                        TOGGLE_STATE_FILE_NAME_FORMAT.format(device_key=get_device_key(serial_number)))
 
 
-def determine_toggle_state():
+def get_last_profile_file_path(serial_number):
     """
-    Reads the last used toggle_state value from the temporary file to determine the next value.
-    If the temporary file does not exist, 'Speakers' is used by default.
+    :param serial_number: the serial number of the G6
+    :return: the path to the file to remember the compiled frames of the last applied profile of the device in
+    """
+    return os.path.join(RUNTIME_DIR_PATH,
+                        LAST_PROFILE_FILE_NAME_FORMAT.format(device_key=get_device_key(serial_number)))
+
+
+def invalidate_last_profile(session):
+    """
+    Forget the last applied profile, after the device has been changed otherwise.
+    :param session: The opened G6Session of the device.
+    """
+    last_profile_file_path = get_last_profile_file_path(session.serial_number)
+    if os.path.exists(last_profile_file_path):
+        os.remove(last_profile_file_path)
+
+
+def determine_toggle_state(toggle_state_file_path, current_toggle_state=None, output=None):
+    """
+    Determines the next toggle_state value from the current one. If the current toggle_state is not known, the last
+    used toggle_state value is read from the runtime file. If the runtime file does not exist, 'Speakers' is used
+    by default.
+    :param toggle_state_file_path: the path to the runtime file of the device (see get_toggle_state_file_path())
+    :param current_toggle_state: the currently active output of the G6, if known (e.g. from the DeviceState).
+    :param output: the text stream to print to or None for sys.stdout
     :return: The just set and now active toggle state value.
     """
-    toggle_state_file_path = os.path.join(tempfile.gettempdir(), TOGGLE_STATE_TEMP_FILE_NAME)
-    # determine toggle state from temporary file or use SPEAKERS by default
-    if os.path.exists(toggle_state_file_path):
+    # determine toggle state from the given one, the runtime file or use SPEAKERS by default
+    if current_toggle_state is None and os.path.exists(toggle_state_file_path):
         current_toggle_state = read_toggle_state_file(toggle_state_file_path)
+    if current_toggle_state is not None:
         next_toggle_state = TOGGLE_STATE_SPEAKERS \
             if current_toggle_state == TOGGLE_STATE_HEADPHONES \
             else TOGGLE_STATE_HEADPHONES
         print(
             f'Toggle from '
-            f'{current_toggle_state} -> {next_toggle_state}')
+            f'{current_toggle_state} -> {next_toggle_state}', file=output)
     else:
         next_toggle_state = TOGGLE_STATE_SPEAKERS
-        print(f'Toggle to {next_toggle_state}')
-    # write next toggle state to temporary file
+        print(f'Toggle to {next_toggle_state}', file=output)
+    # write next toggle state to the runtime file
     write_toggle_state_file(toggle_state_file_path, next_toggle_state)
     # return the next toggle state to send it to the G6
     return next_toggle_state
 
 
-def device_toggle_output(device_path, dry_run):
+def device_toggle_output(session, audio, state, minimal=False):
     """
     Toggles the device's output. Either Speakers -> Headphones or Headphones -> Speakers.
-    :param device_path: The detected usb device path for the G6.
-    :param dry_run: whether to simulate communication with the device for program testing purposes.
-                    If set to true, no data is sent to the G6!
+    :param session: The opened G6Session to send the payload through.
+    :param audio: An instance of the class Audio from g6_spec.py, to take the payload from its frame table
+    :param state: The DeviceState to determine the current output with and to update after the payload has been sent.
+    :param minimal: whether to send the minimised payload instead of the payload as captured from SoundBlaster Command
     """
     # determine next toggle state
-    toggle_state = determine_toggle_state()
+    toggle_state = determine_toggle_state(get_toggle_state_file_path(session.serial_number), state.output,
+                                          session.output)
     # determine payload to load
-    payload_file_path = PAYLOAD_TOGGLE_TO_SPEAKERS_PATH \
-        if toggle_state == TOGGLE_STATE_HEADPHONES \
-        else PAYLOAD_TOGGLE_TO_HEADPHONES_PATH
-    # read payload from file
-    payload_hex_lines = read_payload_as_hex_lines(payload_file_path)
+    payload_file_path = get_output_payload_path(toggle_state, minimal)
+    if minimal:
+        warn_unconfirmed_minimal_payload(toggle_state, session.output)
+    # read payload from the frame table or from file
+    payload_frames = read_output_payload_as_frames(toggle_state, audio.frame_table, minimal)
     # send the payload to the device
-    print(f'About to send payload to device: {payload_file_path}')
-    send_to_device(device_path, payload_hex_lines, dry_run)
+    print(f'About to send payload to device: {payload_file_path}', file=session.output)
+    # the state is updated, even if the reports have not been acknowledged: the acknowledgement is unverified on a
+    # real G6 (see G6Session)
+    session.send(payload_frames)
+    invalidate_last_profile(session)
+    state.output = toggle_state
 
 
-def device_set_output(device_path, toggle_state, dry_run):
+def device_set_output(session, audio, toggle_state, state, minimal=False):
     """
     Set a specific device output. Either 'Speakers' or 'Headphones'
-    :param device_path: The detected usb device path for the G6.
+    The payload is always sent, even if the DeviceState tells, that the output is already set: the output might have
+    been changed by the front panel or by SoundBlaster Command meanwhile, which the DeviceState does not know about.
+    :param session: The opened G6Session to send the payload through.
+    :param audio: An instance of the class Audio from g6_spec.py, to take the payload from its frame table
     :param toggle_state: the toggle_state value to set the G6's output to. Should be either 'Speakers' or 'Headphones'.
-    :param dry_run: whether to simulate communication with the device for program testing purposes.
-                    If set to true, no data is sent to the G6!
+    :param state: The DeviceState to update after the payload has been sent.
+    :param minimal: whether to send the minimised payload instead of the payload as captured from SoundBlaster Command
     """
     # determine payload to load
-    if toggle_state == TOGGLE_STATE_SPEAKERS:
-        payload_file_path = PAYLOAD_TOGGLE_TO_SPEAKERS_PATH
-    elif toggle_state == TOGGLE_STATE_HEADPHONES:
-        payload_file_path = PAYLOAD_TOGGLE_TO_HEADPHONES_PATH
-    else:
+    if toggle_state not in [TOGGLE_STATE_SPEAKERS, TOGGLE_STATE_HEADPHONES]:
         raise ValueError(
             f'The given toggle_state must either be {TOGGLE_STATE_SPEAKERS} or {TOGGLE_STATE_HEADPHONES}, '
             f'but was {toggle_state}!')
-    # read payload from file
-    payload_hex_lines = read_payload_as_hex_lines(payload_file_path)
+    payload_file_path = get_output_payload_path(toggle_state, minimal)
+    if minimal:
+        warn_unconfirmed_minimal_payload(toggle_state, session.output)
+    # read payload from the frame table or from file
+    payload_frames = read_output_payload_as_frames(toggle_state, audio.frame_table, minimal)
     # send the payload to the device
-    print(f'About to send payload to device: {payload_file_path}')
-    send_to_device(device_path, payload_hex_lines, dry_run)
+    print(f'About to send payload to device: {payload_file_path}', file=session.output)
+    # the state is updated, even if the reports have not been acknowledged: the acknowledgement is unverified on a
+    # real G6 (see G6Session)
+    session.send(payload_frames)
+    invalidate_last_profile(session)
+    write_toggle_state_file(get_toggle_state_file_path(session.serial_number), toggle_state)
+    state.output = toggle_state
 
 
-def device_set_audio_effects(device_path, audio, args):
+def device_set_audio_effects(session, audio, args, state):
     """
     Sends all as CLI args given audio effects to the device.
-    :param device_path: The detected usb device path for the G6.
+    All changes are planned into one AudioBatch, which is sent as a single burst of DATA reports followed by all
+    COMMIT reports. Changes, which are already set according to the DeviceState, are skipped unless '--force' is given.
+    :param session: The opened G6Session to send the payloads through.
     :param audio: An instance of the class Audio from g6_spec.py
     :param args: the CLI arguments, recently parsed by argparse in parse_cli_args()
+    :param state: The DeviceState to skip redundant changes with and to update after the payloads have been sent.
     """
+    batch = AudioBatch(audio)
     # surround
     if args.set_surround is not None:
-        hex_lines = audio.build_hex_lines_toggle(AudioFeatureEnum.SURROUND, to_bool(args.set_surround))
-        send_to_device(device_path, hex_lines, args.dry_run)
+        batch.add_toggle(AudioFeatureEnum.SURROUND, to_bool(args.set_surround))
     if args.set_surround_value is not None:
-        hex_lines = audio.build_hex_lines_slider(AudioFeatureEnum.SURROUND, args.set_surround_value)
-        send_to_device(device_path, hex_lines, args.dry_run)
+        batch.add_slider(AudioFeatureEnum.SURROUND, args.set_surround_value)
     # crystalizer
     if args.set_crystalizer is not None:
-        hex_lines = audio.build_hex_lines_toggle(AudioFeatureEnum.CRYSTALIZER, to_bool(args.set_crystalizer))
-        send_to_device(device_path, hex_lines, args.dry_run)
+        batch.add_toggle(AudioFeatureEnum.CRYSTALIZER, to_bool(args.set_crystalizer))
     if args.set_crystalizer_value is not None:
-        hex_lines = audio.build_hex_lines_slider(AudioFeatureEnum.CRYSTALIZER, args.set_crystalizer_value)
-        send_to_device(device_path, hex_lines, args.dry_run)
+        batch.add_slider(AudioFeatureEnum.CRYSTALIZER, args.set_crystalizer_value)
     # bass
     if args.set_bass is not None:
-        hex_lines = audio.build_hex_lines_toggle(AudioFeatureEnum.BASS, to_bool(args.set_bass))
-        send_to_device(device_path, hex_lines, args.dry_run)
+        batch.add_toggle(AudioFeatureEnum.BASS, to_bool(args.set_bass))
     if args.set_bass_value is not None:
-        hex_lines = audio.build_hex_lines_slider(AudioFeatureEnum.BASS, args.set_bass_value)
-        send_to_device(device_path, hex_lines, args.dry_run)
+        batch.add_slider(AudioFeatureEnum.BASS, args.set_bass_value)
     # smart-volume
     if args.set_smart_volume is not None:
-        hex_lines = audio.build_hex_lines_toggle(AudioFeatureEnum.SMART_VOLUME, to_bool(args.set_smart_volume))
-        send_to_device(device_path, hex_lines, args.dry_run)
+        batch.add_toggle(AudioFeatureEnum.SMART_VOLUME, to_bool(args.set_smart_volume))
     if args.set_smart_volume_value is not None:
-        hex_lines = audio.build_hex_lines_slider(AudioFeatureEnum.SMART_VOLUME, args.set_smart_volume_value)
-        send_to_device(device_path, hex_lines, args.dry_run)
+        batch.add_slider(AudioFeatureEnum.SMART_VOLUME, args.set_smart_volume_value)
     if args.set_smart_volume_special_value is not None:
         smart_volume_special_value = None
         if args.set_smart_volume_special_value == 'Night':
@@ -297,15 +710,134 @@ def device_set_audio_effects(device_path, audio, args):
         else:
             raise ValueError(f'Expected one of the following values for --smart-volume-special-value: '
                              f'[\'Night\', \'Loud\'], but was \'{args.set_smart_volume_special_value}\'!')
-        hex_lines = audio.build_hex_lines_slider_special(AudioFeatureEnum.SMART_VOLUME, smart_volume_special_value)
-        send_to_device(device_path, hex_lines, args.dry_run)
+        # supersedes the value from --set-smart-volume-value
+        batch.add_slider_special(AudioFeatureEnum.SMART_VOLUME, smart_volume_special_value)
     # dialog-plus
     if args.set_dialog_plus is not None:
-        hex_lines = audio.build_hex_lines_toggle(AudioFeatureEnum.DIALOG_PLUS, to_bool(args.set_dialog_plus))
-        send_to_device(device_path, hex_lines, args.dry_run)
+        batch.add_toggle(AudioFeatureEnum.DIALOG_PLUS, to_bool(args.set_dialog_plus))
     if args.set_dialog_plus_value is not None:
-        hex_lines = audio.build_hex_lines_slider(AudioFeatureEnum.DIALOG_PLUS, args.set_dialog_plus_value)
-        send_to_device(device_path, hex_lines, args.dry_run)
+        batch.add_slider(AudioFeatureEnum.DIALOG_PLUS, args.set_dialog_plus_value)
+
+    device_send_audio_batch(session, batch, state, args.force)
+
+
+def device_send_audio_batch(session, batch, state, force):
+    """
+    Sends the planned changes of an AudioBatch as a single burst of DATA reports followed by all COMMIT reports.
+    :param session: The opened G6Session to send the payloads through.
+    :param batch: the AudioBatch of planned changes
+    :param state: The DeviceState to skip redundant changes with and to update after the payloads have been sent.
+    :param force: whether to send the changes, even if the DeviceState tells, that the device is already set to them.
+    """
+    # skip the changes, the device is already set to
+    if not force:
+        for audio_feature_enum, slot, value in batch.get_changes():
+            if state.get_audio_feature(audio_feature_enum, slot) == value:
+                print(f'{audio_feature_enum.name} is already set to {value}. Use --force to set it anyway.',
+                      file=session.output)
+                batch.discard(audio_feature_enum, slot)
+
+    if batch.is_empty():
+        return
+    data_frames, commit_frames = batch.build_frames()
+    print(f'Planned audio effects: {len(data_frames)} DATA and {len(commit_frames)} COMMIT reports',
+          file=session.output)
+    session.send(data_frames + commit_frames, pipelined=True)
+    invalidate_last_profile(session)
+    for audio_feature_enum, slot, value in batch.get_changes():
+        state.set_audio_feature(audio_feature_enum, slot, value)
+
+
+def device_apply_profile(session, audio, profile_name, state, force, minimal=False):
+    """
+    Applies the given profile to the device.
+    The profile is loaded as precompiled frames (see g6_profile.py), except for the output payload, which is read when
+    applying the profile. Only the settings, which differ from the last applied profile, are sent unless '--force' is
+    given: the output payload first, followed by a single burst of DATA and COMMIT reports of the audio effects.
+    :param session: The opened G6Session to send the payloads through.
+    :param audio: An instance of the class Audio from g6_spec.py
+    :param profile_name: the name of the profile, e.g. 'night' for 'profiles/night.json'
+    :param state: The DeviceState to update after the payloads have been sent.
+    :param force: whether to send all settings of the profile, even if they have been applied lately.
+    :param minimal: whether to send the minimised output payload instead of the payload as captured from SoundBlaster
+                    Command
+    """
+    entries = load_profile(PROFILE_DIR_PATH, profile_name, audio, session.output)
+    last_profile_file_path = get_last_profile_file_path(session.serial_number)
+    last_entries = None if force else read_profile_frames(last_profile_file_path)
+    changed_entries = diff_profile(entries, last_entries)
+    if not changed_entries:
+        print(f'The profile \'{profile_name}\' is already applied. Use --force to apply it anyway.',
+              file=session.output)
+        return
+
+    if minimal:
+        for entry in changed_entries:
+            if entry.kind == ENTRY_KIND_OUTPUT:
+                warn_unconfirmed_minimal_payload(entry.get_value(audio), session.output)
+    output_frames, audio_frames = build_profile_frames(
+        changed_entries, audio, lambda output: read_output_payload_as_frames(output, audio.frame_table, minimal))
+    print(f'Applying profile \'{profile_name}\': {len(changed_entries)} of {len(entries)} settings changed',
+          file=session.output)
+    session.send(output_frames)
+    session.send(audio_frames, pipelined=True)
+    for entry in changed_entries:
+        if entry.kind == ENTRY_KIND_OUTPUT:
+            state.output = entry.get_value(audio)
+        else:
+            state.set_audio_feature(AudioFeatureEnum(entry.audio_feature), entry.slot, entry.get_value(audio))
+    try:
+        write_profile_frames(last_profile_file_path, entries)
+    except OSError as ex:
+        print(f'Unable to remember the applied profile in {last_profile_file_path}: {ex}', file=session.output)
+
+
+def device_ramp_audio_effects(session, audio, ramps, duration_seconds, state):
+    """
+    Fades the sliders of the given audio effects from their start to their end values (see g6_ramp.py).
+    :param session: The opened G6Session to send the frames through.
+    :param audio: An instance of the class Audio from g6_spec.py
+    :param ramps: the list of Ramps to run concurrently
+    :param duration_seconds: the duration of the fades
+    :param state: The DeviceState to update with the end values after the fades.
+    """
+    print(f'Fading {len(ramps)} sound effect(s) over {duration_seconds * 1000:.0f} ms', file=session.output)
+    scheduler = RampScheduler(session, audio)
+    scheduler.run(ramps, duration_seconds)
+    print(f'Faded in {scheduler.steps} steps, last step interval: {scheduler.interval * 1000:.3f} ms',
+          file=session.output)
+    invalidate_last_profile(session)
+    for ramp in ramps:
+        state.set_audio_feature(ramp.audio_feature_enum, AudioBatch.SLOT_SLIDER, ramp.end_value)
+
+
+def device_get_audio_features(session, audio, audio_feature_enums):
+    """
+    Reads the current toggle and slider values of the given audio effects from the device and prints them.
+    The read requests are unverified on a real G6 (see Audio.build_frames_read()). Thus, the read values are not taken
+    over into the DeviceState: an echo of the read requests would let the state tell 0 for every value, which would
+    skip the next changes to 0.
+    :param session: The opened G6Session to send the read requests through.
+    :param audio: An instance of the class Audio from g6_spec.py
+    :param audio_feature_enums: the list of AudioFeatureEnum values to read
+    """
+    for audio_feature_enum in audio_feature_enums:
+        values = {}
+        for slot_name, _, frame in audio.build_frames_read(audio_feature_enum):
+            value_hex = session.query(frame)
+            if value_hex is None:
+                values[slot_name] = None
+            elif slot_name == 'toggle':
+                values[slot_name] = value_hex != encode_value(0)
+            elif slot_name == 'slider':
+                values[slot_name] = decode_value(value_hex)
+            else:
+                values[slot_name] = audio.decode_slider_special(audio_feature_enum, value_hex)
+
+        slider = values['slider']
+        if values.get('slider_special') is not None:
+            slider = values['slider_special']
+        print(f"{audio_feature_enum.name}: toggle={values['toggle']}, slider={slider}", file=session.output)
 
 
 def to_bool(enabled_disabled):
@@ -323,90 +855,267 @@ def to_bool(enabled_disabled):
                          f' \'Disabled\', but was \'{enabled_disabled}\'!')
 
 
-def send_to_device(device_path, payload_hex_lines, dry_run):
+def print_device_access_help(device_path, ex, transport):
     """
-    Send the payload_hex_lines to an endpoint from the usb device, identified by the device_path.
+    Prints hints to the console on how to grant access to the device, after the communication with it failed.
     :param device_path: The detected usb device path for the G6.
-    :param payload_hex_lines: A list of hexlines (raw usb payload) to send to the G6.
-                              Each line must be 128 characters long (64 bytes).
-    :param dry_run: whether to simulate communication with the device for program testing purposes.
-                    If set to true, no data is sent to the G6!
+    :param ex: the IOError, which has been risen while communicating with the device.
+    :param transport: the Transport, which has been used to communicate with the device.
     """
-    try:
-        print(f"Opening the device '{device_path}' ...")
-        h = hid.device()
-        h.open_path(device_path)
-        print(f"Opening the device '{device_path}': ok.")
-
-        print(f"Manufacturer: '{h.get_manufacturer_string()}'")
-        print(f"Product: '{h.get_product_string()}'")
-        print(f"Serial No: '{h.get_serial_number_string()}'")
-
-        # enable non-blocking mode
-        h.set_nonblocking(1)
-
-        # Validate all hex_lines
-        regex_pattern = re.compile(PAYLOAD_HEX_LINE_PATTERN)
-        for hex_line in payload_hex_lines:
-            if not regex_pattern.fullmatch(hex_line):
-                raise ValueError(
-                    f"The following hex_line is part of the payload, but it did not match the expected regex pattern! "
-                    f"Pattern: '{PAYLOAD_HEX_LINE_PATTERN}'; "
-                    f"Hex-Line: '{hex_line}'")
-
-        for hex_line in payload_hex_lines:
-            # Prepend an additional zero byte as report_id to the hex_line. Otherwise, the first byte from the actual
-            # 64 byte payload is cut off, since it is interpreted as report_id and thus, not sent to the device.
-            hex_line = '00' + hex_line
-
-            # Convert the hex string to a list of integers
-            integer_list = [int(hex_line[i:i + 2], 16) for i in range(0, len(hex_line), 2)]
-
-            # send the data to the device
-            print("Sending data to G6 ...")
-            print(hex_line)
-            if dry_run:
-                print("This is a dry run. No data has been sent!")
-            else:
-                h.write(integer_list)
-            print("Sending data to G6: ok.")
-
-            # read back the response
-            if not dry_run:
-                print("Read the response:")
-                while True:
-                    d = h.read(64)
-                    if d:
-                        print(d)
-                    else:
-                        break
-
-        print("Closing the device")
-        h.close()
-
-    except IOError as ex:
-        print(f'Unable to open a connection to the device by path: {device_path}')
-        print(ex)
-        print('\nAre the udev rules set and used by the kernel?')
-        print('Create a udev-rule file at `/etc/udev/rules.d/50-soundblaster-x-g6.rules` with the following content:')
-        print(UDEV_RULE)
-        print('\nIf the file already exists, it might not be used by the kernel. Try to reload the configuration with:')
-        print("`sudo udevadm trigger`")
+    print(f'Unable to open a connection to the device by path: {device_path}')
+    print(ex)
+    print('\nAre the udev rules set and used by the kernel?')
+    print('Create a udev-rule file at `/etc/udev/rules.d/50-soundblaster-x-g6.rules` with the following content:')
+    print(UDEV_RULE)
+    if transport.name == TRANSPORT_HIDRAW:
+        print(UDEV_RULE_HIDRAW)
+    print('\nIf the file already exists, it might not be used by the kernel. Try to reload the configuration with:')
+    print("`sudo udevadm trigger`")
 
 
-def main():
-    args = parse_cli_args()
-    device_path = detect_device()
-    audio = Audio(PAYLOAD_NUMBER_VALUES_PATH)
+def print_device_states():
+    """
+    Prints the last known state of every device, which has been remembered in the runtime directory.
+    """
+    prefix, suffix = STATE_FILE_NAME_FORMAT.split('{device_key}')
+    state_file_names = sorted(file_name for file_name in os.listdir(RUNTIME_DIR_PATH)
+                              if file_name.startswith(prefix) and file_name.endswith(suffix))
+    if not state_file_names:
+        print(f'No device state has been remembered in {RUNTIME_DIR_PATH} yet.')
+    for state_file_name in state_file_names:
+        print(f'Device: {state_file_name[len(prefix):-len(suffix)]}')
+        print(DeviceState.load(os.path.join(RUNTIME_DIR_PATH, state_file_name)))
+
+
+def has_device_arguments(args, ignored_arguments=()):
+    """
+    Checks, whether any of the given CLI arguments requires communication with the device.
+    :param args: the CLI arguments, recently parsed by argparse in parse_cli_args()
+    :param ignored_arguments: the names of further arguments to ignore, e.g. ['watch']
+    :return: true, if at least one argument has to be sent to the device
+    """
+    return any(value is not None and value is not False
+               for key, value in vars(args).items()
+               if key not in NON_DEVICE_ARGUMENTS and key not in ignored_arguments)
+
+
+def execute_cli_args(session, audio, args):
+    """
+    Sends all commands given as CLI args through the opened session to the device.
+    The DeviceState of the device is loaded before and saved after the commands have been sent (except for dry runs).
+    The whole read-modify-write is done under the lock of the state file, so that concurrent runs (e.g. two quick
+    hotkey presses) do not act on the same state.
+    :param session: The opened G6Session to send the payloads through.
+    :param audio: An instance of the class Audio from g6_spec.py
+    :param args: the CLI arguments, recently parsed by argparse in parse_cli_args()
+    """
+    state_file_path = get_state_file_path(session.serial_number)
+    with FileLock(state_file_path + LOCK_FILE_EXTENSION):
+        execute_cli_args_with_state(session, audio, args, DeviceState.load(state_file_path))
+
+
+def execute_cli_args_with_state(session, audio, args, state):
+    """
+    Sends all commands given as CLI args through the opened session to the device. See execute_cli_args().
+    :param session: The opened G6Session to send the payloads through.
+    :param audio: An instance of the class Audio from g6_spec.py
+    :param args: the CLI arguments, recently parsed by argparse in parse_cli_args()
+    :param state: the loaded DeviceState of the device
+    """
+
+    # handle profile, before the single settings override it
+    if args.apply_profile is not None:
+        device_apply_profile(session, audio, args.apply_profile, state, args.force, args.minimal_output_payload)
 
     # handle device output
     if args.toggle_output:
-        device_toggle_output(device_path, args.dry_run)
+        device_toggle_output(session, audio, state, args.minimal_output_payload)
     elif args.set_output is not None:
-        device_set_output(device_path, args.set_output, args.dry_run)
+        device_set_output(session, audio, args.set_output, state, args.minimal_output_payload)
 
     # handle audio effects
-    device_set_audio_effects(device_path, audio, args)
+    device_set_audio_effects(session, audio, args, state)
+
+    # fade audio effects
+    if args.ramp is not None:
+        device_ramp_audio_effects(session, audio, args.ramp, args.over, state)
+
+    # read back audio effects
+    if args.get_all:
+        device_get_audio_features(session, audio, list(AudioFeatureEnum))
+    elif args.get is not None:
+        device_get_audio_features(session, audio, [AUDIO_FEATURE_NAMES[name] for name in args.get])
+
+    if not session.dry_run:
+        state.save()
+
+
+def execute_cli_args_on_all_devices(transport, audio, args, tracer=None):
+    """
+    Sends all commands given as CLI args to every connected G6 concurrently: each device is driven through its own
+    G6Session in its own thread, so that the total wall time is close to the slowest device instead of the sum of all
+    devices. The device states are kept per device (see execute_cli_args()). The result and the timing of every device
+    are printed afterwards.
+    :param transport: the Transport to reach the G6s with (see g6_transport.py)
+    :param audio: An instance of the class Audio from g6_spec.py
+    :param args: the CLI arguments, recently parsed by argparse in parse_cli_args()
+    :param tracer: the Tracer to record the phases of the exchanges to (see g6_trace.py) or None
+    :return: the list of tuples (device dict, G6Session, error or None, seconds) in the order of the devices
+    """
+    # only required for '--all-devices', so keep it off the import time of the other commands
+    from concurrent.futures import ThreadPoolExecutor
+
+    def execute(device_dict):
+        start = time.perf_counter()
+        session = G6Session(device_dict['path'], args.dry_run, transport=transport, verbose=not args.quiet,
+                            tracer=tracer)
+        try:
+            with session:
+                execute_cli_args(session, audio, args)
+            error = None
+        except IOError as ex:
+            error = ex
+        return device_dict, session, error, time.perf_counter() - start
+
+    device_dicts = enumerate_devices(transport)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(device_dicts)) as executor:
+        results = list(executor.map(execute, device_dicts))
+    wall_seconds = time.perf_counter() - start
+
+    for device_dict, session, error, seconds in results:
+        result = f'failed: {error}' if error is not None \
+            else f'{session.acknowledged_count} reports acknowledged, {session.timeout_count} timed out, ' \
+                 f'{session.unconfirmed_count} not awaited'
+        print(f"Device {device_dict['serial_number']} ({device_dict['path'].decode()}): {result} "
+              f"in {seconds * 1000:.3f} ms")
+    print(f'{len(results)} device(s) in {wall_seconds * 1000:.3f} ms '
+          f'(slowest device: {max(seconds for _, _, _, seconds in results) * 1000:.3f} ms)')
+    return results
+
+
+def strip_daemon_args(cli_args):
+    """
+    Removes the daemon related arguments from the list of CLI arguments.
+    :param cli_args: the list of CLI arguments
+    :return: the list of CLI arguments without '--via-daemon' and '--daemon-socket'
+    """
+    stripped = []
+    skip_next = False
+    for cli_arg in cli_args:
+        if skip_next:
+            skip_next = False
+        elif cli_arg == '--via-daemon' or cli_arg.startswith('--daemon-socket='):
+            pass
+        elif cli_arg == '--daemon-socket':
+            skip_next = True
+        else:
+            stripped.append(cli_arg)
+    return stripped
+
+
+def resolve_trace_args(cli_args):
+    """
+    Resolves the FILE of '--trace FILE' against the current working directory, since the daemon writes the trace file
+    from its own working directory.
+    :param cli_args: the list of CLI arguments
+    :return: the list of CLI arguments with an absolute path of the trace file
+    """
+    resolved = []
+    resolve_next = False
+    for cli_arg in cli_args:
+        if resolve_next:
+            resolve_next = False
+            resolved.append(os.path.abspath(cli_arg))
+        elif cli_arg.startswith('--trace='):
+            resolved.append(f'--trace={os.path.abspath(cli_arg[len("--trace="):])}')
+        else:
+            resolve_next = cli_arg == '--trace'
+            resolved.append(cli_arg)
+    return resolved
+
+
+def forward_to_daemon(socket_path, cli_args):
+    """
+    Sends the CLI args to the running g6d daemon and prints its output.
+    :param socket_path: the path to the unix socket of the daemon
+    :param cli_args: the list of CLI arguments to execute by the daemon
+    """
+    from g6_daemon import send_command
+    response = send_command(socket_path, cli_args)
+    print(response['output'], end='')
+    if not response['ok']:
+        raise RuntimeError(f'The g6d daemon failed to execute the arguments {cli_args}: {response["error"]}')
+
+
+def main():
+    args = parse_cli_args()
+    if not args.quiet:
+        run(args)
+        return
+    # the few remaining prints of the CLI are discarded, while the G6Session does not print at all
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        run(args)
+
+
+def run(args):
+    """
+    Runs the parsed CLI arguments, see main().
+    :param args: the CLI arguments, recently parsed by argparse in parse_cli_args()
+    """
+    # verify the computed value encodings against the captured payload file
+    if args.verify_payloads:
+        verify_payload_number_values(PAYLOAD_NUMBER_VALUES_PATH)
+        print(f'Verified the slider value encodings against: {PAYLOAD_NUMBER_VALUES_PATH}')
+    # print the last known device state
+    if args.show_state:
+        print_device_states()
+    if not has_device_arguments(args):
+        return
+
+    # let the daemon communicate with the device
+    if args.via_daemon:
+        if has_device_arguments(args, ['watch']):
+            cli_args = resolve_trace_args(strip_daemon_args(sys.argv[1:]))
+            forward_to_daemon(args.daemon_socket, [cli_arg for cli_arg in cli_args if cli_arg != '--watch'])
+        if args.watch:
+            # the daemon pushes the events of its own watcher to its subscribers
+            from g6_watch import watch_via_daemon
+            watch_via_daemon(args.daemon_socket)
+        return
+
+    transport = get_transport(args.transport)
+    # record the phases of the exchanges with the G6 by a tracing transport (see g6_trace.py)
+    tracer = None
+    if args.trace is not None:
+        tracer = Tracer()
+        transport = TracingTransport(transport, tracer)
+    try:
+        # look up the frames in the precompiled frame table, if it has been built (see g6_table.py)
+        audio = Audio(FrameTable.open())
+        if args.all_devices:
+            execute_cli_args_on_all_devices(transport, audio, args, tracer)
+            return
+        device_path = detect_device(transport, not args.no_device_cache, args.device)
+
+        try:
+            # open the device once and send all payloads through the same handle
+            with G6Session(device_path, args.dry_run, transport=transport, verbose=not args.quiet,
+                           tracer=tracer) as session:
+                execute_cli_args(session, audio, args)
+                if args.stream is not None:
+                    # the streaming mode and its threads are only imported, if required
+                    from g6_stream import execute_stream
+                    execute_stream(session, audio, args)
+            if args.watch:
+                # the watcher opens its own handle and is only imported, if required
+                from g6_watch import execute_watch
+                execute_watch(transport, device_path, audio, args)
+        except IOError as ex:
+            print_device_access_help(device_path, ex, transport)
+    finally:
+        if tracer is not None:
+            tracer.write(args.trace)
 
 
 if __name__ == "__main__":
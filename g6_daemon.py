@@ -0,0 +1,442 @@
+import argparse
+import asyncio
+import io
+import json
+import os
+import socket
+import threading
+
+from g6_cli import DAEMON_SOCKET_PATH, DEFAULT_TRANSPORT, G6_PRODUCT_ID, G6_VENDOR_ID, detect_device, \
+    execute_cli_args, invalidate_device_cache, parse_cli_args
+from g6_session import G6Session
+from g6_spec import Audio
+from g6_table import FrameTable
+from g6_trace import PHASES, PhaseHistogram, Tracer, TracingTransport
+from g6_transport import TRANSPORT_NAMES, get_transport
+
+
+class G6Daemon:
+    """
+    The g6d daemon keeps the G6 device open and the Audio tables built for its whole lifetime and executes the
+    commands of its clients, which connect to it through a unix socket. If the G6 is not connected on start, it is
+    detected with the first command.
+
+    The protocol consists of JSON lines. Every request is an object with the list of CLI arguments to execute,
+    e.g. {"args": ["--set-bass-value", "50"]}. Every response is an object containing whether the execution
+    succeeded, the console output of the execution and the error message in case of a failure,
+    e.g. {"ok": true, "output": "...", "error": null}.
+
+    The phases of all exchanges with the G6 are traced (see g6_trace.py) and aggregated into a histogram per phase.
+    The request {"stats": true} is answered by the histograms, e.g. {"ok": true, "histograms": {"write": {...}}, ...}.
+    A client's '--trace FILE' writes the phases of its command to FILE, which has been resolved by the client, since
+    the daemon runs in its own working directory.
+
+    The request {"subscribe": true} keeps the connection open: after the response, the changes of the G6 are pushed as
+    one JSON line per event (see g6_watch.py), e.g. {"event": "output_changed", "time": ..., "output": "Headphones"}.
+    The reports are read by a single DeviceWatcher thread, which runs as long as there are subscribers. If the G6 is
+    gone, the event {"event": "watch_stopped", "error": "..."} is pushed and the subscriptions are closed.
+
+    Many clients are served concurrently by asyncio, while the commands are sent to the device one after another.
+
+    If pyudev is installed, the daemon listens to udev add/remove events of the G6. On such an event, the device cache
+    is invalidated and the session gets closed, so that the device is detected again with the next command.
+    """
+
+    def __init__(self, socket_path, dry_run, transport):
+        """
+        :param socket_path: the path to the unix socket to listen on
+        :param dry_run: whether to simulate communication with the device for program testing purposes.
+                        If set to true, no data is sent to the G6!
+        :param transport: the Transport to reach the G6 with (see g6_transport.py). The '--transport' argument of the
+                          clients is ignored.
+        """
+        self.socket_path = socket_path
+        self.dry_run = dry_run
+        self.tracer = Tracer()
+        self.transport = TracingTransport(transport, self.tracer)
+        # the watcher reads through its own handle, which is not traced
+        self.watch_transport = transport
+        self.histograms = {phase: PhaseHistogram() for phase in PHASES}
+        # the frame table stays mapped for the lifetime of the daemon (see g6_table.py)
+        self.audio = Audio(FrameTable.open())
+        self.session = None
+        self.__lock = None
+        self.__loop = None
+        # the queues of the subscribed clients and the DeviceWatcher feeding them
+        self.__subscribers = set()
+        self.__watcher = None
+
+    def start(self):
+        """
+        Detect the device and open the session to it. Raises an IOError, if the device could not be detected or opened.
+        """
+        if self.session is None:
+            self.session = G6Session(detect_device(self.transport), self.dry_run, transport=self.transport,
+                                     tracer=self.tracer)
+        self.session.open()
+
+    def stop(self):
+        """
+        Close the session to the device.
+        """
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+
+    def execute(self, cli_args):
+        """
+        Execute the given CLI arguments through the opened session to the device.
+        :param cli_args: the list of CLI arguments to execute
+        :return: the response as dict, having the keys 'ok', 'output' and 'error'
+        """
+        # the output of the command is printed to its own stream instead of sys.stdout, which is shared by all threads
+        output = io.StringIO()
+        error = None
+        args = None
+        try:
+            args = parse_cli_args(cli_args, output)
+            if args.device is not None or args.all_devices:
+                raise ValueError('The daemon drives the single G6 it has detected. \'--device\' and '
+                                 '\'--all-devices\' are not supported via the daemon!')
+            if args.stream is not None:
+                raise ValueError('\'--stream\' is not supported via the daemon, since it keeps the G6 open '
+                                 'by itself!')
+            if args.watch:
+                raise ValueError('\'--watch\' is not executed by the daemon. Subscribe to its events instead: '
+                                 '{"subscribe": true}')
+            # the device might have been closed after a previous error or a hotplug event
+            self.start()
+            # a report of a previous command, which has not been acknowledged in time, must not stop the
+            # acknowledgements of this command from being awaited
+            self.session.echo_missing = False
+            self.session.dry_run = self.dry_run or args.dry_run
+            self.session.verbose = not args.quiet
+            self.session.output = output
+            try:
+                execute_cli_args(self.session, self.audio, args)
+            finally:
+                self.session.dry_run = self.dry_run
+                self.session.verbose = True
+                self.session.output = None
+        except SystemExit:
+            error = f'Invalid arguments: {cli_args}'
+        except IOError as ex:
+            # detect and reopen the device with the next command
+            invalidate_device_cache()
+            self.stop()
+            error = str(ex)
+        except (ValueError, RuntimeError) as ex:
+            error = str(ex)
+        self.__aggregate_trace(args.trace if args is not None else None)
+        return {'ok': error is None, 'output': output.getvalue(), 'error': error}
+
+    def __aggregate_trace(self, trace_file_path):
+        """
+        Add the traced phases of the last command to the histograms and forget them.
+        :param trace_file_path: the file to write the phases of the last command to or None
+        """
+        events = self.tracer.events
+        self.tracer.clear()
+        for event in events:
+            self.histograms[event.phase].add(event.duration())
+        if trace_file_path is not None:
+            try:
+                self.tracer.write(trace_file_path, events)
+            except OSError as ex:
+                print(f'Unable to write the trace file {trace_file_path}: {ex}')
+
+    def get_stats(self):
+        """
+        :return: the response to a stats request, carrying the histograms of all phases as dicts
+        """
+        lines = [f'{phase}: {histogram}' for phase, histogram in self.histograms.items()]
+        return {'ok': True, 'output': '\n'.join(lines) + '\n', 'error': None,
+                'histograms': {phase: histogram.to_dict() for phase, histogram in self.histograms.items()}}
+
+    async def handle_client(self, reader, writer):
+        """
+        Serve a connected client until it closes the connection.
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if request.get('subscribe') is True:
+                        await self.serve_subscriber(reader, writer)
+                        break
+                    if request.get('stats') is True:
+                        cli_args = None
+                    else:
+                        cli_args = request['args']
+                        if not isinstance(cli_args, list) \
+                                or not all(isinstance(cli_arg, str) for cli_arg in cli_args):
+                            raise TypeError()
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    response = {'ok': False, 'output': '', 'error': f'Invalid request: {line!r}'}
+                else:
+                    async with self.__lock:
+                        if cli_args is None:
+                            response = self.get_stats()
+                        else:
+                            response = await asyncio.get_running_loop().run_in_executor(None, self.execute, cli_args)
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve_subscriber(self, reader, writer):
+        """
+        Push the events of the G6 to a subscribed client, until it closes the connection or the watcher stops.
+        """
+        async with self.__lock:
+            # the watcher reads from the device detected for the commands
+            error = await asyncio.get_running_loop().run_in_executor(None, self.__start_watcher)
+        if error is not None:
+            writer.write(json.dumps({'ok': False, 'output': '', 'error': error}).encode() + b'\n')
+            await writer.drain()
+            return
+        queue = asyncio.Queue()
+        self.__subscribers.add(queue)
+        closed = asyncio.ensure_future(reader.read())
+        try:
+            writer.write(json.dumps({'ok': True, 'output': 'Subscribed to the events of the G6.\n',
+                                     'error': None}).encode() + b'\n')
+            await writer.drain()
+            while True:
+                event = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait([event, closed], return_when=asyncio.FIRST_COMPLETED)
+                if closed in done:
+                    event.cancel()
+                    break
+                event_dict = event.result()
+                if event_dict is None:
+                    break
+                writer.write(json.dumps(event_dict).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            closed.cancel()
+            self.__subscribers.discard(queue)
+            if not self.__subscribers:
+                self.stop_watcher()
+
+    def stop_watcher(self):
+        """
+        Stop the DeviceWatcher thread, if it is running. It returns after its current read.
+        """
+        if self.__watcher is not None:
+            self.__watcher.stop()
+            self.__watcher = None
+
+    def __start_watcher(self):
+        """
+        Start the DeviceWatcher thread, if it is not running yet.
+        :return: the error message, if the device could not be detected, otherwise None
+        """
+        if self.__watcher is not None:
+            return None
+        # only required for subscriptions
+        from g6_watch import DeviceWatcher
+        try:
+            self.start()
+        except IOError as ex:
+            invalidate_device_cache()
+            self.stop()
+            return str(ex)
+        self.__watcher = DeviceWatcher(self.watch_transport, self.session.device_path, self.audio,
+                                       sync_state=not self.dry_run)
+        threading.Thread(target=self.__watch, args=(self.__watcher,), daemon=True).start()
+        return None
+
+    def __watch(self, watcher):
+        try:
+            watcher.watch(lambda event: self.__loop.call_soon_threadsafe(self.__publish, event.to_dict()))
+        except IOError as ex:
+            self.__loop.call_soon_threadsafe(self.__stop_subscriptions, watcher, str(ex))
+
+    def __publish(self, event_dict):
+        for queue in self.__subscribers:
+            queue.put_nowait(event_dict)
+
+    def __stop_subscriptions(self, watcher, error):
+        if watcher is not self.__watcher:
+            return
+        self.__watcher = None
+        self.__publish({'event': 'watch_stopped', 'error': error})
+        self.__publish(None)
+
+    async def serve(self):
+        """
+        Listen on the unix socket and serve the clients until the daemon gets cancelled.
+        """
+        self.__lock = asyncio.Lock()
+        self.__loop = asyncio.get_running_loop()
+        remove_stale_socket(self.socket_path)
+        server = await asyncio.start_unix_server(self.handle_client, path=self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        print(f'g6d is listening on: {self.socket_path}')
+        self.start_hotplug_listener()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def start_hotplug_listener(self):
+        """
+        Listen to udev add/remove events of the G6 by a netlink monitor, if the optional package pyudev is installed.
+        """
+        try:
+            import pyudev
+        except ImportError:
+            print('pyudev is not installed: the daemon does not notice, if the G6 gets unplugged or plugged in.')
+            return
+        monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+        monitor.filter_by(subsystem='usb')
+        monitor.start()
+        asyncio.get_running_loop().add_reader(monitor.fileno(), self.__handle_hotplug_event, monitor)
+
+    def __handle_hotplug_event(self, monitor):
+        device = monitor.poll(timeout=0)
+        # the udev property PRODUCT looks like: '41e/3256/1001'
+        product = f'{G6_VENDOR_ID:x}/{G6_PRODUCT_ID:x}/'
+        if device is not None and device.action in ['add', 'remove'] and device.get('PRODUCT', '').startswith(product):
+            print(f'The G6 has been {"plugged in" if device.action == "add" else "unplugged"}.')
+            asyncio.ensure_future(self.__invalidate_device())
+
+    async def __invalidate_device(self):
+        async with self.__lock:
+            invalidate_device_cache()
+            self.stop()
+
+
+def remove_stale_socket(socket_path):
+    """
+    Removes the unix socket file of a previous daemon, which did not shut down properly.
+    Raises a RuntimeError, if another daemon is still listening on the socket.
+    :param socket_path: the path to the unix socket
+    """
+    if not os.path.exists(socket_path):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(socket_path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.remove(socket_path)
+            return
+    raise RuntimeError(f'Another g6d daemon is already listening on: {socket_path}')
+
+
+def send_command(socket_path, cli_args):
+    """
+    Sends the CLI arguments to the daemon and waits for its response.
+    :param socket_path: the path to the unix socket of the daemon
+    :param cli_args: the list of CLI arguments to execute
+    :return: the response as dict, having the keys 'ok', 'output' and 'error'
+    """
+    return send_request(socket_path, {'args': cli_args})
+
+
+def send_request(socket_path, request):
+    """
+    Sends a request to the daemon and waits for its response.
+    :param socket_path: the path to the unix socket of the daemon
+    :param request: the request as dict
+    :return: the response as dict
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(socket_path)
+        except (ConnectionRefusedError, FileNotFoundError) as ex:
+            raise IOError(f'Unable to connect to the g6d daemon at: {socket_path}. Is it running?') from ex
+        client.sendall(json.dumps(request).encode() + b'\n')
+        with client.makefile('rb') as file:
+            line = file.readline()
+    if not line:
+        raise IOError(f'The g6d daemon at {socket_path} closed the connection without a response!')
+    return json.loads(line)
+
+
+def request_stats(socket_path):
+    """
+    Requests the histograms of the traced phases from the daemon.
+    :param socket_path: the path to the unix socket of the daemon
+    :return: the response as dict, having the keys 'ok', 'output', 'error' and 'histograms'
+    """
+    return send_request(socket_path, {'stats': True})
+
+
+def subscribe(socket_path):
+    """
+    Subscribes to the events of the G6 pushed by the daemon (see G6Daemon).
+    Raises an IOError, if the daemon is not running or refuses the subscription.
+    :param socket_path: the path to the unix socket of the daemon
+    :return: the generator of the events as dicts, which ends, when the daemon closes the subscription
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(socket_path)
+        except (ConnectionRefusedError, FileNotFoundError) as ex:
+            raise IOError(f'Unable to connect to the g6d daemon at: {socket_path}. Is it running?') from ex
+        client.sendall(json.dumps({'subscribe': True}).encode() + b'\n')
+        with client.makefile('rb') as file:
+            line = file.readline()
+            if not line:
+                raise IOError(f'The g6d daemon at {socket_path} closed the connection without a response!')
+            response = json.loads(line)
+            if not response['ok']:
+                raise IOError(f'The g6d daemon refused the subscription: {response["error"]}')
+            for line in file:
+                yield json.loads(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SoundBlaster X G6 daemon (g6d)')
+    parser.add_argument('--socket', required=False, type=str, default=DAEMON_SOCKET_PATH,
+                        help='The path to the unix socket to listen on. Default: \'$XDG_RUNTIME_DIR/g6d.sock\'')
+    parser.add_argument('--dry-run', required=False, action='store_true',
+                        help='Used to verify the daemon, without sending any data to the G6 device.')
+    parser.add_argument('--transport', required=False, type=str, choices=TRANSPORT_NAMES, default=DEFAULT_TRANSPORT,
+                        help='The way to reach the G6: \'hidapi\' (default), \'hidraw\' or \'simulated\'.')
+    parser.add_argument('--stats', required=False, action='store_true',
+                        help='Prints the histograms of the traced phases of the running daemon, instead of starting '
+                             'a daemon.')
+    parser.add_argument('--watch', required=False, action='store_true',
+                        help='Prints the events of the G6 pushed by the running daemon as JSON lines, instead of '
+                             'starting a daemon.')
+    args = parser.parse_args()
+
+    if args.stats:
+        print(request_stats(args.socket)['output'], end='')
+        return
+    if args.watch:
+        # the same as the CLI's '--watch --via-daemon'
+        from g6_watch import watch_via_daemon
+        watch_via_daemon(args.socket)
+        return
+
+    daemon = G6Daemon(args.socket, args.dry_run, get_transport(args.transport))
+    try:
+        daemon.start()
+    except IOError as ex:
+        # the device is detected again with the first command, e.g. after it has been plugged in
+        invalidate_device_cache()
+        daemon.stop()
+        print(f'The G6 could not be opened yet: {ex}')
+    try:
+        asyncio.run(daemon.serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.stop_watcher()
+        daemon.stop()
+        print(daemon.get_stats()['output'], end='')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import struct
+
+from g6_util import read_payload_as_hex_lines
+
+# The range of the values, which can be set on the G6's sliders
+VALUE_MIN = 0
+VALUE_MAX = 100
+# The number of hex_lines in the captured payload file '0-100.hex': a DATA and a COMMIT line for each value 0..100
+PAYLOAD_NUMBER_VALUES_LINE_COUNT = 202
+
+
+def encode_value(value):
+    """
+    Encode a slider value as the 4 byte value word of a DATA report.
+
+    The G6 expects the value as little-endian IEEE-754 float32 of value/100. E.g. 1 -> 0.01 -> bytes '0ad7233c'.
+    The returned integer holds these bytes in transmission order, so that format(word, 'x').zfill(8) results in the
+    hex string as it is sent to the device.
+    :param value: the slider value as int or float (0 - 100)
+    :return: the encoded value word as integer
+    """
+    if type(value) is not int and type(value) is not float:
+        raise ValueError(f'Argument \'value\' should be of type \'{type(int)}\' or \'{type(float)}\','
+                         f' but was \'{type(value)}\'!')
+    if value < VALUE_MIN or value > VALUE_MAX:
+        raise ValueError(f'Argument \'value\' should be between \'{VALUE_MIN}\' and \'{VALUE_MAX}\','
+                         f' but was \'{value}\'!')
+    return struct.unpack('>I', struct.pack('<f', value / 100))[0]
+
+
+def decode_value(value_word):
+    """
+    Decode the 4 byte value word of a DATA report back to the slider value.
+    :param value_word: the encoded value word as integer, as returned by encode_value()
+    :return: the slider value as float (0 - 100)
+    """
+    return round(struct.unpack('<f', struct.pack('>I', value_word))[0] * 100, 4)
+
+
+def verify_payload_number_values(payload_number_values_hex_path):
+    """
+    Verify the encoder against the captured payload file '0-100.hex'.
+    Every even line of the file is a DATA line, containing the value word of the values 0 to 100.
+    Raises a RuntimeError, if the file is corrupted or if one of the captured value words differs from the encoder.
+    :param payload_number_values_hex_path: the file path to the '0-100.hex' payload file
+    """
+    hex_lines = read_payload_as_hex_lines(payload_number_values_hex_path)
+    # check the file's number of lines
+    if not len(hex_lines) == PAYLOAD_NUMBER_VALUES_LINE_COUNT:
+        raise RuntimeError(
+            f"The file {payload_number_values_hex_path} seems to be corrupted, since it does not contain the "
+            f"expected {PAYLOAD_NUMBER_VALUES_LINE_COUNT} lines!")
+    # read from every even line, which is a 'Data' line containing a number's value (from 0-100)
+    expected_line_length = 128
+    for i in range(0, len(hex_lines), 2):
+        hex_line = hex_lines[i]
+        # check hex_line length
+        if len(hex_line) != expected_line_length:
+            raise RuntimeError(f"The file {payload_number_values_hex_path} seems to be corrupted."
+                               f"Expected the hex_line '{hex_line}' to have a length of {expected_line_length} "
+                               f"characters, but it had {len(hex_line)} characters!")
+        # check hex_line being a Data request type ('1207')
+        if hex_line[2:6] != '1207':
+            raise RuntimeError(f"The file {payload_number_values_hex_path} seems to be corrupted."
+                               f"The hex_line '{hex_line}' does not contain the expected 'DATA' request type: '1207'!")
+        value = int(i / 2)
+        captured_value_word = int(hex_line[12:20], 16)
+        encoded_value_word = encode_value(value)
+        if captured_value_word != encoded_value_word:
+            raise RuntimeError(f"The encoded value word for the value {value} is '{encoded_value_word:08x}', but the "
+                               f"file {payload_number_values_hex_path} contains '{captured_value_word:08x}'!")
@@ -0,0 +1,280 @@
+import os
+import time
+
+from g6_table import FrameTable
+from g6_transport import RESPONSE_TIMEOUT_MS, get_transport
+from g6_util import FileLock, read_payload_as_hex_lines, write_text_file_atomically
+
+# The outputs of the G6
+OUTPUT_SPEAKERS = 'Speakers'
+OUTPUT_HEADPHONES = 'Headphones'
+# The payloads to switch the G6's output: the payloads as captured from SoundBlaster Command and the minimised
+# payloads, derived by g6_minimize.py, which are sent with '--minimal-output-payload'
+PAYLOAD_DIR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'payloads')
+PAYLOAD_SET_OUTPUT_TO_HEADPHONES_PATH = os.path.join(PAYLOAD_DIR_PATH, 'set-output-to-headphones.hex')
+PAYLOAD_SET_OUTPUT_TO_SPEAKERS_PATH = os.path.join(PAYLOAD_DIR_PATH, 'set-output-to-speakers.hex')
+PAYLOAD_TOGGLE_TO_HEADPHONES_PATH = os.path.join(PAYLOAD_DIR_PATH, 'toggle-output-to-headphones.hex')
+PAYLOAD_TOGGLE_TO_SPEAKERS_PATH = os.path.join(PAYLOAD_DIR_PATH, 'toggle-output-to-speakers.hex')
+# The record of how the minimised payloads have been verified by g6_minimize.py: by the simulated G6 or on a real G6
+PAYLOAD_SET_OUTPUT_VERIFICATION_PATH = os.path.join(PAYLOAD_DIR_PATH, 'set-output-verification.json')
+# The names of the runtime files of the CLI in $XDG_RUNTIME_DIR (see g6_cli.py). The device state, the last toggle
+# state and the last applied profile are kept per device, by the key of the device (see get_device_key())
+DEVICE_CACHE_FILE_NAME = 'g6-cli-device-cache.json'
+STATE_FILE_NAME_FORMAT = 'g6-cli-state-{device_key}.json'
+TOGGLE_STATE_FILE_NAME_FORMAT = 'g6-cli-toggle-state-{device_key}'
+LAST_PROFILE_FILE_NAME_FORMAT = 'g6-cli-last-profile-{device_key}.frames'
+# The extension of the lock file next to a device state file, which serialises its read-modify-write
+LOCK_FILE_EXTENSION = '.lock'
+# The number of leading payload bytes, which the G6 is expected to echo in its acknowledgement: prefix, request type,
+# intermediate and audio feature (see g6_spec.Frame.is_response_to())
+ACKNOWLEDGED_HEADER_LENGTH = 6
+
+
+def parse_fast_args(cli_args):
+    """
+    Recognizes the hot commands, which are served by the fast path: '--toggle-output', '--set-output Speakers' and
+    '--set-output Headphones' without any other argument.
+    :param cli_args: the list of CLI arguments, without the program name
+    :return: the output to set, None to toggle the output or False, if the arguments have to be parsed by argparse
+    """
+    if cli_args == ['--toggle-output']:
+        return None
+    if len(cli_args) == 2 and cli_args[0] == '--set-output':
+        output = cli_args[1]
+    elif len(cli_args) == 1 and cli_args[0].startswith('--set-output='):
+        output = cli_args[0][len('--set-output='):]
+    else:
+        return False
+    return output if output in [OUTPUT_SPEAKERS, OUTPUT_HEADPHONES] else False
+
+
+def main(cli_args):
+    """
+    The fast path of the CLI for the hot commands '--toggle-output' and '--set-output', which are typically bound to
+    hotkeys. Neither argparse nor the frame builders of g6_spec are imported: the device path is taken from the device
+    cache, the captured output payload is sent as it is and the acknowledgements are checked by their echoed header.
+
+    The fast path is only taken, if everything it relies on is known from previous runs: $XDG_RUNTIME_DIR is set, the
+    device path is cached and the state of the device exists. Otherwise, or if the device cannot be opened, the full CLI
+    handles the command. The JSON files of the CLI are read and updated without the json module, which would import
+    the costly re module (see find_json_string()).
+    :param cli_args: the list of CLI arguments, without the program name
+    :return: true, if the command has been handled by the fast path
+    """
+    output = parse_fast_args(cli_args)
+    runtime_dir_path = os.environ.get('XDG_RUNTIME_DIR')
+    if output is False or runtime_dir_path is None:
+        return False
+
+    transport = get_transport(os.environ.get('G6_TRANSPORT', 'hidapi'))
+    # the device cache holds the device path of the transport, it has been detected with lately
+    device_cache_json = read_text_file(os.path.join(runtime_dir_path, DEVICE_CACHE_FILE_NAME))
+    device_path_token = find_json_string(device_cache_json, f'{transport.name}:', key_prefix=True)
+    if device_path_token is None or device_path_token[2] is None:
+        return False
+    device = transport.device()
+    try:
+        device.open_path(device_path_token[2].encode())
+    except IOError:
+        return False
+    try:
+        return set_output(device, runtime_dir_path, output)
+    finally:
+        device.close()
+
+
+def set_output(device, runtime_dir_path, output):
+    """
+    Set or toggle the output of the opened device. The device state is read, the output payload is sent and the device
+    state is written back under the lock of the device state file, so that concurrent runs (e.g. two quick hotkey
+    presses) toggle one after another instead of both sending the same payload.
+    :param device: the opened device handle of a Transport
+    :param runtime_dir_path: the directory of the runtime files of the CLI
+    :param output: the output to set or None to toggle the output
+    :return: true, if the command has been handled by the fast path
+    """
+    device_key = get_device_key(device.get_serial_number_string())
+    state_file_path = os.path.join(runtime_dir_path, STATE_FILE_NAME_FORMAT.format(device_key=device_key))
+    with FileLock(state_file_path + LOCK_FILE_EXTENSION):
+        state_json = read_text_file(state_file_path)
+        output_token = find_json_string(state_json, 'output')
+        if output_token is None:
+            return False
+        current_output = output_token[2]
+        if output is None:
+            if current_output not in [OUTPUT_SPEAKERS, OUTPUT_HEADPHONES]:
+                return False
+            output = OUTPUT_SPEAKERS if current_output == OUTPUT_HEADPHONES else OUTPUT_HEADPHONES
+            print(f'Toggle from {current_output} -> {output}')
+        # the output is set, even if the device state tells, that it is already set: it might have been changed by the
+        # front panel meanwhile
+
+        # the reports are sent as slices of the frame table, if it has been built (see g6_table.py)
+        frame_table = FrameTable.open()
+        if frame_table is not None:
+            reports = frame_table.get_output_records(output)
+        else:
+            # prepend the report_id
+            reports = [b'\x00' + bytes.fromhex(hex_line)
+                       for hex_line in read_payload_as_hex_lines(get_output_payload_path(output))]
+        # once a report has not been acknowledged in time, the following reports are sent without awaiting their
+        # acknowledgements, since the echo is unverified on a real G6 (see g6_session.G6Session)
+        acknowledged = True
+        for report in reports:
+            if acknowledged:
+                acknowledged = send_report(device, report)
+            else:
+                device.write(report)
+
+        # the output payload changes the device apart from the last applied profile
+        last_profile_file_path = os.path.join(runtime_dir_path,
+                                              LAST_PROFILE_FILE_NAME_FORMAT.format(device_key=device_key))
+        if os.path.exists(last_profile_file_path):
+            os.remove(last_profile_file_path)
+        if not acknowledged:
+            print(f'Warning: the G6 did not acknowledge a report within {RESPONSE_TIMEOUT_MS} ms. The acknowledgements '
+                  f'of the following reports have not been awaited.')
+        start, end, _ = output_token
+        write_text_file_atomically(state_file_path, f'{state_json[:start]}"{output}"{state_json[end:]}')
+        toggle_state_file_path = os.path.join(runtime_dir_path,
+                                              TOGGLE_STATE_FILE_NAME_FORMAT.format(device_key=device_key))
+        write_text_file_atomically(toggle_state_file_path, output)
+    print(f'Output set to {output}')
+    return True
+
+
+def get_output_payload_path(output, minimal=False):
+    """
+    The payload files are named by the output they switch to: the first report of 'toggle-output-to-headphones.hex'
+    carries the intermediate 0x0004 (Headphones), the one of 'toggle-output-to-speakers.hex' 0x0002 (Speakers).
+    :param output: the output to set: 'Speakers' or 'Headphones'
+    :param minimal: whether to take the minimised payload instead of the payload as captured from SoundBlaster Command
+    :return: the path to the hex-line file of the output payload
+    """
+    if output == OUTPUT_HEADPHONES:
+        return PAYLOAD_SET_OUTPUT_TO_HEADPHONES_PATH if minimal else PAYLOAD_TOGGLE_TO_HEADPHONES_PATH
+    return PAYLOAD_SET_OUTPUT_TO_SPEAKERS_PATH if minimal else PAYLOAD_TOGGLE_TO_SPEAKERS_PATH
+
+
+def get_device_key(serial_number):
+    """
+    :param serial_number: the serial number of the G6
+    :return: the key of the device in the names of its runtime files (the alphanumeric characters of its serial number)
+    """
+    return ''.join(character for character in serial_number or '' if character.isalnum()) or 'unknown'
+
+
+def send_report(device, report):
+    """
+    Send a single report to the opened device and wait for its acknowledgement.
+    :param device: the opened device handle of a Transport
+    :param report: the report as bytes-like object of 65 bytes: the report_id followed by the payload
+    :return: true, if the G6 acknowledged the report within the response timeout
+    """
+    device.write(report)
+    header = bytes(report[1:1 + ACKNOWLEDGED_HEADER_LENGTH])
+    deadline = time.perf_counter() + RESPONSE_TIMEOUT_MS / 1000
+    while True:
+        remaining_ms = int((deadline - time.perf_counter()) * 1000)
+        if remaining_ms <= 0:
+            return False
+        data = device.read(len(report) - 1, remaining_ms)
+        if data and bytes(data[:ACKNOWLEDGED_HEADER_LENGTH]) == header:
+            return True
+
+
+def read_text_file(text_file_path):
+    """
+    :param text_file_path: the path to the text file
+    :return: the content of the file or an empty string, if the file does not exist
+    """
+    try:
+        with open(text_file_path, 'r') as file:
+            return file.read()
+    except OSError:
+        return ''
+
+
+def find_json_string(json_text, key, key_prefix=False):
+    """
+    Find the value of a top-level key in a JSON object text, as written by json.dump(), e.g. '"output": "Speakers"'.
+    The nested objects and arrays and the strings, including their escape sequences, are skipped, so that neither a
+    nested key nor a string, which looks like the key, is found. Only string values without escape sequences and null
+    are supported.
+    :param json_text: the JSON text to search in
+    :param key: the key to find
+    :param key_prefix: whether the key is only the prefix of the key to find
+    :return: a tuple of (start, end, value) or None, if the key has not been found or its value is not supported.
+             The start and end index are the position of the value token in the text, the value is None for null.
+    """
+    depth = 0
+    # whether the next string at the top level is a key
+    expect_key = False
+    index = 0
+    while index < len(json_text):
+        character = json_text[index]
+        if character == '"':
+            end = find_json_string_end(json_text, index)
+            if end < 0:
+                return None
+            if depth == 1 and expect_key:
+                name = json_text[index + 1:end - 1]
+                if name == key or (key_prefix and name.startswith(key)):
+                    return parse_json_string_value(json_text, end)
+                expect_key = False
+            index = end
+            continue
+        if character in '{[':
+            depth += 1
+            expect_key = depth == 1 and character == '{'
+        elif character in '}]':
+            depth -= 1
+        elif character == ',':
+            expect_key = depth == 1
+        index += 1
+    return None
+
+
+def find_json_string_end(json_text, start):
+    """
+    :param json_text: the JSON text
+    :param start: the index of the opening quote of a string
+    :return: the index after the closing quote of the string or -1, if the string is not terminated
+    """
+    index = start + 1
+    while True:
+        quote = json_text.find('"', index)
+        if quote < 0:
+            return -1
+        # the quote is escaped by an odd number of backslashes
+        backslashes = 0
+        while json_text[quote - 1 - backslashes] == '\\':
+            backslashes += 1
+        if backslashes % 2 == 0:
+            return quote + 1
+        index = quote + 1
+
+
+def parse_json_string_value(json_text, key_end):
+    """
+    :param json_text: the JSON text
+    :param key_end: the index after the closing quote of a key
+    :return: a tuple of (start, end, value) of the value of the key or None, if the value is not supported
+             (see find_json_string())
+    """
+    start = key_end
+    while json_text[start:start + 1] in [' ', '\n', '\t']:
+        start += 1
+    if not json_text.startswith(':', start):
+        return None
+    start += 1
+    while json_text[start:start + 1] in [' ', '\n', '\t']:
+        start += 1
+    if json_text.startswith('null', start):
+        return start, start + len('null'), None
+    if not json_text.startswith('"', start):
+        return None
+    end = find_json_string_end(json_text, start)
+    if end < 0 or '\\' in json_text[start:end]:
+        return None
+    return start, end, json_text[start + 1:end - 1]
@@ -0,0 +1,303 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+
+from g6_fast import OUTPUT_HEADPHONES, OUTPUT_SPEAKERS, PAYLOAD_SET_OUTPUT_VERIFICATION_PATH, get_output_payload_path
+from g6_session import G6Session
+from g6_spec import OUTPUT_INTERMEDIATES, OUTPUT_REQUEST_TYPE, Audio, AudioFeatureExtended, Frame, \
+    RequestTypeEnum, StaticsEnum
+from g6_transport import SimulatedG6, SimulatedTransport
+from g6_util import read_payload_as_hex_lines, write_text_file_atomically
+
+# What has to match after a candidate sequence has been sent: only the output, or the output and every audio feature
+# register, which the captured sequence writes
+CHECK_OUTPUT = 'output'
+CHECK_STATE = 'state'
+CHECKS = [CHECK_OUTPUT, CHECK_STATE]
+# The value, the registers of the simulated G6 are scrambled with before every trial, so that a report setting a
+# register to zero is not mistaken as redundant
+SCRAMBLED_REGISTER_VALUE = 0x0000803f
+# How a minimised payload has been verified (see record_payload_verification()): by the SimulatedChecker or by the
+# HardwareChecker on a real G6
+VERIFIED_BY_SIMULATION = 'simulated'
+VERIFIED_BY_HARDWARE = 'hardware'
+
+
+class PayloadStep:
+    """
+    A step of an output payload, which is kept or removed as a whole: a DATA report together with the COMMIT report of
+    the same audio feature, or any other single report.
+    """
+
+    def __init__(self, frames, request_type, intermediate, audio_feature, value):
+        self.frames = frames
+        self.request_type = request_type
+        self.intermediate = intermediate
+        self.audio_feature = audio_feature
+        self.value = value
+
+    def is_pair(self):
+        return len(self.frames) == 2
+
+    def describe(self, feature_names):
+        """
+        :param feature_names: the names of the known audio feature registers by their hex value
+        :return: a human-readable description of the step
+        """
+        if self.request_type == OUTPUT_REQUEST_TYPE:
+            return f'set output {OUTPUT_INTERMEDIATES.get(self.intermediate, "unknown")}'
+        if self.is_pair():
+            name = feature_names.get(self.audio_feature, f'unknown feature {self.audio_feature:#04x}')
+            return f'DATA + COMMIT {name} = {self.value:#010x}'
+        return f'report {bytes(self.frames[0].payload()[:6]).hex()}'
+
+
+def decode_payload(frames, audio):
+    """
+    Decode the frames of a captured output payload into the steps, they can be minimised by, using the frame layout of
+    g6_spec.Frame: a DATA report followed by the COMMIT report of the same audio feature forms a single step.
+    :param frames: the list of frames of the payload
+    :param audio: an instance of Audio to take the request types and the intermediate from
+    :return: the list of PayloadSteps
+    """
+    data_request_type = audio.request_type_dict[RequestTypeEnum.DATA]
+    commit_request_type = audio.request_type_dict[RequestTypeEnum.COMMIT]
+    intermediate = audio.static_dict[StaticsEnum.INTERMEDIATE]
+    steps = []
+    index = 0
+    while index < len(frames):
+        _, request_type, frame_intermediate, audio_feature, value = frames[index].unpack()
+        if request_type == data_request_type and frame_intermediate == intermediate and index + 1 < len(frames) \
+                and frames[index + 1].unpack()[1:4] == (commit_request_type, intermediate, audio_feature):
+            steps.append(PayloadStep(frames[index:index + 2], request_type, frame_intermediate, audio_feature, value))
+            index += 2
+            continue
+        # e.g. the output report, which carries the output in its intermediate
+        steps.append(PayloadStep([frames[index]], request_type, frame_intermediate, audio_feature, value))
+        index += 1
+    return steps
+
+
+def get_feature_names(audio):
+    """
+    :return: the names of the known audio feature registers by their hex value, e.g. {0x19: 'BASS slider'}
+    """
+    feature_names = {}
+    for audio_feature_enum, audio_feature in audio.audio_feature_dict.items():
+        feature_names[audio_feature.toggle_hex] = f'{audio_feature_enum.name} toggle'
+        feature_names[audio_feature.slider_hex] = f'{audio_feature_enum.name} slider'
+        if isinstance(audio_feature, AudioFeatureExtended):
+            feature_names[audio_feature.slider_special_hex] = f'{audio_feature_enum.name} special'
+    return feature_names
+
+
+def get_opposite_output(output):
+    return OUTPUT_SPEAKERS if output == OUTPUT_HEADPHONES else OUTPUT_HEADPHONES
+
+
+def read_payload_frames(output, minimal):
+    return [Frame.from_hex_line(hex_line) for hex_line in read_payload_as_hex_lines(get_output_payload_path(output,
+                                                                                                          minimal))]
+
+
+def read_payload_verification(verification_file_path=PAYLOAD_SET_OUTPUT_VERIFICATION_PATH):
+    """
+    Read the record of how the minimised payloads have been verified.
+    :param verification_file_path: the path to the JSON file of the record
+    :return: a dict of the verification of every output, e.g. {'Speakers': {'checker': 'hardware', 'check': 'output',
+             'date': '2026-10-17'}}. Empty, if the file does not exist or is invalid.
+    """
+    try:
+        with open(verification_file_path, 'r') as file:
+            verification = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    return verification if isinstance(verification, dict) else {}
+
+
+def record_payload_verification(output, checker, check, verification_file_path=PAYLOAD_SET_OUTPUT_VERIFICATION_PATH):
+    """
+    Record, how the minimised payload of the given output has been verified, next to the payload files.
+    :param output: the output, the minimised payload switches to
+    :param checker: VERIFIED_BY_SIMULATION or VERIFIED_BY_HARDWARE
+    :param check: CHECK_OUTPUT or CHECK_STATE
+    :param verification_file_path: the path to the JSON file of the record
+    """
+    verification = read_payload_verification(verification_file_path)
+    verification[output] = {'checker': checker, 'check': check, 'date': datetime.date.today().isoformat()}
+    write_text_file_atomically(verification_file_path, json.dumps(verification, indent=2, sort_keys=True) + '\n')
+
+
+class SimulatedChecker:
+    """
+    Checks candidate sequences against a fresh SimulatedG6: before every trial, the G6 is switched to the opposite
+    output by its captured payload and the registers written by the captured sequence are scrambled. A candidate is
+    sufficient, if it leaves the G6 in the same state as the captured sequence.
+
+    The simulated G6 only models the output report and the DATA and COMMIT reports (see g6_transport.SimulatedG6). Any
+    other report is never removed, since the simulation cannot tell its effect.
+    """
+
+    def __init__(self, check):
+        """
+        :param check: CHECK_OUTPUT or CHECK_STATE
+        """
+        self.check = check
+        self.simulated_g6 = SimulatedG6()
+        self.transport = SimulatedTransport([self.simulated_g6])
+
+    def is_removable(self, step):
+        return step.is_pair() or step.request_type == OUTPUT_REQUEST_TYPE
+
+    def run(self, frames, output, audio_features):
+        """
+        Send the frames to the simulated G6, switched to the opposite output before.
+        :param frames: the frames of the candidate sequence
+        :param output: the output, the candidate sequence switches to
+        :param audio_features: the audio feature registers, which are part of the state for CHECK_STATE
+        :return: the resulting state as tuple of (output, registers) or None, if a report has not been acknowledged
+        """
+        self.simulated_g6.reset()
+        with G6Session(self.simulated_g6.device_path, False, transport=self.transport, verbose=False) as session:
+            session.send(read_payload_frames(get_opposite_output(output), False), pipelined=True)
+            for audio_feature in list(self.simulated_g6.registers.keys()):
+                self.simulated_g6.registers[audio_feature] = SCRAMBLED_REGISTER_VALUE
+            if not all(acknowledgement.is_acknowledged() for acknowledgement in session.send(frames, pipelined=True)):
+                return None
+        registers = None
+        if self.check == CHECK_STATE:
+            registers = {audio_feature: self.simulated_g6.registers.get(audio_feature)
+                         for audio_feature in audio_features}
+        return self.simulated_g6.output, registers
+
+
+class HardwareChecker:
+    """
+    Checks candidate sequences against a connected G6: before every trial, the G6 is switched to the opposite output by
+    its captured payload. Since the output cannot be read back, the user is asked, whether the audio is played by the
+    expected output. For CHECK_STATE, the registers written by the captured sequence are read back, too.
+    """
+
+    def __init__(self, check, session, audio):
+        """
+        :param check: CHECK_OUTPUT or CHECK_STATE
+        :param session: the opened G6Session of the connected G6
+        :param audio: an instance of Audio to build the read requests with
+        """
+        self.check = check
+        self.session = session
+        self.audio = audio
+
+    def is_removable(self, step):
+        return True
+
+    def run(self, frames, output, audio_features):
+        """
+        Send the frames to the G6, switched to the opposite output before, and let the user confirm the output.
+        :param frames: the frames of the candidate sequence
+        :param output: the output, the candidate sequence switches to
+        :param audio_features: the audio feature registers to read back for CHECK_STATE
+        :return: the resulting state as tuple of (output, registers). The output is None, if the user denied it.
+        """
+        # the acknowledgements are not required: the echo of the reports is unverified on a real G6 (see G6Session),
+        # while the user confirms the output
+        self.session.send(read_payload_frames(get_opposite_output(output), False))
+        self.session.send(frames)
+        answer = input(f'Is the audio played by the {output} now? [y/n] ')
+        actual_output = output if answer.strip().lower().startswith('y') else None
+        registers = None
+        if self.check == CHECK_STATE:
+            registers = {}
+            for audio_feature in audio_features:
+                read_frame = Frame().pack(self.audio.static_dict[StaticsEnum.PREFIX],
+                                          self.audio.request_type_dict[RequestTypeEnum.COMMIT],
+                                          self.audio.static_dict[StaticsEnum.INTERMEDIATE], audio_feature, 0)
+                registers[audio_feature] = self.session.query(read_frame)
+        return actual_output, registers
+
+
+def minimize(steps, output, checker):
+    """
+    Shrink the steps of an output payload: every removable step is removed on trial and stays removed, if the remaining
+    steps still leave the G6 in the same state as all steps. The result is 1-minimal: no single step of it can be
+    removed anymore.
+    :param steps: the list of PayloadSteps of the captured payload
+    :param output: the output, the payload switches to
+    :param checker: the SimulatedChecker or HardwareChecker to run the trials with
+    :return: a tuple of (the list of kept steps, the number of trials)
+    """
+    audio_features = sorted({step.audio_feature for step in steps if step.is_pair()})
+    expected_state = checker.run([frame for step in steps for frame in step.frames], output, audio_features)
+    if expected_state is None or expected_state[0] != output:
+        raise RuntimeError(f'The captured payload does not switch the G6 to the {output}!')
+    kept_steps = list(steps)
+    trials = 0
+    for step in steps:
+        if not checker.is_removable(step):
+            continue
+        candidate_steps = [kept_step for kept_step in kept_steps if kept_step is not step]
+        trials += 1
+        if checker.run([frame for kept_step in candidate_steps for frame in kept_step.frames], output,
+                       audio_features) == expected_state:
+            kept_steps = candidate_steps
+    return kept_steps, trials
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Derives the minimal payload to set the output of the SoundBlaster X '
+                                                 'G6 from its captured payload')
+    parser.add_argument('--output', type=str, choices=[OUTPUT_SPEAKERS, OUTPUT_HEADPHONES], action='append',
+                        help='The output to minimise the payload for. Default: both')
+    parser.add_argument('--check', type=str, choices=CHECKS, default=CHECK_OUTPUT,
+                        help=f'What has to match after a reduced payload has been sent: \'{CHECK_OUTPUT}\' (default) '
+                             f'or \'{CHECK_STATE}\', which also requires every audio feature register written by the '
+                             f'captured payload to match.')
+    parser.add_argument('--hardware', action='store_true',
+                        help='Runs the trials against the connected G6 instead of the simulated G6. You are asked to '
+                             'confirm the output after every trial.')
+    parser.add_argument('--transport', type=str, default=None,
+                        help='The way to reach the connected G6: \'hidapi\' (default) or \'hidraw\'.')
+    parser.add_argument('--write', action='store_true',
+                        help='Writes the minimised payloads to the payload files, which are sent by the CLI with '
+                             '\'--minimal-output-payload\', and records how they have been verified (simulated or on '
+                             'the connected G6) in \'payloads/set-output-verification.json\'. Rebuild the frame table '
+                             'afterwards: python g6_table.py')
+    args = parser.parse_args()
+
+    audio = Audio()
+    feature_names = get_feature_names(audio)
+    with contextlib.ExitStack() as exit_stack:
+        if args.hardware:
+            # the device detection of the CLI is only required for hardware trials
+            from g6_cli import DEFAULT_TRANSPORT, detect_device
+            from g6_transport import get_transport
+
+            transport = get_transport(args.transport or DEFAULT_TRANSPORT)
+            with contextlib.redirect_stdout(io.StringIO()):
+                device_path = detect_device(transport)
+            session = exit_stack.enter_context(G6Session(device_path, False, transport=transport, verbose=False))
+            checker = HardwareChecker(args.check, session, audio)
+        else:
+            checker = SimulatedChecker(args.check)
+
+        for output in args.output or [OUTPUT_SPEAKERS, OUTPUT_HEADPHONES]:
+            steps = decode_payload(read_payload_frames(output, False), audio)
+            kept_steps, trials = minimize(steps, output, checker)
+            frame_count = sum(len(step.frames) for step in steps)
+            kept_frame_count = sum(len(step.frames) for step in kept_steps)
+            print(f'{output}: {frame_count} -> {kept_frame_count} reports ({trials} trials)')
+            for step in steps:
+                print(f'  {"keep  " if step in kept_steps else "remove"} {step.describe(feature_names)}')
+            if args.write:
+                payload_file_path = get_output_payload_path(output, True)
+                write_text_file_atomically(payload_file_path, ''.join(frame.to_hex_line() + '\n' for step in kept_steps
+                                                                      for frame in step.frames))
+                record_payload_verification(output, VERIFIED_BY_HARDWARE if args.hardware else VERIFIED_BY_SIMULATION,
+                                            args.check)
+                print(f'Written: {payload_file_path}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+import json
+import os.path
+import struct
+
+from g6_encoder import decode_value, encode_value
+from g6_spec import AudioBatch, AudioFeatureEnum, AudioFeatureSpecialValueEnum, Frame
+from g6_util import write_file_atomically
+
+# The profile file extensions, in the order they are looked up
+PROFILE_EXTENSIONS = ['.json', '.toml']
+# The extension of the compiled profile, which is cached next to the profile file
+PROFILE_FRAMES_EXTENSION = '.frames'
+# The header of a compiled profile: magic, version, number of entries
+PROFILE_FRAMES_MAGIC = b'G6PF'
+PROFILE_FRAMES_VERSION = 2
+PROFILE_FRAMES_HEADER_FORMAT = '>4sHH'
+# The header of an entry: kind, audio feature, slot, tag, number of frames
+PROFILE_ENTRY_HEADER_FORMAT = '>BBBBH'
+# The kinds of entries
+ENTRY_KIND_OUTPUT = 0
+ENTRY_KIND_AUDIO_FEATURE = 1
+# The outputs as tag of an output entry
+OUTPUTS = ['Speakers', 'Headphones']
+# The names of the sound effects, as used by the CLI arguments and the profile files
+AUDIO_FEATURE_NAMES = {
+    'Surround': AudioFeatureEnum.SURROUND,
+    'Crystalizer': AudioFeatureEnum.CRYSTALIZER,
+    'Bass': AudioFeatureEnum.BASS,
+    'Smart-Volume': AudioFeatureEnum.SMART_VOLUME,
+    'Dialog-Plus': AudioFeatureEnum.DIALOG_PLUS
+}
+SPECIAL_VALUE_NAMES = {
+    'Night': AudioFeatureSpecialValueEnum.SMART_VOLUME_NIGHT,
+    'Loud': AudioFeatureSpecialValueEnum.SMART_VOLUME_LOUD
+}
+
+
+class ProfileEntry:
+    """
+    A single setting of a compiled profile together with its prebuilt frames.
+
+    The key of an entry identifies the setting (the output or the toggle/slider of an audio feature), while the tag
+    holds the selected output of an output entry. The frames of an audio feature entry are a DATA and a COMMIT frame.
+    An output entry has no frames: its payload depends on the payload files and the CLI arguments, so it is read when
+    the profile is applied (see build_profile_frames).
+    """
+
+    def __init__(self, kind, audio_feature, slot, tag, frames):
+        self.kind = kind
+        self.audio_feature = audio_feature
+        self.slot = slot
+        self.tag = tag
+        self.frames = frames
+
+    def key(self):
+        return self.kind, self.audio_feature, self.slot
+
+    def to_bytes(self):
+        header = struct.pack(PROFILE_ENTRY_HEADER_FORMAT, self.kind, self.audio_feature, self.slot, self.tag,
+                             len(self.frames))
+        return header + b''.join(bytes(frame.payload()) for frame in self.frames)
+
+    def get_value(self, audio):
+        """
+        Decode the value of this entry from its DATA frame, e.g. to update the DeviceState after it has been sent.
+        :param audio: An instance of the class Audio from g6_spec.py
+        :return: the output name for output entries, otherwise the value as written by AudioBatch (a bool for toggles,
+                 a float or an AudioFeatureSpecialValueEnum for sliders)
+        """
+        if self.kind == ENTRY_KIND_OUTPUT:
+            return OUTPUTS[self.tag]
+        audio_feature_enum = AudioFeatureEnum(self.audio_feature)
+        _, _, _, audio_feature_hex, value_hex = self.frames[0].unpack()
+        if self.slot == AudioBatch.SLOT_TOGGLE:
+            return value_hex != encode_value(0)
+        if audio_feature_hex == audio.audio_feature_dict[audio_feature_enum].slider_hex:
+            return decode_value(value_hex)
+        return audio.decode_slider_special(audio_feature_enum, value_hex)
+
+    def __eq__(self, other):
+        return isinstance(other, ProfileEntry) and self.to_bytes() == other.to_bytes()
+
+
+def find_profile_file(profile_dir_path, profile_name):
+    """
+    Find the profile file for the given profile name in the profile directory.
+    Raises a ValueError, if there is no such profile.
+    :param profile_dir_path: the directory containing the profile files
+    :param profile_name: the name of the profile, e.g. 'night' for 'night.json'
+    :return: the path to the profile file
+    """
+    for extension in PROFILE_EXTENSIONS:
+        profile_file_path = os.path.join(profile_dir_path, profile_name + extension)
+        if os.path.exists(profile_file_path):
+            return profile_file_path
+    raise ValueError(f'The profile \'{profile_name}\' could not be found in {profile_dir_path}! Expected one of the '
+                     f'files: {[profile_name + extension for extension in PROFILE_EXTENSIONS]}')
+
+
+def read_profile_file(profile_file_path):
+    """
+    Read a profile file, either as JSON or as TOML (requires Python 3.11).
+    :param profile_file_path: the path to the profile file
+    :return: the profile as dict
+    """
+    if profile_file_path.endswith('.toml'):
+        import tomllib
+        with open(profile_file_path, 'rb') as file:
+            return tomllib.load(file)
+    with open(profile_file_path, 'r') as file:
+        return json.load(file)
+
+
+def compile_profile(profile_dict, audio):
+    """
+    Compile a profile into the list of entries with prebuilt frames.
+
+    Example of a profile:
+        {
+          "output": "Headphones",
+          "Surround": {"enabled": true, "value": 60},
+          "Smart-Volume": {"enabled": true, "special": "Night"}
+        }
+    :param profile_dict: the profile as dict
+    :param audio: An instance of the class Audio from g6_spec.py
+    :return: the list of ProfileEntry, the output first, followed by the audio features in sending order
+    """
+    entries = []
+    for key, setting in profile_dict.items():
+        if key == 'output':
+            if setting not in OUTPUTS:
+                raise ValueError(f'The output of a profile must be one of {OUTPUTS}, but was \'{setting}\'!')
+            entries.append(ProfileEntry(ENTRY_KIND_OUTPUT, 0, 0, OUTPUTS.index(setting), []))
+            continue
+        if key not in AUDIO_FEATURE_NAMES:
+            raise ValueError(f'Unexpected setting \'{key}\' in profile! Expected one of: '
+                             f'{["output"] + list(AUDIO_FEATURE_NAMES.keys())}')
+        if not isinstance(setting, dict) or not set(setting.keys()) <= {'enabled', 'value', 'special'}:
+            raise ValueError(f'The setting \'{key}\' of a profile must be an object with the optional keys '
+                             f'\'enabled\', \'value\' and \'special\', but was \'{setting}\'!')
+        audio_feature_enum = AUDIO_FEATURE_NAMES[key]
+        if 'enabled' in setting:
+            frames = audio.build_frames_toggle(audio_feature_enum, setting['enabled'])
+            entries.append(ProfileEntry(ENTRY_KIND_AUDIO_FEATURE, audio_feature_enum.value, AudioBatch.SLOT_TOGGLE, 0,
+                                        frames))
+        # the special value supersedes the value
+        if 'special' in setting:
+            if setting['special'] not in SPECIAL_VALUE_NAMES:
+                raise ValueError(f'The special value of \'{key}\' must be one of {list(SPECIAL_VALUE_NAMES.keys())}, '
+                                 f'but was \'{setting["special"]}\'!')
+            frames = audio.build_frames_slider_special(audio_feature_enum, SPECIAL_VALUE_NAMES[setting['special']])
+            entries.append(ProfileEntry(ENTRY_KIND_AUDIO_FEATURE, audio_feature_enum.value, AudioBatch.SLOT_SLIDER, 0,
+                                        frames))
+        elif 'value' in setting:
+            frames = audio.build_frames_slider(audio_feature_enum, setting['value'])
+            entries.append(ProfileEntry(ENTRY_KIND_AUDIO_FEATURE, audio_feature_enum.value, AudioBatch.SLOT_SLIDER, 0,
+                                        frames))
+    entries.sort(key=ProfileEntry.key)
+    return entries
+
+
+def write_profile_frames(profile_frames_path, entries):
+    """
+    Write the compiled profile as binary file. The file is replaced atomically, since several devices may apply the
+    same profile concurrently (see '--all-devices').
+    :param profile_frames_path: the path to write the compiled profile to
+    :param entries: the list of ProfileEntry
+    """
+    header = struct.pack(PROFILE_FRAMES_HEADER_FORMAT, PROFILE_FRAMES_MAGIC, PROFILE_FRAMES_VERSION, len(entries))
+    write_file_atomically(profile_frames_path, header + b''.join(entry.to_bytes() for entry in entries))
+
+
+def read_profile_frames(profile_frames_path):
+    """
+    Read a compiled profile from a binary file.
+    :param profile_frames_path: the path to the compiled profile
+    :return: the list of ProfileEntry or None, if the file does not exist or has an unexpected format or version
+    """
+    try:
+        with open(profile_frames_path, 'rb') as file:
+            data = file.read()
+        magic, version, entry_count = struct.unpack_from(PROFILE_FRAMES_HEADER_FORMAT, data, 0)
+        if magic != PROFILE_FRAMES_MAGIC or version != PROFILE_FRAMES_VERSION:
+            return None
+        offset = struct.calcsize(PROFILE_FRAMES_HEADER_FORMAT)
+        entries = []
+        for _ in range(entry_count):
+            kind, audio_feature, slot, tag, frame_count = struct.unpack_from(PROFILE_ENTRY_HEADER_FORMAT, data, offset)
+            offset += struct.calcsize(PROFILE_ENTRY_HEADER_FORMAT)
+            frames = []
+            for _ in range(frame_count):
+                frames.append(Frame.from_payload(data[offset:offset + Frame.PAYLOAD_LENGTH]))
+                offset += Frame.PAYLOAD_LENGTH
+            entries.append(ProfileEntry(kind, audio_feature, slot, tag, frames))
+        if offset != len(data):
+            return None
+    except (OSError, struct.error):
+        return None
+    return entries
+
+
+def load_profile(profile_dir_path, profile_name, audio, output=None):
+    """
+    Load the compiled profile. The profile is only compiled, if the cached compiled profile next to the profile file
+    is missing or older than the profile file.
+    :param profile_dir_path: the directory containing the profile files
+    :param profile_name: the name of the profile, e.g. 'night' for 'night.json'
+    :param audio: An instance of the class Audio from g6_spec.py
+    :param output: the text stream to print to or None for sys.stdout
+    :return: the list of ProfileEntry
+    """
+    profile_file_path = find_profile_file(profile_dir_path, profile_name)
+    profile_frames_path = os.path.splitext(profile_file_path)[0] + PROFILE_FRAMES_EXTENSION
+    if os.path.exists(profile_frames_path) \
+            and os.path.getmtime(profile_frames_path) >= os.path.getmtime(profile_file_path):
+        entries = read_profile_frames(profile_frames_path)
+        if entries is not None:
+            return entries
+    entries = compile_profile(read_profile_file(profile_file_path), audio)
+    try:
+        write_profile_frames(profile_frames_path, entries)
+    except OSError as ex:
+        print(f'Unable to cache the compiled profile at {profile_frames_path}: {ex}', file=output)
+    return entries
+
+
+def diff_profile(entries, last_entries):
+    """
+    Determine the entries, which differ from the last applied profile.
+    :param entries: the list of ProfileEntry of the profile to apply
+    :param last_entries: the list of ProfileEntry of the last applied profile or None, if unknown
+    :return: the list of ProfileEntry, which have to be sent to the device
+    """
+    if last_entries is None:
+        return entries
+    last_entries_dict = {entry.key(): entry for entry in last_entries}
+    return [entry for entry in entries if last_entries_dict.get(entry.key()) != entry]
+
+
+def build_profile_frames(entries, audio, read_output_frames):
+    """
+    Build the burst of reports for the given entries: the frames of the output first, followed by the prebuilt frames of
+    the audio features, planned by an AudioBatch (all DATA frames, followed by all deduplicated COMMIT frames).
+    :param entries: the list of ProfileEntry to send
+    :param audio: An instance of the class Audio from g6_spec.py
+    :param read_output_frames: a function returning the frames to switch the output to the given output name
+    :return: a tuple of (output frames, audio feature frames)
+    """
+    output_frames = []
+    batch = AudioBatch(audio)
+    for entry in entries:
+        if entry.kind == ENTRY_KIND_OUTPUT:
+            output_frames += read_output_frames(OUTPUTS[entry.tag])
+            continue
+        batch.add_frames(AudioFeatureEnum(entry.audio_feature), entry.slot, entry.get_value(audio), entry.frames)
+    data_frames, commit_frames = batch.build_frames()
+    return output_frames, data_frames + commit_frames
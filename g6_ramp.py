@@ -0,0 +1,146 @@
+import time
+
+from g6_encoder import VALUE_MAX, VALUE_MIN
+
+# The rate to send the intermediate values of a ramp with, as long as the G6 acknowledges them fast enough
+RAMP_RATE_HZ = 50
+# The rate to commit the intermediate values of a ramp with. The DATA reports of the steps in between only stage the
+# value, their COMMIT reports are coalesced into a single one per commit interval.
+RAMP_COMMIT_RATE_HZ = 10
+
+
+class Ramp:
+    """
+    A linear fade of an AudioFeature's slider from a start value to an end value.
+    """
+
+    def __init__(self, audio_feature_enum, start_value, end_value):
+        """
+        :param audio_feature_enum: the enum value of the AudioFeature to fade the slider of
+        :param start_value: the slider value to start with (0 - 100), an int or a float
+        :param end_value: the slider value to end with (0 - 100), an int or a float
+        """
+        for name, value in [('start_value', start_value), ('end_value', end_value)]:
+            if type(value) not in [int, float] or not VALUE_MIN <= value <= VALUE_MAX:
+                raise ValueError(f'Argument \'{name}\' should be a number between \'{VALUE_MIN}\' and '
+                                 f'\'{VALUE_MAX}\', but was \'{value}\'!')
+        self.audio_feature_enum = audio_feature_enum
+        self.start_value = start_value
+        self.end_value = end_value
+
+    def value_at(self, progress):
+        """
+        :param progress: the progress of the ramp (0.0 - 1.0)
+        :return: the slider value at the given progress, rounded to the slider's integer steps in between. The start and
+                 the end value are returned as they are.
+        """
+        if progress <= 0.0:
+            return self.start_value
+        if progress >= 1.0:
+            return self.end_value
+        return round(self.start_value + (self.end_value - self.start_value) * progress)
+
+
+class RampScheduler:
+    """
+    Sends the intermediate values of one or more ramps to the G6, paced by deadlines on a monotonic clock.
+
+    Every step has a deadline, which is derived from the previous deadline instead of the time the previous step
+    finished, so that the pacing does not drift. The value of a step is interpolated from the time the step is actually
+    sent, so that a late step jumps to the value it should have by now instead of replaying every value in between.
+
+    The step interval adapts to the measured round trip time of the steps, which commit: if the G6 acknowledges slower
+    than the RAMP_RATE_HZ, the steps are stretched to the round trip time, so that reports never queue up behind slow
+    acknowledgements. The value of a step is interpolated for the time its acknowledgement is expected, so that the end
+    value is acknowledged when the duration elapses. A step only sends the DATA reports of the ramps, whose value
+    changed since the previous step. Steps, which have been missed, are coalesced into the next one.
+
+    The intermediate COMMIT reports are coalesced: a step only appends the COMMIT reports of the ramps, whose values
+    have been staged since the last commit, if the commit interval has elapsed. The first and the last step always
+    commit, so that the start value is applied at once and the end value when the duration elapses.
+
+    The clock and the sleep function can be replaced, e.g. to run the scheduler against a fake device.
+    """
+
+    def __init__(self, session, audio, rate_hz=RAMP_RATE_HZ, clock=time.monotonic, sleep=time.sleep,
+                 commit_rate_hz=RAMP_COMMIT_RATE_HZ):
+        """
+        :param session: The opened G6Session to send the frames through.
+        :param audio: An instance of the class Audio from g6_spec.py
+        :param rate_hz: the maximum number of steps per second
+        :param commit_rate_hz: the maximum number of commits per second
+        :param clock: the monotonic clock, returning seconds
+        :param sleep: the function to sleep for the given seconds
+        """
+        self.session = session
+        self.audio = audio
+        self.min_interval = 1 / rate_hz
+        self.clock = clock
+        self.sleep = sleep
+        self.commit_interval = 1 / commit_rate_hz
+        self.interval = self.min_interval
+        self.round_trip_seconds = 0
+        self.steps = 0
+        self.commits = 0
+
+    def run(self, ramps, duration_seconds):
+        """
+        Run the ramps concurrently over the given duration. The start values are sent immediately, the end values
+        when the duration has elapsed.
+        :param ramps: the list of Ramps to run
+        :param duration_seconds: the duration of the ramps
+        :return: the list of Acknowledgements of all sent frames. Empty for dry runs.
+        """
+        if duration_seconds < 0:
+            raise ValueError(f'Argument \'duration_seconds\' must not be negative, but was \'{duration_seconds}\'!')
+        sent_values = {}
+        # the COMMIT frames of the values, which have been staged since the last commit
+        pending_commit_frames = {}
+        last_commit = None
+        acknowledgements = []
+        start = self.clock()
+        end = start + duration_seconds
+        deadline = start
+        while True:
+            now = self.clock()
+            if now < deadline:
+                self.sleep(deadline - now)
+                # the deadline has been reached, even if a coarse clock tells a little less
+                now = max(self.clock(), deadline)
+            # the progress at the time, the acknowledgement of the step is expected
+            acknowledged = now + self.round_trip_seconds
+            progress = 1.0 if acknowledged >= end else (acknowledged - start) / duration_seconds
+
+            frames = []
+            for ramp in ramps:
+                value = ramp.value_at(progress)
+                if sent_values.get(ramp.audio_feature_enum) != value:
+                    sent_values[ramp.audio_feature_enum] = value
+                    data_frame, commit_frame = self.audio.build_frames_slider(ramp.audio_feature_enum, value)
+                    frames.append(data_frame)
+                    pending_commit_frames[ramp.audio_feature_enum] = commit_frame
+            commit = bool(pending_commit_frames) and (last_commit is None or progress >= 1.0
+                                                      or now - last_commit >= self.commit_interval)
+            if commit:
+                frames += pending_commit_frames.values()
+                pending_commit_frames = {}
+                last_commit = now
+                self.commits += 1
+            if frames:
+                step_acknowledgements = self.session.send(frames, pipelined=True)
+                self.steps += 1
+                # the round trip of the largest bursts, since the last step commits, too
+                if commit:
+                    self.__adapt_interval(step_acknowledgements)
+                acknowledgements += step_acknowledgements
+            if progress >= 1.0:
+                return acknowledgements
+
+            # coalesce the steps, which have been missed, instead of catching up with a burst, but do not miss the end
+            deadline = min(max(deadline + self.interval, self.clock()), end - self.round_trip_seconds)
+
+    def __adapt_interval(self, acknowledgements):
+        latencies = [ack.latency_seconds for ack in acknowledgements if ack.is_acknowledged()]
+        if latencies:
+            self.round_trip_seconds = max(latencies)
+            self.interval = max(self.min_interval, self.round_trip_seconds)
@@ -0,0 +1,219 @@
+import time
+
+from g6_spec import Acknowledgement, Frame, ResponseStatusEnum
+from g6_trace import PHASE_DRAIN, PHASE_FIRST_ACK
+from g6_transport import RESPONSE_TIMEOUT_MS, HidapiTransport
+
+
+class G6Session:
+    """
+    Owns a single open handle to the G6 for the whole program run.
+
+    The device is opened once when entering the context and closed once when leaving it. The descriptor strings
+    (manufacturer, product, serial number) are queried only once after opening and are cached afterwards, so that
+    every payload sent during the run reuses the same handle instead of re-opening the device.
+
+    Everything is printed to the output of the session, which defaults to sys.stdout. The g6d daemon gives every command
+    its own output, so that the output of a command is returned to its client.
+
+    The acknowledgements rely on the G6 echoing the header of every report, which has not been verified against a real
+    G6 yet. If a report is not acknowledged within the response timeout, a warning is printed once and the
+    acknowledgements of the following reports are not awaited anymore (they are UNCONFIRMED), so that a G6, which does
+    not echo, does not stall every report by the response timeout.
+
+    Unless the session is verbose, nothing but warnings is printed: neither the hex-lines of the frames nor their
+    acknowledgements are formatted at all. If a Tracer is given, the time until the first acknowledgement and the drain
+    of the remaining acknowledgements of every burst are recorded (the other phases are recorded by a TracingTransport,
+    see g6_trace.py).
+
+    Usage:
+        with G6Session(device_path, dry_run) as session:
+            session.send(frames)
+    """
+
+    def __init__(self, device_path, dry_run, response_timeout_ms=RESPONSE_TIMEOUT_MS, transport=None, verbose=True,
+                 tracer=None, output=None):
+        """
+        :param device_path: The detected usb device path for the G6.
+        :param dry_run: whether to simulate communication with the device for program testing purposes.
+                        If set to true, no data is sent to the G6!
+        :param response_timeout_ms: how long to wait for the acknowledgement of a report at most.
+        :param transport: the Transport to open the device with (see g6_transport.py). Defaults to hidapi.
+        :param verbose: whether to print every step of the communication with the device.
+        :param tracer: the Tracer to record the acknowledgement phases to (see g6_trace.py) or None.
+        :param output: the text stream to print to or None for sys.stdout.
+        """
+        self.device_path = device_path
+        self.dry_run = dry_run
+        self.response_timeout_ms = response_timeout_ms
+        self.transport = transport or HidapiTransport()
+        self.verbose = verbose
+        self.tracer = tracer
+        self.output = output
+        self.manufacturer = None
+        self.product = None
+        self.serial_number = None
+        # the number of sent reports, which have been acknowledged, timed out or not awaited
+        self.acknowledged_count = 0
+        self.timeout_count = 0
+        self.unconfirmed_count = 0
+        # whether a report has not been acknowledged in time, so that the acknowledgements are not awaited anymore
+        self.echo_missing = False
+        self.__device = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def open(self):
+        """
+        Open the device and query its descriptor strings once.
+        Does nothing, if the device has already been opened.
+        """
+        if self.__device is not None:
+            return
+        if self.verbose:
+            print(f"Opening the device '{self.device_path}' ...", file=self.output)
+        device = self.transport.device()
+        device.open_path(self.device_path)
+        self.__device = device
+        if self.verbose:
+            print(f"Opening the device '{self.device_path}': ok.", file=self.output)
+
+        self.manufacturer = device.get_manufacturer_string()
+        self.product = device.get_product_string()
+        self.serial_number = device.get_serial_number_string()
+        if self.verbose:
+            print(f"Manufacturer: '{self.manufacturer}'", file=self.output)
+            print(f"Product: '{self.product}'", file=self.output)
+            print(f"Serial No: '{self.serial_number}'", file=self.output)
+
+    def close(self):
+        """
+        Close the device, if it has been opened.
+        """
+        if self.__device is None:
+            return
+        if self.verbose:
+            print("Closing the device", file=self.output)
+        self.__device.close()
+        self.__device = None
+
+    def send(self, frames, pipelined=False):
+        """
+        Send the frames to the endpoint of the opened device and wait for their acknowledgements.
+        :param frames: A list of frames (see g6_spec.Frame) to send to the G6.
+        :param pipelined: If set to false, the acknowledgement is awaited after every single frame. If set to true,
+                          all frames are written in one burst and the acknowledgements are awaited afterwards.
+        :return: the list of Acknowledgements in the order of the frames. Empty for dry runs.
+        """
+        if self.__device is None:
+            raise IOError(f"The device '{self.device_path}' has not been opened yet!")
+
+        acknowledgements = []
+        pending = []
+        for frame in frames:
+            pending.append((frame, self.__write(frame)))
+            if not pipelined:
+                acknowledgements += self.__await_acknowledgements(pending)
+                pending = []
+        acknowledgements += self.__await_acknowledgements(pending)
+
+        for acknowledgement in acknowledgements:
+            if self.verbose:
+                print(acknowledgement, file=self.output)
+            if acknowledgement.is_acknowledged():
+                self.acknowledged_count += 1
+            elif acknowledgement.status is ResponseStatusEnum.TIMEOUT:
+                self.timeout_count += 1
+            else:
+                self.unconfirmed_count += 1
+        return acknowledgements
+
+    def query(self, frame):
+        """
+        Send a read request to the device and wait for the response, which carries the value of the audio feature.
+        The read requests are unverified on a real G6 (see Audio.build_frames_read()).
+        :param frame: the read request frame (see Audio.build_frames_read())
+        :return: the value word as integer or None, if the device did not respond in time (or for dry runs)
+        """
+        if self.__device is None:
+            raise IOError(f"The device '{self.device_path}' has not been opened yet!")
+
+        deadline = self.__write(frame) + self.response_timeout_ms / 1000
+        if self.dry_run:
+            return None
+        while True:
+            remaining_ms = int((deadline - time.perf_counter()) * 1000)
+            if remaining_ms <= 0:
+                return None
+            data = self.__device.read(Frame.PAYLOAD_LENGTH, remaining_ms)
+            if data:
+                value_hex = Frame.from_payload(data).find_value(frame)
+                if value_hex is not None:
+                    return value_hex
+
+    def __write(self, frame):
+        # send the data to the device
+        if self.verbose:
+            print("Sending data to G6 ...", file=self.output)
+            print(frame.buffer.hex(), file=self.output)
+        if self.dry_run:
+            if self.verbose:
+                print("This is a dry run. No data has been sent!", file=self.output)
+        else:
+            self.__device.write(frame.buffer)
+        if self.verbose:
+            print("Sending data to G6: ok.", file=self.output)
+        return time.perf_counter()
+
+    def __await_acknowledgements(self, pending):
+        """
+        Read back the responses of the device, until every pending frame has been acknowledged or the response timeout
+        has been reached. Every read blocks for the remaining time at most, instead of polling the device.
+        :param pending: the list of tuples (frame, time sent) to await the acknowledgements for
+        :return: the list of Acknowledgements in the order of the pending frames
+        """
+        if self.dry_run or not pending:
+            return []
+        if self.echo_missing:
+            return [Acknowledgement(frame, ResponseStatusEnum.UNCONFIRMED, 0) for frame, _ in pending]
+        acknowledgements = {}
+        first_acknowledged = None
+        deadline = pending[-1][1] + self.response_timeout_ms / 1000
+        while len(acknowledgements) < len(pending):
+            remaining_ms = int((deadline - time.perf_counter()) * 1000)
+            if remaining_ms <= 0:
+                break
+            data = self.__device.read(Frame.PAYLOAD_LENGTH, remaining_ms)
+            if not data:
+                continue
+            received = time.perf_counter()
+            response_frame = Frame.from_payload(data)
+            for index, (frame, sent) in enumerate(pending):
+                if index not in acknowledgements and response_frame.is_response_to(frame):
+                    acknowledgements[index] = Acknowledgement(frame, ResponseStatusEnum.ACKNOWLEDGED,
+                                                              received - sent, response_frame)
+                    if first_acknowledged is None:
+                        first_acknowledged = received
+                    break
+            else:
+                if self.verbose:
+                    print(f"Unexpected response: {response_frame.to_hex_line()}", file=self.output)
+        now = time.perf_counter()
+        if self.tracer is not None:
+            # a burst without any acknowledgement waits for the timeout in its first_ack phase
+            self.tracer.record(PHASE_FIRST_ACK, pending[0][1], first_acknowledged or now, frames=len(pending))
+            if first_acknowledged is not None and len(pending) > 1:
+                self.tracer.record(PHASE_DRAIN, first_acknowledged, now, frames=len(pending),
+                                   acknowledged=len(acknowledgements))
+        if len(acknowledgements) < len(pending):
+            self.echo_missing = True
+            print(f'Warning: the G6 did not acknowledge {len(pending) - len(acknowledgements)} report(s) within '
+                  f'{self.response_timeout_ms} ms. The acknowledgements of the following reports are not awaited.',
+                  file=self.output)
+        return [acknowledgements.get(index) or Acknowledgement(frame, ResponseStatusEnum.TIMEOUT, now - sent)
+                for index, (frame, sent) in enumerate(pending)]
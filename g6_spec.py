@@ -1,6 +1,8 @@
+import struct
 from enum import Enum
 
-from g6_util import read_payload_as_hex_lines
+from g6_encoder import VALUE_MAX, VALUE_MIN, encode_value
+from g6_table import KIND_SLIDER, KIND_SLIDER_SPECIAL, KIND_TOGGLE
 
 
 class StaticsEnum(Enum):
@@ -10,9 +12,16 @@ class StaticsEnum(Enum):
 
 class RequestTypeEnum(Enum):
     DATA = 0
+    # the COMMIT report carries no value and is used to read back the current value of an audio feature, too
     COMMIT = 1
 
 
+# The first report of the output payloads switches the output: 5a2c0500 02 (Speakers) or 04 (Headphones). The G6 is
+# assumed to report a press of its output button by the same report, which has not been verified on a real G6.
+OUTPUT_REQUEST_TYPE = 0x2c05
+OUTPUT_INTERMEDIATES = {0x0002: 'Speakers', 0x0004: 'Headphones'}
+
+
 class AudioFeatureEnum(Enum):
     SURROUND = 0
     CRYSTALIZER = 1
@@ -26,6 +35,13 @@ class AudioFeatureSpecialValueEnum(Enum):
     SMART_VOLUME_LOUD = 1
 
 
+class ResponseStatusEnum(Enum):
+    ACKNOWLEDGED = 0
+    TIMEOUT = 1
+    # not awaited, since the G6 did not acknowledge an earlier report in time (see G6Session)
+    UNCONFIRMED = 2
+
+
 class AudioFeature:
     def __init__(self, toggle_hex, slider_hex):
         self.toggle_hex = toggle_hex
@@ -41,8 +57,154 @@ class AudioFeatureExtended(AudioFeature):
         self.slider_special_disabled_value_hex = slider_special_disabled_value_hex
 
 
+class Frame:
+    """
+    A single report as it is written to the G6, backed by a reusable 65 byte bytearray.
+
+    The first byte is the report_id, which is always zero. Otherwise, the first byte of the actual 64 byte payload
+    would be cut off, since it is interpreted as report_id and thus, not sent to the device. The payload itself
+    starts with the fields: prefix (0x5a), request type, intermediate (0x0196), audio feature and value.
+    Hex-lines are only used as debug and serialisation format of a frame.
+    """
+    LENGTH = 65
+    PAYLOAD_LENGTH = 64
+    HEADER_FORMAT = '>BHHBI'
+    HEADER_LENGTH = 1 + struct.calcsize(HEADER_FORMAT)
+    ZERO_PADDING = bytes(LENGTH - HEADER_LENGTH)
+
+    def __init__(self):
+        self.buffer = bytearray(Frame.LENGTH)
+
+    def pack(self, prefix, request_type, intermediate, audio_feature, value):
+        """
+        Pack the given fields in place into the frame's buffer. The remaining payload is zeroed.
+        :return: the frame itself
+        """
+        struct.pack_into(Frame.HEADER_FORMAT, self.buffer, 1, prefix, request_type, intermediate, audio_feature, value)
+        self.buffer[Frame.HEADER_LENGTH:] = Frame.ZERO_PADDING
+        return self
+
+    def payload(self):
+        """
+        :return: a memoryview of the 64 byte payload without the report_id
+        """
+        return memoryview(self.buffer)[1:]
+
+    def unpack(self):
+        """
+        :return: the fields of the frame as tuple of (prefix, request type, intermediate, audio feature, value)
+        """
+        return struct.unpack_from(Frame.HEADER_FORMAT, self.buffer, 1)
+
+    def find_value(self, request_frame):
+        """
+        Find the value read by the given read request in this frame (read back from the G6).
+        The response is expected to repeat the header of the read request (prefix, request type, intermediate and audio
+        feature) at the same offsets, followed by the 4 byte value word. Any other frame is rejected, wherever else the
+        intermediate and the audio feature might occur in it. This layout is assumed from the captures of the requests
+        only (see Audio.build_frames_read()) and has not been verified against a response of a real G6.
+        :param request_frame: the read request frame, which has been sent to the G6
+        :return: the value word as integer (see g6_encoder.decode_value()) or None, if the frame is not the response
+        """
+        if not self.is_response_to(request_frame):
+            return None
+        return self.unpack()[4]
+
+    def is_response_to(self, request_frame):
+        """
+        Checks, whether this frame (read back from the G6) acknowledges the given request frame.
+        The G6 is expected to acknowledge a report by echoing its prefix, request type, intermediate and audio feature.
+        This echo is modelled by the SimulatedG6 only and has not been verified against a capture of a real G6 yet.
+        :param request_frame: the frame, which has been sent to the G6
+        :return: true, if this frame is the acknowledgement of the request frame
+        """
+        return self.unpack()[:4] == request_frame.unpack()[:4]
+
+    def to_hex_line(self):
+        """
+        :return: the 64 byte payload as hex-line of 128 characters
+        """
+        return self.buffer[1:].hex()
+
+    @staticmethod
+    def from_hex_line(hex_line):
+        """
+        Create a frame from a hex-line, as captured in the payload files.
+        :param hex_line: the 64 byte payload as hex-line of 128 characters
+        :return: the new frame
+        """
+        try:
+            payload = bytes.fromhex(hex_line)
+        except ValueError:
+            payload = b''
+        if len(payload) != Frame.PAYLOAD_LENGTH:
+            raise ValueError(f'The hex_line should consist of {Frame.PAYLOAD_LENGTH * 2} hex characters, '
+                             f'but was \'{hex_line}\'!')
+        return Frame.from_payload(payload)
+
+    @staticmethod
+    def from_payload(payload):
+        """
+        Create a frame from a payload, e.g. as read back from the G6. Shorter payloads are padded with zeros.
+        :param payload: the payload as bytes-like object or list of integers of up to 64 bytes
+        :return: the new frame
+        """
+        payload = bytes(payload[:Frame.PAYLOAD_LENGTH])
+        frame = Frame()
+        frame.buffer[1:1 + len(payload)] = payload
+        return frame
+
+    @staticmethod
+    def from_buffer(buffer):
+        """
+        Create a frame, which is backed by the given buffer instead of a copy of it, e.g. a record of the FrameTable.
+        A frame backed by a read-only buffer must not be packed.
+        :param buffer: the bytes-like object of 65 bytes, the report_id followed by the payload
+        :return: the new frame
+        """
+        if len(buffer) != Frame.LENGTH:
+            raise ValueError(f'The buffer should consist of {Frame.LENGTH} bytes, but was {len(buffer)} bytes long!')
+        frame = Frame.__new__(Frame)
+        frame.buffer = buffer
+        return frame
+
+
+class Acknowledgement:
+    """
+    The result of a single report sent to the G6: whether the G6 acknowledged it and how long it took.
+    """
+
+    def __init__(self, request_frame, status, latency_seconds, response_frame=None):
+        """
+        :param request_frame: the frame, which has been sent to the G6
+        :param status: the ResponseStatusEnum value
+        :param latency_seconds: the time between sending the request and reading its acknowledgement (or giving up)
+        :param response_frame: the acknowledging frame read back from the G6, if any
+        """
+        self.request_frame = request_frame
+        self.status = status
+        self.latency_seconds = latency_seconds
+        self.response_frame = response_frame
+
+    def is_acknowledged(self):
+        return self.status is ResponseStatusEnum.ACKNOWLEDGED
+
+    def __str__(self):
+        request = self.request_frame.to_hex_line()[:12]
+        if self.is_acknowledged():
+            return f'{request}: acknowledged after {self.latency_seconds * 1000:.3f} ms'
+        if self.status is ResponseStatusEnum.UNCONFIRMED:
+            return f'{request}: acknowledgement not awaited'
+        return f'{request}: no acknowledgement within {self.latency_seconds * 1000:.3f} ms'
+
+
 class Audio:
-    def __init__(self, payload_number_values_hex_path):
+    def __init__(self, frame_table=None):
+        """
+        :param frame_table: the precompiled FrameTable (see g6_table.py) to look up the frames in, instead of building
+                            them. Frames, which are not part of the table, are built anyway.
+        """
+        self.frame_table = frame_table
         # define static hex values
         self.static_dict = {
             StaticsEnum.PREFIX: 0x5a,
@@ -63,37 +225,13 @@ class Audio:
                                                                 0x00000040),
             AudioFeatureEnum.DIALOG_PLUS: AudioFeature(0x02, 0x03)
         }
-        # parse number hex values
-        self.number_value_dict = {}
-        hex_lines = read_payload_as_hex_lines(payload_number_values_hex_path)
-        # check the file's number of lines
-        expected_line_count = 202
-        if not len(hex_lines) == expected_line_count:
-            raise RuntimeError(
-                f"The file {payload_number_values_hex_path} seems to be corrupted, since it does not contain the "
-                f"expected {expected_line_count} lines! Aborting execution.")
-        # read from every even line, which is a 'Data' line containing a number's value (from 0-100)
-        expected_line_length = 128
-        for i in range(0, len(hex_lines), 2):
-            hex_line = hex_lines[i]
-            # check hex_line length
-            if len(hex_line) != expected_line_length:
-                raise RuntimeError(f"The file {payload_number_values_hex_path} seems to be corrupted."
-                                   f"Expected the hex_line '{hex_lines}' to have a length of {expected_line_length} "
-                                   f"characters, but it had {len(hex_line)} characters!")
-            # check hex_line containing Data request type ('1207')
-            if not hex_line.__contains__(self.__to_hex_str(self.request_type_dict[RequestTypeEnum.DATA])):
-                raise RuntimeError(f"The file {payload_number_values_hex_path} seems to be corrupted."
-                                   f"The hex_line '{hex_lines}' does not contain the expected 'DATA' request type:"
-                                   f" '{str(self.request_type_dict[RequestTypeEnum.DATA])}'!")
-            self.number_value_dict[int(i / 2)] = int(hex_line[12:20], 16)
 
-    def build_hex_lines_toggle(self, audio_feature_enum, enabled):
+    def build_frames_toggle(self, audio_feature_enum, enabled):
         """
-        Build a list of 64 byte hex-line commands for the given AudioFeature's toggle.
-        :param audio_feature_enum: the enum value of the AudioFeature to build the hex-line for
+        Build a DATA and a COMMIT frame for the given AudioFeature's toggle.
+        :param audio_feature_enum: the enum value of the AudioFeature to build the frames for
         :param enabled: the boolean value, whether to enable or disable the AudioFeature.
-        :return: a list of hex-line commands, designated being sent to the G6.
+        :return: a list of frames, designated being sent to the G6.
         """
         if type(audio_feature_enum) is not AudioFeatureEnum:
             raise ValueError(f'Argument \'audio_feature_enum\' should be of type \'{type(AudioFeatureEnum)}\','
@@ -101,45 +239,49 @@ class Audio:
         if type(enabled) is not bool:
             raise ValueError(f'Argument \'enabled\' should be of type \'{type(bool)}\','
                              f' but was \'{type(enabled)}\'!')
+        frames = self.__lookup_frames(audio_feature_enum, KIND_TOGGLE, int(enabled))
+        if frames is not None:
+            return frames
 
         audio_feature_hex = self.audio_feature_dict[audio_feature_enum].toggle_hex
-        value_hex = self.number_value_dict[100] if enabled else self.number_value_dict[0]
+        value_hex = encode_value(100) if enabled else encode_value(0)
 
         return [
-            self.__build_hex_line(RequestTypeEnum.DATA, audio_feature_hex, value_hex),
-            self.__build_hex_line(RequestTypeEnum.COMMIT, audio_feature_hex, 0)
+            self.__build_frame(RequestTypeEnum.DATA, audio_feature_hex, value_hex),
+            self.__build_frame(RequestTypeEnum.COMMIT, audio_feature_hex, 0)
         ]
 
-    def build_hex_lines_slider(self, audio_feature_enum, value):
+    def build_frames_slider(self, audio_feature_enum, value):
         """
-        Build a list of 64 byte hex-line commands for the given AudioFeature's slider value.
-        :param audio_feature_enum: the enum value of the AudioFeature to build the hex-line for
-        :param value: the integer value for the slider of the corresponding AudioFeature (0 - 100)
-        :return: a list of hex-line commands, designated being sent to the G6.
+        Build a DATA and a COMMIT frame for the given AudioFeature's slider value.
+        :param audio_feature_enum: the enum value of the AudioFeature to build the frames for
+        :param value: the int or float value for the slider of the corresponding AudioFeature (0 - 100)
+        :return: a list of frames, designated being sent to the G6.
         """
         if type(audio_feature_enum) is not AudioFeatureEnum:
             raise ValueError(f'Argument \'audio_feature_enum\' should be of type \'{type(AudioFeatureEnum)}\','
                              f' but was \'{type(audio_feature_enum)}\'!')
-        if type(value) is not int:
-            raise ValueError(f'Argument \'value\' should be of type \'{type(int)}\','
-                             f' but was \'{type(value)}\'!')
-        if value < 0 or value > 100:
-            raise ValueError(f'Argument \'value\' should be between \'0\' and \'100\', but was \'{value}\'!')
+
+        # only the integer slider values are part of the frame table
+        if type(value) is int:
+            frames = self.__lookup_frames(audio_feature_enum, KIND_SLIDER, value)
+            if frames is not None:
+                return frames
 
         audio_feature_hex = self.audio_feature_dict[audio_feature_enum].slider_hex
-        value_hex = self.number_value_dict[value]
+        value_hex = encode_value(value)
 
         return [
-            self.__build_hex_line(RequestTypeEnum.DATA, audio_feature_hex, value_hex),
-            self.__build_hex_line(RequestTypeEnum.COMMIT, audio_feature_hex, 0)
+            self.__build_frame(RequestTypeEnum.DATA, audio_feature_hex, value_hex),
+            self.__build_frame(RequestTypeEnum.COMMIT, audio_feature_hex, 0)
         ]
 
-    def build_hex_lines_slider_special(self, audio_feature_enum, audio_feature_special_value_enum):
+    def build_frames_slider_special(self, audio_feature_enum, audio_feature_special_value_enum):
         """
-        Build a list of 64 byte hex-line commands for the given AudioFeature's slider special value.
-        :param audio_feature_enum: the enum value of the AudioFeature to build the hex-line for
+        Build a DATA and a COMMIT frame for the given AudioFeature's slider special value.
+        :param audio_feature_enum: the enum value of the AudioFeature to build the frames for
         :param audio_feature_special_value_enum: the value to set as AudioFeatureSpecialValueEnum enum value
-        :return: a list of hex-line commands, designated being sent to the G6.
+        :return: a list of frames, designated being sent to the G6.
         """
         if type(audio_feature_enum) is not AudioFeatureEnum:
             raise ValueError(f'Argument \'audio_feature_enum\' should be of type \'{type(AudioFeatureEnum)}\','
@@ -148,6 +290,9 @@ class Audio:
             raise ValueError(f'Argument \'audio_feature_special_value_enum\' should be of type '
                              f'\'{type(AudioFeatureSpecialValueEnum)}\','
                              f' but was \'{type(audio_feature_special_value_enum)}\'!')
+        frames = self.__lookup_frames(audio_feature_enum, KIND_SLIDER_SPECIAL, audio_feature_special_value_enum.value)
+        if frames is not None:
+            return frames
 
         if audio_feature_enum is AudioFeatureEnum.SMART_VOLUME and \
                 (audio_feature_special_value_enum is AudioFeatureSpecialValueEnum.SMART_VOLUME_NIGHT
@@ -161,11 +306,163 @@ class Audio:
                              f'audio_feature_special_value_enum \'{audio_feature_special_value_enum}\'!')
 
         return [
-            self.__build_hex_line(RequestTypeEnum.DATA, audio_feature_hex, value_hex),
-            self.__build_hex_line(RequestTypeEnum.COMMIT, audio_feature_hex, 0)
+            self.__build_frame(RequestTypeEnum.DATA, audio_feature_hex, value_hex),
+            self.__build_frame(RequestTypeEnum.COMMIT, audio_feature_hex, 0)
         ]
 
-    def __build_hex_line(self, request_type_enum, audio_feature_hex, value_hex):
+    def build_frames_read(self, audio_feature_enum):
+        """
+        Build the frames to read back the current toggle and slider values of the given AudioFeature from the G6.
+        A read request is assumed to be the COMMIT report of the audio feature: '1103' means 3 bytes of data (0196 +
+        audio feature) follow, while a DATA report '1207' carries 7 bytes (0196 + audio feature + 4 byte value).
+        This is derived from the captured requests only: no capture shows a response of the G6, so it has not been
+        verified, that the G6 answers a COMMIT report by the current value. Note, that an echo of the read request
+        would look like the value 0.
+        :param audio_feature_enum: the enum value of the AudioFeature to build the frames for
+        :return: a list of tuples (slot name, audio feature hex, frame). The slot name is either 'toggle', 'slider'
+                 or 'slider_special'.
+        """
+        if type(audio_feature_enum) is not AudioFeatureEnum:
+            raise ValueError(f'Argument \'audio_feature_enum\' should be of type \'{type(AudioFeatureEnum)}\','
+                             f' but was \'{type(audio_feature_enum)}\'!')
+
+        audio_feature = self.audio_feature_dict[audio_feature_enum]
+        slots = [('toggle', audio_feature.toggle_hex), ('slider', audio_feature.slider_hex)]
+        if isinstance(audio_feature, AudioFeatureExtended):
+            slots.append(('slider_special', audio_feature.slider_special_hex))
+        return [(slot_name, audio_feature_hex, self.__build_frame(RequestTypeEnum.COMMIT, audio_feature_hex, 0))
+                for slot_name, audio_feature_hex in slots]
+
+    def decode_slider_special(self, audio_feature_enum, value_hex):
+        """
+        Decode the value of a slider special register, as read back from the G6.
+        :param audio_feature_enum: the enum value of the AudioFeature
+        :param value_hex: the value word as read back from the G6
+        :return: the AudioFeatureSpecialValueEnum value or None, if no special value is set
+        """
+        audio_feature = self.audio_feature_dict[audio_feature_enum]
+        if value_hex == audio_feature.slider_special_enabled_value_hex:
+            return AudioFeatureSpecialValueEnum.SMART_VOLUME_LOUD
+        if value_hex == audio_feature.slider_special_disabled_value_hex:
+            return AudioFeatureSpecialValueEnum.SMART_VOLUME_NIGHT
+        return None
+
+    def build_frame_pairs(self, commands, as_numpy=False, with_report_id=False):
+        """
+        Build the DATA and the COMMIT frame of many commands at once into a single contiguous buffer, e.g. to generate
+        lookup tables, ramps or fuzzing input. Unlike the single builders, the commands are validated once per batch,
+        all values are encoded by a single struct call and the audio features and values are written by strided slice
+        assignments into a buffer of repeated frame templates. The frame table is not used.
+        :param commands: a sequence of tuples (audio_feature_enum, kind, value) with the kinds of g6_table.py:
+                         KIND_TOGGLE (value: bool), KIND_SLIDER (value: int or float, 0 - 100) or KIND_SLIDER_SPECIAL
+                         (value: AudioFeatureSpecialValueEnum)
+        :param as_numpy: whether to return a NumPy uint8 array of the shape (N, 2, record length) instead of bytes.
+                         NumPy is optional and only imported, if required.
+        :param with_report_id: whether every record starts with the report_id like Frame.buffer (65 bytes), instead
+                               of being the bare 64 byte payload
+        :return: the records of the DATA and the COMMIT frame of every command, one after another
+        """
+        commands = list(commands)
+        audio_feature_enums, kinds, values = zip(*commands) if commands else ((), (), ())
+
+        # validate the batch
+        registers = {}
+        special_value_words = {}
+        for audio_feature_enum, audio_feature in self.audio_feature_dict.items():
+            registers[(audio_feature_enum, KIND_TOGGLE)] = audio_feature.toggle_hex
+            registers[(audio_feature_enum, KIND_SLIDER)] = audio_feature.slider_hex
+            if isinstance(audio_feature, AudioFeatureExtended):
+                registers[(audio_feature_enum, KIND_SLIDER_SPECIAL)] = audio_feature.slider_special_hex
+                special_value_words[(audio_feature_enum, AudioFeatureSpecialValueEnum.SMART_VOLUME_LOUD)] = \
+                    audio_feature.slider_special_enabled_value_hex
+                special_value_words[(audio_feature_enum, AudioFeatureSpecialValueEnum.SMART_VOLUME_NIGHT)] = \
+                    audio_feature.slider_special_disabled_value_hex
+        unknown_commands = set(zip(audio_feature_enums, kinds)) - registers.keys()
+        if unknown_commands:
+            raise ValueError(f'Unexpected combinations of audio_feature_enum and kind: '
+                             f'{sorted(map(str, unknown_commands))}!')
+        toggle_types = {type(value) for kind, value in zip(kinds, values) if kind == KIND_TOGGLE}
+        if not toggle_types <= {bool}:
+            raise ValueError(f'The toggle values should be of type \'{bool}\', but were {toggle_types}!')
+        slider_values = [value for kind, value in zip(kinds, values) if kind == KIND_SLIDER]
+        slider_types = {type(value) for value in slider_values}
+        if not slider_types <= {int, float}:
+            raise ValueError(f'The slider values should be of type \'{int}\' or \'{float}\', but were '
+                             f'{slider_types}!')
+        if slider_values and (min(slider_values) < VALUE_MIN or max(slider_values) > VALUE_MAX):
+            raise ValueError(f'The slider values should be between \'{VALUE_MIN}\' and \'{VALUE_MAX}\', but were '
+                             f'between \'{min(slider_values)}\' and \'{max(slider_values)}\'!')
+        unknown_special_values = {(audio_feature_enum, value) for audio_feature_enum, kind, value in commands
+                                  if kind == KIND_SLIDER_SPECIAL} - special_value_words.keys()
+        if unknown_special_values:
+            raise ValueError(f'Unexpected combinations of audio_feature_enum and audio_feature_special_value_enum: '
+                             f'{sorted(map(str, unknown_special_values))}!')
+
+        # encode all values as little-endian float32 of value/100 (see g6_encoder.encode_value()) in a single call.
+        # A toggle is the value 100 or 0, a special value word is taken over as the float it consists of.
+        special_values = {key: struct.unpack('<f', struct.pack('>I', word))[0]
+                          for key, word in special_value_words.items()}
+        value_bytes = struct.pack(f'<{len(commands)}f', *[
+            value / 100 if kind == KIND_SLIDER
+            else (1.0 if value else 0.0) if kind == KIND_TOGGLE
+            else special_values[(audio_feature_enum, value)]
+            for audio_feature_enum, kind, value in commands])
+        register_bytes = bytes(map(registers.__getitem__, zip(audio_feature_enums, kinds)))
+
+        # a DATA and a COMMIT template per command, the audio feature and the value are written into them
+        payload_offset = 1 if with_report_id else 0
+        record_length = Frame.PAYLOAD_LENGTH + payload_offset
+        pair_length = 2 * record_length
+        template = self.__build_frame(RequestTypeEnum.DATA, 0, 0).buffer[1 - payload_offset:] \
+            + self.__build_frame(RequestTypeEnum.COMMIT, 0, 0).buffer[1 - payload_offset:]
+        buffer = bytearray(template * len(commands))
+        # the audio feature follows the prefix, the request type and the intermediate, the value follows the feature
+        audio_feature_offset = payload_offset + struct.calcsize('>BHH')
+        buffer[audio_feature_offset::pair_length] = register_bytes
+        buffer[record_length + audio_feature_offset::pair_length] = register_bytes
+        for index in range(4):
+            buffer[audio_feature_offset + 1 + index::pair_length] = value_bytes[index::4]
+
+        if as_numpy:
+            # NumPy is optional: the array is a view of the packed buffer
+            import numpy
+            return numpy.frombuffer(buffer, dtype=numpy.uint8).reshape(len(commands), 2, record_length)
+        return bytes(buffer)
+
+    def build_hex_lines_toggle(self, audio_feature_enum, enabled):
+        """
+        Build a list of 64 byte hex-line commands for the given AudioFeature's toggle. See build_frames_toggle().
+        """
+        return [frame.to_hex_line() for frame in self.build_frames_toggle(audio_feature_enum, enabled)]
+
+    def build_hex_lines_slider(self, audio_feature_enum, value):
+        """
+        Build a list of 64 byte hex-line commands for the given AudioFeature's slider value. See
+        build_frames_slider().
+        """
+        return [frame.to_hex_line() for frame in self.build_frames_slider(audio_feature_enum, value)]
+
+    def build_hex_lines_slider_special(self, audio_feature_enum, audio_feature_special_value_enum):
+        """
+        Build a list of 64 byte hex-line commands for the given AudioFeature's slider special value. See
+        build_frames_slider_special().
+        """
+        return [frame.to_hex_line() for frame in
+                self.build_frames_slider_special(audio_feature_enum, audio_feature_special_value_enum)]
+
+    def __lookup_frames(self, audio_feature_enum, kind, value_index):
+        """
+        Look up the DATA and the COMMIT frame in the frame table, backed by the mapped table instead of a copy.
+        :return: a list of frames or None, if there is no frame table or it does not contain the frames
+        """
+        if self.frame_table is None:
+            return None
+        pair = self.frame_table.get_pair(audio_feature_enum.value, kind, value_index)
+        if pair is None:
+            return None
+        return [Frame.from_buffer(pair[0]), Frame.from_buffer(pair[1])]
+
+    def __build_frame(self, request_type_enum, audio_feature_hex, value_hex):
         if type(request_type_enum) is not RequestTypeEnum:
             raise ValueError(f'Argument \'request_type_enum\' should be of type \'{type(RequestTypeEnum)}\','
                              f' but was \'{type(request_type_enum)}\'!')
@@ -176,26 +473,104 @@ class Audio:
             raise ValueError(f'Argument \'value_hex\' should be of type \'{type(int)}\','
                              f' but was \'{type(value_hex)}\'!')
 
-        static_prefix = self.__to_hex_str(self.static_dict[StaticsEnum.PREFIX]).zfill(2)
-        request_type = self.__to_hex_str(self.request_type_dict[request_type_enum]).zfill(4)
-        static_intermediate = self.__to_hex_str(self.static_dict[StaticsEnum.INTERMEDIATE]).zfill(4)
-        audio_feature = self.__to_hex_str(audio_feature_hex).zfill(2)
-        value = self.__to_hex_str(value_hex).zfill(8)
+        return Frame().pack(self.static_dict[StaticsEnum.PREFIX],
+                            self.request_type_dict[request_type_enum],
+                            self.static_dict[StaticsEnum.INTERMEDIATE],
+                            audio_feature_hex,
+                            value_hex)
 
-        assembled = f'{static_prefix}{request_type}{static_intermediate}{audio_feature}{value}'
-        assembled_len = len(assembled)
-        if assembled_len != 20:
-            raise RuntimeError(f'The assembled hex_line part should have 20 characters, but it'
-                               f' had {assembled_len}: \'{assembled}\'!')
 
-        hex_line = assembled + '0' * 108
-        hex_line_len = len(hex_line)
-        if hex_line_len != 128:
-            raise RuntimeError(f'The assembled hex_line should have 128 characters, but it'
-                               f' had {hex_line_len}: \'{hex_line}\'!')
+class AudioBatch:
+    """
+    Plans a set of audio feature changes into a single burst of reports.
 
-        return hex_line
+    Every change is remembered per feature and per slot (toggle or slider). Writing the same slot twice keeps only the
+    last value, and a smart-volume special value supersedes a smart-volume slider value (and vice versa). The DATA
+    reports are ordered by feature, the toggle before the slider, followed by all COMMIT reports at once. That the G6
+    accepts this order is an assumption: the captures only show SoundBlaster Connect sending a DATA report directly
+    followed by its COMMIT report, and the all-DATA-then-all-COMMIT order has not been verified on a real G6.
+    """
+    SLOT_TOGGLE = 0
+    SLOT_SLIDER = 1
 
-    @staticmethod
-    def __to_hex_str(int_value):
-        return format(int_value, 'x')
+    def __init__(self, audio):
+        """
+        :param audio: An instance of the class Audio to build the frames with.
+        """
+        self.audio = audio
+        self.__changes = {}
+
+    def add_toggle(self, audio_feature_enum, enabled):
+        """
+        Plan to enable or disable the given AudioFeature.
+        :param audio_feature_enum: the enum value of the AudioFeature to toggle
+        :param enabled: the boolean value, whether to enable or disable the AudioFeature.
+        """
+        frames = self.audio.build_frames_toggle(audio_feature_enum, enabled)
+        self.__add(audio_feature_enum, AudioBatch.SLOT_TOGGLE, enabled, frames)
+
+    def add_slider(self, audio_feature_enum, value):
+        """
+        Plan to set the slider value of the given AudioFeature.
+        :param audio_feature_enum: the enum value of the AudioFeature to set the slider for
+        :param value: the value for the slider of the corresponding AudioFeature (0 - 100)
+        """
+        frames = self.audio.build_frames_slider(audio_feature_enum, value)
+        self.__add(audio_feature_enum, AudioBatch.SLOT_SLIDER, value, frames)
+
+    def add_slider_special(self, audio_feature_enum, audio_feature_special_value_enum):
+        """
+        Plan to set the slider special value of the given AudioFeature.
+        :param audio_feature_enum: the enum value of the AudioFeature to set the slider special value for
+        :param audio_feature_special_value_enum: the value to set as AudioFeatureSpecialValueEnum enum value
+        """
+        frames = self.audio.build_frames_slider_special(audio_feature_enum, audio_feature_special_value_enum)
+        self.__add(audio_feature_enum, AudioBatch.SLOT_SLIDER, audio_feature_special_value_enum, frames)
+
+    def add_frames(self, audio_feature_enum, slot, value, frames):
+        """
+        Plan a change by its prebuilt DATA and COMMIT frame, e.g. of a compiled profile (see g6_profile.py).
+        :param audio_feature_enum: the enum value of the AudioFeature of the change
+        :param slot: the slot of the change, either AudioBatch.SLOT_TOGGLE or AudioBatch.SLOT_SLIDER
+        :param value: the value of the change as returned by get_changes()
+        :param frames: the list of the DATA and the COMMIT frame of the change
+        """
+        self.__add(audio_feature_enum, slot, value, frames)
+
+    def __add(self, audio_feature_enum, slot, value, frames):
+        self.__changes[(audio_feature_enum.value, slot)] = (audio_feature_enum, slot, value, frames)
+
+    def discard(self, audio_feature_enum, slot):
+        """
+        Remove a planned change again, e.g. because the device is already set to the planned value.
+        :param audio_feature_enum: the enum value of the AudioFeature of the change
+        :param slot: the slot of the change, either AudioBatch.SLOT_TOGGLE or AudioBatch.SLOT_SLIDER
+        """
+        self.__changes.pop((audio_feature_enum.value, slot), None)
+
+    def get_changes(self):
+        """
+        :return: the list of planned changes as tuples of (audio_feature_enum, slot, value) in sending order. The value
+                 is either a bool (toggle), an int or float (slider) or an AudioFeatureSpecialValueEnum (slider).
+        """
+        return [self.__changes[key][:3] for key in sorted(self.__changes.keys())]
+
+    def is_empty(self):
+        return len(self.__changes) == 0
+
+    def build_frames(self):
+        """
+        Build the planned burst of reports: all DATA frames first, followed by all COMMIT frames.
+        :return: a tuple of (data frames, commit frames)
+        """
+        data_frames = []
+        commit_frames = []
+        commit_payloads = set()
+        for key in sorted(self.__changes.keys()):
+            data_frame, commit_frame = self.__changes[key][3]
+            data_frames.append(data_frame)
+            commit_payload = bytes(commit_frame.buffer)
+            if commit_payload not in commit_payloads:
+                commit_payloads.add(commit_payload)
+                commit_frames.append(commit_frame)
+        return data_frames, commit_frames
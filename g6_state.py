@@ -0,0 +1,88 @@
+import json
+
+from g6_spec import AudioBatch, AudioFeatureEnum, AudioFeatureSpecialValueEnum
+from g6_util import write_text_file_atomically
+
+
+class DeviceState:
+    """
+    The shadow state of the G6: the output and the audio feature settings, which have been written successfully to the
+    device lately. It is persisted as JSON file, so that redundant writes can be skipped in subsequent runs.
+
+    Every audio feature has a toggle (bool) and a slider. The slider is either a value (0 - 100) or, in case of
+    Smart-Volume, the name of an AudioFeatureSpecialValueEnum. Settings, which are unknown, are None.
+    """
+    SLOT_NAMES = {
+        AudioBatch.SLOT_TOGGLE: 'toggle',
+        AudioBatch.SLOT_SLIDER: 'slider'
+    }
+
+    def __init__(self, state_file_path):
+        """
+        :param state_file_path: the path to the JSON file to persist the state in
+        """
+        self.state_file_path = state_file_path
+        self.output = None
+        self.audio_features = {audio_feature_enum: {'toggle': None, 'slider': None}
+                               for audio_feature_enum in AudioFeatureEnum}
+
+    @staticmethod
+    def load(state_file_path):
+        """
+        Load the state from the given file. If the file does not exist or is corrupted, all settings are unknown.
+        :param state_file_path: the path to the JSON file, the state has been persisted in
+        :return: the loaded DeviceState
+        """
+        state = DeviceState(state_file_path)
+        try:
+            with open(state_file_path, 'r') as file:
+                state_dict = json.load(file)
+            state.output = state_dict.get('output')
+            for audio_feature_enum in AudioFeatureEnum:
+                audio_feature_dict = state_dict.get('audio_features', {}).get(audio_feature_enum.name, {})
+                for slot_name in DeviceState.SLOT_NAMES.values():
+                    state.audio_features[audio_feature_enum][slot_name] = audio_feature_dict.get(slot_name)
+        except (OSError, ValueError, AttributeError):
+            return DeviceState(state_file_path)
+        return state
+
+    def save(self):
+        """
+        Persist the state to its file. The file is replaced atomically, so that concurrent readers (e.g. the fast path
+        in g6_fast.py) never read a partially written state.
+        """
+        write_text_file_atomically(self.state_file_path, json.dumps(self.to_dict(), indent=2))
+
+    def to_dict(self):
+        return {
+            'output': self.output,
+            'audio_features': {audio_feature_enum.name: dict(slots)
+                               for audio_feature_enum, slots in self.audio_features.items()}
+        }
+
+    def get_audio_feature(self, audio_feature_enum, slot):
+        """
+        :param audio_feature_enum: the enum value of the AudioFeature
+        :param slot: either AudioBatch.SLOT_TOGGLE or AudioBatch.SLOT_SLIDER
+        :return: the last written value of the slot or None, if it is unknown
+        """
+        value = self.audio_features[audio_feature_enum][DeviceState.SLOT_NAMES[slot]]
+        if isinstance(value, str) and value in AudioFeatureSpecialValueEnum.__members__:
+            return AudioFeatureSpecialValueEnum[value]
+        return value
+
+    def set_audio_feature(self, audio_feature_enum, slot, value):
+        """
+        :param audio_feature_enum: the enum value of the AudioFeature
+        :param slot: either AudioBatch.SLOT_TOGGLE or AudioBatch.SLOT_SLIDER
+        :param value: the just written value: a bool, an int or float or an AudioFeatureSpecialValueEnum
+        """
+        if isinstance(value, AudioFeatureSpecialValueEnum):
+            value = value.name
+        self.audio_features[audio_feature_enum][DeviceState.SLOT_NAMES[slot]] = value
+
+    def __str__(self):
+        lines = [f'Output: {self.output}']
+        for audio_feature_enum, slots in self.audio_features.items():
+            lines.append(f'{audio_feature_enum.name}: toggle={slots["toggle"]}, slider={slots["slider"]}')
+        return '\n'.join(lines)
@@ -0,0 +1,267 @@
+import argparse
+import os
+import stat
+import sys
+import threading
+import time
+
+from g6_cli import device_send_audio_batch, device_set_output, get_state_file_path, parse_slider_value
+from g6_encoder import VALUE_MAX, VALUE_MIN
+from g6_fast import LOCK_FILE_EXTENSION, OUTPUT_HEADPHONES, OUTPUT_SPEAKERS
+from g6_profile import AUDIO_FEATURE_NAMES
+from g6_spec import AudioBatch, AudioFeatureEnum, AudioFeatureSpecialValueEnum
+from g6_state import DeviceState
+from g6_util import FileLock
+
+# The stream to read the commands from, if '--stream' is given without a file
+STREAM_STDIN = '-'
+# The words of the stream commands, e.g. 'bass 42', 'surround on', 'smart-volume night' or 'output headphones'
+STREAM_FEATURE_NAMES = {name.lower(): audio_feature_enum for name, audio_feature_enum in AUDIO_FEATURE_NAMES.items()}
+STREAM_TOGGLE_VALUES = {'on': True, 'enabled': True, 'off': False, 'disabled': False}
+STREAM_SPECIAL_VALUES = {
+    'night': AudioFeatureSpecialValueEnum.SMART_VOLUME_NIGHT,
+    'loud': AudioFeatureSpecialValueEnum.SMART_VOLUME_LOUD
+}
+STREAM_OUTPUTS = {'speakers': OUTPUT_SPEAKERS, 'headphones': OUTPUT_HEADPHONES}
+STREAM_OUTPUT_COMMAND = 'output'
+
+
+class StreamCommand:
+    """
+    A single command read from the stream: the setting it changes (its key), the value and the time it has been read.
+    Commands with the same key supersede each other. A smart-volume special value and the smart-volume slider share
+    their key, like in the AudioBatch.
+    """
+
+    def __init__(self, audio_feature_enum, slot, value, received):
+        """
+        :param audio_feature_enum: the enum value of the AudioFeature or None for the output
+        :param slot: AudioBatch.SLOT_TOGGLE or AudioBatch.SLOT_SLIDER or None for the output
+        :param value: a bool (toggle), an int or float (slider), an AudioFeatureSpecialValueEnum (slider) or the
+                      output
+        :param received: the time the command has been read as time.perf_counter() value
+        """
+        self.audio_feature_enum = audio_feature_enum
+        self.slot = slot
+        self.value = value
+        self.received = received
+        self.key = STREAM_OUTPUT_COMMAND if audio_feature_enum is None else (audio_feature_enum.value, slot)
+
+    def __str__(self):
+        if self.audio_feature_enum is None:
+            return f'output={self.value}'
+        value = self.value.name if isinstance(self.value, AudioFeatureSpecialValueEnum) else self.value
+        return f'{self.audio_feature_enum.name} {DeviceState.SLOT_NAMES[self.slot]}={value}'
+
+
+def parse_stream_command(line):
+    """
+    Parse a line of the stream, e.g. 'bass 42', 'bass 42.5', 'surround on', 'smart-volume night' or
+    'output headphones'. The values of the sliders are parsed like the slider arguments of the CLI (see
+    parse_slider_value()).
+    The words are case-insensitive. Empty lines and comments (starting with '#') are ignored.
+    Raises a ValueError, if the line is not a valid command.
+    :param line: the line to parse
+    :return: the StreamCommand or None, if the line is empty or a comment
+    """
+    words = line.strip().lower().split()
+    if not words or words[0].startswith('#'):
+        return None
+    if len(words) != 2:
+        raise ValueError(f'Expected a command like \'bass 42\', but was \'{line.strip()}\'!')
+    name, value = words
+    received = time.perf_counter()
+    if name == STREAM_OUTPUT_COMMAND:
+        if value not in STREAM_OUTPUTS:
+            raise ValueError(f'Expected one of the outputs {list(STREAM_OUTPUTS.keys())}, but was \'{value}\'!')
+        return StreamCommand(None, None, STREAM_OUTPUTS[value], received)
+    audio_feature_enum = STREAM_FEATURE_NAMES.get(name.replace('_', '-'))
+    if audio_feature_enum is None:
+        raise ValueError(f'Expected one of the audio features {list(STREAM_FEATURE_NAMES.keys())} or '
+                         f'\'{STREAM_OUTPUT_COMMAND}\', but was \'{name}\'!')
+    if value in STREAM_TOGGLE_VALUES:
+        return StreamCommand(audio_feature_enum, AudioBatch.SLOT_TOGGLE, STREAM_TOGGLE_VALUES[value], received)
+    if value in STREAM_SPECIAL_VALUES and audio_feature_enum is AudioFeatureEnum.SMART_VOLUME:
+        return StreamCommand(audio_feature_enum, AudioBatch.SLOT_SLIDER, STREAM_SPECIAL_VALUES[value], received)
+    try:
+        return StreamCommand(audio_feature_enum, AudioBatch.SLOT_SLIDER, parse_slider_value(value), received)
+    except argparse.ArgumentTypeError:
+        pass
+    raise ValueError(f'Expected \'on\', \'off\' or a value between \'{VALUE_MIN}\' and \'{VALUE_MAX}\' for '
+                     f'{audio_feature_enum.name}, but was \'{value}\'!')
+
+
+class CommandCoalescer:
+    """
+    The pending commands of a stream, which have not been sent yet. Only the newest command per setting is kept (last
+    write wins), so that the commands arriving while a burst is in flight are coalesced into the next burst, instead
+    of queueing up behind the G6.
+    """
+
+    def __init__(self):
+        self.received_count = 0
+        self.coalesced_count = 0
+        self.__condition = threading.Condition()
+        self.__pending = {}
+        self.__closed = False
+
+    def put(self, command):
+        """
+        :param command: the StreamCommand, which supersedes a pending command of the same setting
+        """
+        with self.__condition:
+            if command.key in self.__pending:
+                self.coalesced_count += 1
+            self.__pending[command.key] = command
+            self.received_count += 1
+            self.__condition.notify()
+
+    def close(self):
+        """
+        Let take() return, as soon as no commands are pending anymore.
+        """
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify()
+
+    def take(self):
+        """
+        Wait for pending commands and take all of them.
+        :return: the list of pending StreamCommands in the order of their settings' first arrival or None, if the
+                 stream has been closed and no commands are pending anymore
+        """
+        with self.__condition:
+            while not self.__pending and not self.__closed:
+                self.__condition.wait()
+            commands = list(self.__pending.values())
+            self.__pending = {}
+        return commands or None
+
+
+class StreamExecutor:
+    """
+    Applies the commands of a stream through a single opened session: a reader thread parses the lines into the
+    CommandCoalescer, while the calling thread sends the pending commands as one burst after another. Every burst is
+    sent like a CLI invocation: the device state is loaded under its lock, the settings, the device is already set to,
+    are skipped (unless forced), and the device state is saved afterwards. Thus, the final state of the G6 always
+    matches the last command of every setting.
+    """
+
+    def __init__(self, session, audio, force=False, minimal_output_payload=False):
+        """
+        :param session: The opened G6Session to send the payloads through.
+        :param audio: An instance of the class Audio from g6_spec.py
+        :param force: whether to send every setting, even if the device state tells, that it is already set.
+        :param minimal_output_payload: whether to send the minimised output payload instead of the captured payload
+        """
+        self.session = session
+        self.audio = audio
+        self.force = force
+        self.minimal_output_payload = minimal_output_payload
+        self.coalescer = CommandCoalescer()
+        self.burst_count = 0
+        # the seconds from reading a command until the burst carrying it has been sent, for every sent command
+        self.lags = []
+
+    def run(self, stream_files):
+        """
+        Read and apply the commands from the stream, until it ends.
+        :param stream_files: the iterable of text files to read the commands from one after another, line by line
+        """
+        reader = threading.Thread(target=self.read_commands, args=(stream_files,), daemon=True)
+        reader.start()
+        while True:
+            commands = self.coalescer.take()
+            if commands is None:
+                break
+            self.apply(commands)
+        reader.join()
+
+    def read_commands(self, stream_files):
+        """
+        Parse the lines of the stream into the CommandCoalescer. Invalid lines are reported and skipped.
+        """
+        try:
+            for stream_file in stream_files:
+                for line in iter(stream_file.readline, ''):
+                    try:
+                        command = parse_stream_command(line)
+                    except ValueError as ex:
+                        print(f'Invalid stream command: {ex}')
+                        continue
+                    if command is not None:
+                        self.coalescer.put(command)
+        finally:
+            self.coalescer.close()
+
+    def apply(self, commands):
+        """
+        Send the commands as a single burst: the output payload first, followed by the DATA and COMMIT reports of the
+        audio features.
+        :param commands: the list of StreamCommands, at most one per setting
+        """
+        batch = AudioBatch(self.audio)
+        output_command = None
+        for command in commands:
+            if command.audio_feature_enum is None:
+                output_command = command
+            elif command.slot == AudioBatch.SLOT_TOGGLE:
+                batch.add_toggle(command.audio_feature_enum, command.value)
+            elif isinstance(command.value, AudioFeatureSpecialValueEnum):
+                batch.add_slider_special(command.audio_feature_enum, command.value)
+            else:
+                batch.add_slider(command.audio_feature_enum, command.value)
+
+        state_file_path = get_state_file_path(self.session.serial_number)
+        with FileLock(state_file_path + LOCK_FILE_EXTENSION):
+            state = DeviceState.load(state_file_path)
+            if output_command is not None:
+                device_set_output(self.session, self.audio, output_command.value, state,
+                                  self.minimal_output_payload)
+            device_send_audio_batch(self.session, batch, state, self.force)
+            if not self.session.dry_run:
+                state.save()
+        sent = time.perf_counter()
+        self.burst_count += 1
+        self.lags += [sent - command.received for command in commands]
+        print(f'Applied: {", ".join(str(command) for command in commands)}')
+
+    def print_stats(self):
+        lags = sorted(self.lags)
+        print(f'Stream: {self.coalescer.received_count} commands received, {self.coalescer.coalesced_count} '
+              f'coalesced, {self.burst_count} bursts sent')
+        if lags:
+            print(f'Lag from reading a command until its burst has been sent: median '
+                  f'{lags[len(lags) // 2] * 1000:.3f} ms, max {lags[-1] * 1000:.3f} ms')
+
+
+def open_stream_files(stream_path):
+    """
+    Open the stream: stdin or the given file. A FIFO is opened again, whenever its last writer has closed it, so that
+    the stream only ends by an interrupt (Ctrl+C).
+    :param stream_path: the path to the file or FIFO or '-' for stdin
+    :return: the generator of the opened text files, one after another
+    """
+    if stream_path == STREAM_STDIN:
+        yield sys.stdin
+        return
+    while True:
+        with open(stream_path, 'r') as stream_file:
+            yield stream_file
+        if not stat.S_ISFIFO(os.stat(stream_path).st_mode):
+            return
+
+
+def execute_stream(session, audio, args):
+    """
+    Apply the commands of the stream given by '--stream' through the opened session, until the stream ends.
+    :param session: The opened G6Session to send the payloads through.
+    :param audio: An instance of the class Audio from g6_spec.py
+    :param args: the CLI arguments, recently parsed by argparse in parse_cli_args()
+    """
+    executor = StreamExecutor(session, audio, args.force, args.minimal_output_payload)
+    try:
+        executor.run(open_stream_files(args.stream))
+    except KeyboardInterrupt:
+        pass
+    executor.print_stats()
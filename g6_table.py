@@ -0,0 +1,183 @@
+import mmap
+import os
+import struct
+import zlib
+
+# The precompiled frame table, built by running this module: python g6_table.py
+FRAME_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'payloads', 'frames.table')
+# The header of the table: magic, version, record length, number of audio features, number of frame pairs per audio
+# feature, number of output payloads, crc32 checksum of everything following the header
+FRAME_TABLE_MAGIC = b'G6FT'
+FRAME_TABLE_VERSION = 2
+FRAME_TABLE_HEADER_FORMAT = '>4sHHHHHI'
+FRAME_TABLE_HEADER_LENGTH = struct.calcsize(FRAME_TABLE_HEADER_FORMAT)
+# The index of an output: the first record and the number of records of the output payload
+FRAME_TABLE_OUTPUT_FORMAT = '>II'
+# A record is a frame, as it is written to the G6: the report_id followed by the 64 byte payload
+RECORD_LENGTH = 65
+# The kinds of frame pairs (a DATA and a COMMIT record) of an audio feature, in the order of the table
+KIND_TOGGLE = 0
+KIND_SLIDER = 1
+KIND_SLIDER_SPECIAL = 2
+KIND_PAIR_COUNTS = {
+    KIND_TOGGLE: 2,  # disabled, enabled
+    KIND_SLIDER: 101,  # 0 - 100
+    KIND_SLIDER_SPECIAL: 2  # the values of AudioFeatureSpecialValueEnum, only set for Smart-Volume
+}
+FEATURE_PAIR_COUNT = sum(KIND_PAIR_COUNTS.values())
+# The outputs in the order of the table
+OUTPUTS = ['Speakers', 'Headphones']
+# The output payloads in the order of the table: the minimised payloads of the OUTPUTS (see g6_minimize.py and
+# '--minimal-output-payload'), followed by their payloads as captured from SoundBlaster Command
+OUTPUT_PAYLOAD_FILE_NAMES = ['set-output-to-speakers.hex', 'set-output-to-headphones.hex',
+                             'toggle-output-to-speakers.hex', 'toggle-output-to-headphones.hex']
+
+
+class FrameTable:
+    """
+    The full command space of the G6 as memory-mapped binary table: a DATA and a COMMIT frame for every toggle state,
+    slider value and special value of every audio feature, followed by the output payloads.
+
+    The table has a fixed layout, so that the frames of a command are looked up in O(1) by (audio feature, kind, value)
+    and returned as slices of the mapped file, without parsing or copying them. Layout:
+        header (see FRAME_TABLE_HEADER_FORMAT)
+        output index: (first record, record count) for each output payload (see OUTPUT_PAYLOAD_FILE_NAMES)
+        audio feature records: FEATURE_PAIR_COUNT pairs of DATA and COMMIT records for each audio feature, ordered by
+                               kind and value. Pairs without a meaning (e.g. special values of Bass) are zeroed.
+        output records
+    """
+
+    def __init__(self, table_mmap, feature_count, output_index):
+        self.__mmap = table_mmap
+        self.__view = memoryview(table_mmap)
+        self.__feature_count = feature_count
+        self.__output_index = output_index
+        self.__records_offset = FRAME_TABLE_HEADER_LENGTH \
+            + len(output_index) * struct.calcsize(FRAME_TABLE_OUTPUT_FORMAT)
+
+    @staticmethod
+    def open(frame_table_path=FRAME_TABLE_PATH):
+        """
+        Map the frame table into memory and verify its header and checksum.
+        :param frame_table_path: the path to the frame table
+        :return: the FrameTable or None, if the table does not exist, has another version or is corrupted
+        """
+        try:
+            with open(frame_table_path, 'rb') as file:
+                table_mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        try:
+            magic, version, record_length, feature_count, feature_pair_count, output_count, checksum = \
+                struct.unpack_from(FRAME_TABLE_HEADER_FORMAT, table_mmap, 0)
+            output_length = struct.calcsize(FRAME_TABLE_OUTPUT_FORMAT)
+            output_index = [struct.unpack_from(FRAME_TABLE_OUTPUT_FORMAT, table_mmap,
+                                               FRAME_TABLE_HEADER_LENGTH + i * output_length)
+                            for i in range(output_count)]
+        except struct.error:
+            table_mmap.close()
+            return None
+        record_count = feature_count * FEATURE_PAIR_COUNT * 2 + sum(count for _, count in output_index)
+        expected_length = FRAME_TABLE_HEADER_LENGTH + output_count * struct.calcsize(FRAME_TABLE_OUTPUT_FORMAT) \
+            + record_count * RECORD_LENGTH
+        if magic != FRAME_TABLE_MAGIC or version != FRAME_TABLE_VERSION or record_length != RECORD_LENGTH \
+                or feature_pair_count != FEATURE_PAIR_COUNT or output_count != len(OUTPUT_PAYLOAD_FILE_NAMES) \
+                or len(table_mmap) != expected_length \
+                or zlib.crc32(memoryview(table_mmap)[FRAME_TABLE_HEADER_LENGTH:]) != checksum:
+            table_mmap.close()
+            return None
+        return FrameTable(table_mmap, feature_count, output_index)
+
+    def close(self):
+        self.__view.release()
+        self.__mmap.close()
+
+    def get_pair(self, audio_feature_index, kind, value_index):
+        """
+        Look up the DATA and the COMMIT record of a command.
+        :param audio_feature_index: the value of the AudioFeatureEnum
+        :param kind: KIND_TOGGLE, KIND_SLIDER or KIND_SLIDER_SPECIAL
+        :param value_index: 0 or 1 for toggles, 0 - 100 for sliders or the value of the AudioFeatureSpecialValueEnum
+        :return: a tuple of (DATA record, COMMIT record) as read-only memoryviews of 65 bytes or None, if the table
+                 does not contain the command
+        """
+        if not 0 <= audio_feature_index < self.__feature_count or not 0 <= value_index < KIND_PAIR_COUNTS[kind]:
+            return None
+        pair = audio_feature_index * FEATURE_PAIR_COUNT + value_index
+        for previous_kind in range(kind):
+            pair += KIND_PAIR_COUNTS[previous_kind]
+        offset = self.__records_offset + pair * 2 * RECORD_LENGTH
+        data_record = self.__view[offset:offset + RECORD_LENGTH]
+        # zeroed pairs have no prefix
+        if data_record[1] == 0:
+            return None
+        return data_record, self.__view[offset + RECORD_LENGTH:offset + 2 * RECORD_LENGTH]
+
+    def get_output_records(self, output, minimal=False):
+        """
+        Look up the records of an output payload.
+        :param output: 'Speakers' or 'Headphones'
+        :param minimal: whether to look up the minimised payload instead of the captured payload
+        :return: the list of records as read-only memoryviews of 65 bytes
+        """
+        first_record, record_count = self.__output_index[OUTPUTS.index(output) + (0 if minimal else len(OUTPUTS))]
+        offset = self.__records_offset + first_record * RECORD_LENGTH
+        return [self.__view[offset + i * RECORD_LENGTH:offset + (i + 1) * RECORD_LENGTH] for i in range(record_count)]
+
+
+def build_frame_table(frame_table_path=FRAME_TABLE_PATH):
+    """
+    Build the frame table by the frame builders of g6_spec.py and the output payloads.
+    The table is written to a temporary file first, which replaces the table afterwards.
+    :param frame_table_path: the path to write the frame table to
+    """
+    from g6_spec import Audio, AudioFeatureEnum, AudioFeatureSpecialValueEnum, Frame
+    from g6_util import read_payload_as_hex_lines
+
+    audio = Audio()
+    zero_pair = bytes(2 * RECORD_LENGTH)
+    records = []
+    for audio_feature_enum in AudioFeatureEnum:
+        for enabled in [False, True]:
+            records += [frame.buffer for frame in audio.build_frames_toggle(audio_feature_enum, enabled)]
+        for value in range(KIND_PAIR_COUNTS[KIND_SLIDER]):
+            records += [frame.buffer for frame in audio.build_frames_slider(audio_feature_enum, value)]
+        for special_value_enum in AudioFeatureSpecialValueEnum:
+            try:
+                frames = audio.build_frames_slider_special(audio_feature_enum, special_value_enum)
+            except ValueError:
+                records.append(zero_pair)
+                continue
+            records += [frame.buffer for frame in frames]
+
+    output_index = []
+    output_records = []
+    payload_dir_path = os.path.dirname(FRAME_TABLE_PATH)
+    for payload_file_name in OUTPUT_PAYLOAD_FILE_NAMES:
+        hex_lines = read_payload_as_hex_lines(os.path.join(payload_dir_path, payload_file_name))
+        output_index.append((len(output_records), len(hex_lines)))
+        output_records += [Frame.from_hex_line(hex_line).buffer for hex_line in hex_lines]
+
+    first_output_record = len(AudioFeatureEnum) * FEATURE_PAIR_COUNT * 2
+    body = b''.join(struct.pack(FRAME_TABLE_OUTPUT_FORMAT, first_output_record + first_record, record_count)
+                    for first_record, record_count in output_index) \
+        + b''.join(bytes(record) for record in records + output_records)
+    header = struct.pack(FRAME_TABLE_HEADER_FORMAT, FRAME_TABLE_MAGIC, FRAME_TABLE_VERSION, RECORD_LENGTH,
+                         len(AudioFeatureEnum), FEATURE_PAIR_COUNT, len(OUTPUT_PAYLOAD_FILE_NAMES), zlib.crc32(body))
+    temp_file_path = frame_table_path + '.tmp'
+    with open(temp_file_path, 'wb') as file:
+        file.write(header + body)
+    os.replace(temp_file_path, frame_table_path)
+
+
+def main():
+    build_frame_table()
+    frame_table = FrameTable.open()
+    if frame_table is None:
+        raise RuntimeError(f'The built frame table {FRAME_TABLE_PATH} could not be verified!')
+    frame_table.close()
+    print(f'Built the frame table: {FRAME_TABLE_PATH} ({os.path.getsize(FRAME_TABLE_PATH)} bytes)')
+
+
+if __name__ == "__main__":
+    main()
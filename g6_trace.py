@@ -0,0 +1,263 @@
+import json
+import os
+import threading
+import time
+
+from g6_transport import Transport
+
+# The phases of an exchange with the G6, which are traced
+PHASE_ENUMERATE = 'enumerate'
+PHASE_OPEN = 'open'
+PHASE_DESCRIPTOR = 'descriptor'
+PHASE_WRITE = 'write'
+# from the first write of a burst until its first acknowledgement has been read
+PHASE_FIRST_ACK = 'first_ack'
+# from the first acknowledgement of a burst until all acknowledgements have been read (or the timeout)
+PHASE_DRAIN = 'drain'
+PHASE_CLOSE = 'close'
+PHASES = [PHASE_ENUMERATE, PHASE_OPEN, PHASE_DESCRIPTOR, PHASE_WRITE, PHASE_FIRST_ACK, PHASE_DRAIN, PHASE_CLOSE]
+# The extension of a trace file, which is written as Chrome trace-event file (chrome://tracing, Perfetto) instead of
+# JSON lines
+CHROME_TRACE_EXTENSION = '.json'
+
+
+class TraceEvent:
+    """
+    A single traced phase: its start and end on the perf_counter clock, the thread it ran in and its attributes.
+    """
+
+    def __init__(self, phase, start, end, thread_id, attributes):
+        self.phase = phase
+        self.start = start
+        self.end = end
+        self.thread_id = thread_id
+        self.attributes = attributes
+
+    def duration(self):
+        return self.end - self.start
+
+
+class Tracer:
+    """
+    Collects the timestamps of the phases of the exchanges with the G6 (see PHASES) in memory. The events are only
+    formatted, when they are written to a trace file. Tracing is optional: the G6Session and the transports are only
+    instrumented, if a Tracer is given (see TracingTransport).
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events = []
+
+    def record(self, phase, start, end, **attributes):
+        """
+        Record a phase, which has been measured by the caller.
+        :param phase: one of PHASES
+        :param start: the start of the phase as time.perf_counter() value
+        :param end: the end of the phase as time.perf_counter() value
+        :param attributes: additional attributes of the phase, e.g. the number of frames
+        """
+        # appending to a list is thread-safe, e.g. for '--all-devices'
+        self.events.append(TraceEvent(phase, start, end, threading.get_ident(), attributes))
+
+    def span(self, phase, **attributes):
+        """
+        Measure a phase by a context, e.g.
+            with tracer.span(PHASE_OPEN, path=device_path):
+                device.open_path(device_path)
+        :param phase: one of PHASES
+        :param attributes: additional attributes of the phase
+        :return: the Span to enter
+        """
+        return Span(self, phase, attributes)
+
+    def clear(self):
+        self.events = []
+
+    def write(self, trace_file_path, events=None):
+        """
+        Write the events to a trace file: a Chrome trace-event file, if the file ends with '.json', otherwise JSON
+        lines.
+        :param trace_file_path: the path to the trace file
+        :param events: the events to write. All events, if not given.
+        """
+        events = self.events if events is None else events
+        if trace_file_path.endswith(CHROME_TRACE_EXTENSION):
+            self.write_chrome_trace(trace_file_path, events)
+        else:
+            self.write_json_lines(trace_file_path, events)
+
+    def write_json_lines(self, trace_file_path, events):
+        """
+        Write one JSON object per event, e.g.
+            {"phase": "write", "start_us": 1520.3, "duration_us": 41.2, "thread": 1402..., "length": 65}
+        The start is relative to the creation of the Tracer.
+        """
+        with open(trace_file_path, 'w') as file:
+            for event in events:
+                event_dict = {
+                    'phase': event.phase,
+                    'start_us': round((event.start - self.origin) * 1e6, 3),
+                    'duration_us': round(event.duration() * 1e6, 3),
+                    'thread': event.thread_id
+                }
+                event_dict.update(event.attributes)
+                file.write(json.dumps(event_dict) + '\n')
+
+    def write_chrome_trace(self, trace_file_path, events):
+        """
+        Write the events as complete events ('ph': 'X') of the Chrome trace-event format, one track per thread.
+        """
+        pid = os.getpid()
+        trace_events = [{
+            'name': event.phase,
+            'ph': 'X',
+            'ts': round((event.start - self.origin) * 1e6, 3),
+            'dur': round(event.duration() * 1e6, 3),
+            'pid': pid,
+            'tid': event.thread_id,
+            'args': event.attributes
+        } for event in events]
+        with open(trace_file_path, 'w') as file:
+            json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, file)
+
+
+class Span:
+    """
+    Records a phase to its Tracer, from entering until leaving the context (see Tracer.span()).
+    """
+
+    def __init__(self, tracer, phase, attributes):
+        self.tracer = tracer
+        self.phase = phase
+        self.attributes = attributes
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self.attributes['error'] = str(exc_val)
+        self.tracer.record(self.phase, self.start, time.perf_counter(), **self.attributes)
+
+
+class PhaseHistogram:
+    """
+    The distribution of the durations of a phase in power-of-two buckets of microseconds, e.g. the bucket '64' counts
+    the durations from 32 us up to 64 us. Used by the daemon to aggregate the phases over all commands.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.minimum = None
+        self.maximum = None
+        self.buckets = {}
+
+    def add(self, duration):
+        """
+        :param duration: the duration of the phase in seconds
+        """
+        self.count += 1
+        self.total += duration
+        self.minimum = duration if self.minimum is None else min(self.minimum, duration)
+        self.maximum = duration if self.maximum is None else max(self.maximum, duration)
+        bucket = 1 << int(duration * 1e6).bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, fraction):
+        """
+        :param fraction: the fraction of the durations (0.0 - 1.0), e.g. 0.99 for the 99th percentile
+        :return: the upper bound of the bucket in microseconds, which contains the percentile, or None if empty
+        """
+        if self.count == 0:
+            return None
+        remaining = fraction * self.count
+        for bucket in sorted(self.buckets.keys()):
+            remaining -= self.buckets[bucket]
+            if remaining <= 0:
+                return bucket
+        return max(self.buckets.keys())
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'mean_us': round(self.total / self.count * 1e6, 3) if self.count else None,
+            'min_us': round(self.minimum * 1e6, 3) if self.count else None,
+            'max_us': round(self.maximum * 1e6, 3) if self.count else None,
+            'p50_us': self.percentile(0.5),
+            'p99_us': self.percentile(0.99),
+            'buckets_us': {str(bucket): self.buckets[bucket] for bucket in sorted(self.buckets.keys())}
+        }
+
+    def __str__(self):
+        if self.count == 0:
+            return 'no samples'
+        histogram_dict = self.to_dict()
+        return (f'{self.count} samples, mean {histogram_dict["mean_us"]:.1f} us, '
+                f'min {histogram_dict["min_us"]:.1f} us, p50 <= {histogram_dict["p50_us"]} us, '
+                f'p99 <= {histogram_dict["p99_us"]} us, max {histogram_dict["max_us"]:.1f} us')
+
+
+class TracingTransport(Transport):
+    """
+    Wraps any Transport and records its enumerations as well as the open, descriptor, write and close calls of its
+    device handles to a Tracer. The reads are not recorded one by one, since the G6Session records the time until the
+    first acknowledgement and the drain of the remaining acknowledgements of a burst instead.
+    """
+
+    def __init__(self, transport, tracer):
+        """
+        :param transport: the Transport to trace
+        :param tracer: the Tracer to record the phases to
+        """
+        self.transport = transport
+        self.tracer = tracer
+        self.name = transport.name
+
+    def enumerate(self, vendor_id=0, product_id=0):
+        with self.tracer.span(PHASE_ENUMERATE, transport=self.name):
+            return self.transport.enumerate(vendor_id, product_id)
+
+    def device(self):
+        return TracingDevice(self.transport.device(), self.tracer)
+
+
+class TracingDevice:
+    """
+    A device handle of a TracingTransport, which records the calls of the wrapped device handle.
+    """
+
+    def __init__(self, device, tracer):
+        self.__device = device
+        self.__tracer = tracer
+
+    def open_path(self, device_path):
+        with self.__tracer.span(PHASE_OPEN, path=bytes(device_path).decode(errors='replace')):
+            self.__device.open_path(device_path)
+
+    def close(self):
+        with self.__tracer.span(PHASE_CLOSE):
+            self.__device.close()
+
+    def get_manufacturer_string(self):
+        with self.__tracer.span(PHASE_DESCRIPTOR, descriptor='manufacturer'):
+            return self.__device.get_manufacturer_string()
+
+    def get_product_string(self):
+        with self.__tracer.span(PHASE_DESCRIPTOR, descriptor='product'):
+            return self.__device.get_product_string()
+
+    def get_serial_number_string(self):
+        with self.__tracer.span(PHASE_DESCRIPTOR, descriptor='serial_number'):
+            return self.__device.get_serial_number_string()
+
+    def write(self, data):
+        start = time.perf_counter()
+        written = self.__device.write(data)
+        self.__tracer.record(PHASE_WRITE, start, time.perf_counter(), report=bytes(data[1:7]).hex())
+        return written
+
+    def read(self, max_length, timeout_ms=0):
+        return self.__device.read(max_length, timeout_ms)
@@ -0,0 +1,442 @@
+import _thread
+import os
+import select
+import struct
+import time
+
+# The names of the available transports (see get_transport())
+TRANSPORT_HIDAPI = 'hidapi'
+TRANSPORT_HIDRAW = 'hidraw'
+TRANSPORT_SIMULATED = 'simulated'
+TRANSPORT_NAMES = [TRANSPORT_HIDAPI, TRANSPORT_HIDRAW, TRANSPORT_SIMULATED]
+# How long to wait for the acknowledgement of a report sent to the G6
+RESPONSE_TIMEOUT_MS = 100
+# The sysfs directory of the Linux hidraw nodes
+HIDRAW_SYSFS_PATH = '/sys/class/hidraw'
+
+
+class Transport:
+    """
+    The way to reach the G6: how to enumerate the HID devices and how to open one of them.
+
+    The device handles returned by device() follow the API of hidapi's hid.device: open_path(), close(),
+    get_manufacturer_string(), get_product_string(), get_serial_number_string(), write(buffer) with the report_id as
+    first byte and read(max_length, timeout_ms), which blocks until a report has been read or the timeout has been
+    reached and returns the report as list of integers or bytes (empty on timeout).
+    """
+    name = None
+
+    def enumerate(self, vendor_id=0, product_id=0):
+        """
+        :param vendor_id: the vendor_id to filter the devices by, 0 for all devices
+        :param product_id: the product_id to filter the devices by, 0 for all devices
+        :return: the list of device dicts, having at least the keys 'path', 'vendor_id', 'product_id',
+                 'interface_number', 'manufacturer_string', 'product_string' and 'serial_number'
+        """
+        raise NotImplementedError()
+
+    def device(self):
+        """
+        :return: a new, not yet opened device handle
+        """
+        raise NotImplementedError()
+
+
+class HidapiTransport(Transport):
+    """
+    The default transport: hidapi, which is available on Linux, Windows and macOS.
+    """
+    name = TRANSPORT_HIDAPI
+
+    def enumerate(self, vendor_id=0, product_id=0):
+        import hid
+        return hid.enumerate(vendor_id, product_id)
+
+    def device(self):
+        import hid
+        return hid.device()
+
+
+class HidrawTransport(Transport):
+    """
+    A Linux-only transport, which talks to the /dev/hidrawN nodes of the kernel directly by os.write() and os.read(),
+    without depending on hidapi. Neither the hidapi library has to be loaded, nor the USB bus has to be enumerated:
+    the devices are found by reading a few small sysfs files.
+    """
+    name = TRANSPORT_HIDRAW
+
+    def enumerate(self, vendor_id=0, product_id=0):
+        device_dicts = []
+        # os.listdir() instead of glob, which imports the costly re module
+        try:
+            names = sorted(os.listdir(HIDRAW_SYSFS_PATH))
+        except OSError:
+            names = []
+        for name in names:
+            device_dict = read_hidraw_device_dict(os.path.join(HIDRAW_SYSFS_PATH, name), vendor_id, product_id)
+            if device_dict is not None:
+                device_dicts.append(device_dict)
+        return device_dicts
+
+    def device(self):
+        return HidrawDevice()
+
+
+class HidrawDevice:
+    """
+    A device handle to a /dev/hidrawN node (see HidrawTransport).
+
+    The node is opened non-blocking and the responses are awaited by epoll, so that a read returns as soon as a report
+    has arrived. The frames are written straight from their buffer and the responses are returned as bytes, without
+    any conversion to lists of integers.
+    """
+
+    def __init__(self):
+        self.__fd = None
+        self.__epoll = None
+        self.__sysfs_path = None
+        self.__device_dict = None
+
+    def open_path(self, device_path):
+        path = device_path.decode() if isinstance(device_path, bytes) else device_path
+        try:
+            self.__fd = os.open(path, os.O_RDWR | os.O_NONBLOCK)
+        except OSError as ex:
+            raise IOError(f'Unable to open the hidraw device {path}: {ex}') from ex
+        self.__epoll = select.epoll()
+        self.__epoll.register(self.__fd, select.EPOLLIN)
+        self.__sysfs_path = os.path.join(HIDRAW_SYSFS_PATH, os.path.basename(path))
+
+    def close(self):
+        if self.__fd is not None:
+            self.__epoll.close()
+            os.close(self.__fd)
+            self.__epoll = None
+            self.__fd = None
+
+    def get_manufacturer_string(self):
+        return self.__get_device_dict().get('manufacturer_string')
+
+    def get_product_string(self):
+        return self.__get_device_dict().get('product_string')
+
+    def get_serial_number_string(self):
+        return self.__get_device_dict().get('serial_number')
+
+    def __get_device_dict(self):
+        # the descriptor strings are only read from sysfs, if they are queried
+        if self.__device_dict is None:
+            self.__device_dict = read_hidraw_device_dict(self.__sysfs_path) or {}
+        return self.__device_dict
+
+    def write(self, data):
+        try:
+            return os.write(self.__fd, data)
+        except OSError as ex:
+            raise IOError(f'Unable to write to the hidraw device: {ex}') from ex
+
+    def read(self, max_length, timeout_ms=0):
+        try:
+            return os.read(self.__fd, max_length)
+        except BlockingIOError:
+            pass
+        if not self.__epoll.poll(max(timeout_ms, 0) / 1000):
+            return b''
+        try:
+            return os.read(self.__fd, max_length)
+        except BlockingIOError:
+            return b''
+
+
+def read_hidraw_device_dict(sysfs_path, vendor_id_filter=0, product_id_filter=0):
+    """
+    Read the information of a hidraw node from sysfs, in the same format as hidapi's hid.enumerate().
+
+    The uevent file of the HID device contains e.g. 'HID_ID=0003:0000041E:00003256' and 'HID_UNIQ=<serial>'. The HID
+    device is a child of the USB interface (bInterfaceNumber), which is a child of the USB device (manufacturer,
+    product). These files are only read, if the node matches the given filters.
+    :param sysfs_path: the sysfs path of the hidraw node, e.g. '/sys/class/hidraw/hidraw3'
+    :param vendor_id_filter: the vendor_id, the node must have, 0 for any
+    :param product_id_filter: the product_id, the node must have, 0 for any
+    :return: the device dict or None, if the node is no USB HID device or does not match the filters
+    """
+    hid_device_path = os.path.realpath(os.path.join(sysfs_path, 'device'))
+    uevent = read_sysfs_attributes(os.path.join(hid_device_path, 'uevent'))
+    try:
+        _, vendor_id, product_id = (int(part, 16) for part in uevent.get('HID_ID', '').split(':'))
+    except ValueError:
+        return None
+    if (vendor_id_filter and vendor_id != vendor_id_filter) or (product_id_filter and product_id != product_id_filter):
+        return None
+    usb_interface_path = os.path.dirname(hid_device_path)
+    usb_device_path = os.path.dirname(usb_interface_path)
+    try:
+        interface_number = int(read_sysfs_file(os.path.join(usb_interface_path, 'bInterfaceNumber')), 16)
+    except ValueError:
+        interface_number = -1
+    return {
+        'path': os.path.join('/dev', os.path.basename(sysfs_path)).encode(),
+        'vendor_id': vendor_id,
+        'product_id': product_id,
+        'interface_number': interface_number,
+        'manufacturer_string': read_sysfs_file(os.path.join(usb_device_path, 'manufacturer')),
+        'product_string': read_sysfs_file(os.path.join(usb_device_path, 'product')),
+        'serial_number': uevent.get('HID_UNIQ', ''),
+    }
+
+
+def read_sysfs_file(path):
+    try:
+        with open(path, 'r') as file:
+            return file.read().strip()
+    except OSError:
+        return ''
+
+
+def read_sysfs_attributes(path):
+    attributes = {}
+    for line in read_sysfs_file(path).splitlines():
+        key, _, value = line.partition('=')
+        attributes[key] = value
+    return attributes
+
+
+class SimulatedG6:
+    """
+    An in-memory model of the G6, which answers the reports like the real device (as far as known from the captures).
+
+    The reports are worked through one after another, each one taking the response latency. Every report is
+    acknowledged by echoing it: DATA reports stage the value of an audio feature, COMMIT reports apply the staged value
+    and respond with the current value of the audio feature, which makes them usable as read requests, too. The output
+    is switched by the first report of the output payloads. Like the hidraw nodes of the kernel, every response is
+    delivered to every open handle of the device, not only to the writing one.
+
+    Every call against the device is counted in the stats and the timestamps of all writes are recorded. Several
+    SimulatedG6s with their own device path and serial number can be attached to simulate a machine with several G6s.
+    """
+    # the first report of the output payloads: 5a2c0500 02 (Speakers) or 04 (Headphones). Copied from g6_spec.py, which
+    # is costly to import for the fast path (g6_fast.py), like the DATA and COMMIT request types of Audio.
+    OUTPUT_REQUEST_TYPE = 0x2c05
+    OUTPUT_INTERMEDIATES = {0x0002: 'Speakers', 0x0004: 'Headphones'}
+    DATA_REQUEST_TYPE = 0x1207
+    COMMIT_REQUEST_TYPE = 0x1103
+
+    VENDOR_ID = 0x041e
+    PRODUCT_ID = 0x3256
+    MANUFACTURER = 'Creative Technology Ltd'
+    PRODUCT = 'Sound Blaster X G6'
+    SERIAL_NUMBER = 'SIMULATED0001'
+
+    def __init__(self, bus_path='simulated', serial_number=SERIAL_NUMBER):
+        """
+        :param bus_path: the path of the simulated USB device, the path of its interfaces are derived from,
+                         e.g. 'simulated' for 'simulated:1.4'
+        :param serial_number: the serial number of the simulated G6
+        """
+        self.device_path = f'{bus_path}:1.4'.encode()
+        self.device_dicts = [
+            {'path': f'{bus_path}:1.3'.encode(), 'interface_number': 3},
+            {'path': self.device_path, 'interface_number': 4},
+        ]
+        self.serial_number = serial_number
+        # a lock of the low-level _thread module, since threading is costly to import for the fast path (g6_fast.py)
+        self.lock = _thread.allocate_lock()
+        self.response_latency_seconds = 0
+        self.connected = True
+        # whether the reports are echoed. The echo has not been verified against a real G6 (see g6_session.G6Session).
+        self.echo = True
+        # whether COMMIT reports respond with the current value of the audio feature. Not verified against a real G6
+        # either: a G6, which only echoes the reports, responds to a COMMIT report by its value of 0.
+        self.respond_values = True
+        # the open SimulatedDevices, which receive the responses
+        self.handles = []
+        self.reset()
+
+    def reset(self):
+        """
+        Reset the device state and the stats.
+        """
+        self.output = None
+        self.registers = {}
+        self.staged = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {'enumerate': 0, 'open': 0, 'close': 0, 'descriptor': 0, 'write': 0, 'read': 0}
+        self.write_timestamps = []
+
+    def enumerate(self):
+        self.stats['enumerate'] += 1
+        if not self.connected:
+            return []
+        return [dict(device_dict, vendor_id=self.VENDOR_ID, product_id=self.PRODUCT_ID,
+                     manufacturer_string=self.MANUFACTURER, product_string=self.PRODUCT,
+                     serial_number=self.serial_number) for device_dict in self.device_dicts]
+
+    def process(self, payload):
+        """
+        Apply a report to the device state.
+        :param payload: the 64 byte payload of the report, without the report_id
+        :return: the response as list of integers
+        """
+        response = bytearray(payload)
+        _, request_type, intermediate, audio_feature, value = struct.unpack_from('>BHHBI', payload, 0)
+        if request_type == self.DATA_REQUEST_TYPE:
+            self.staged[audio_feature] = value
+        elif request_type == self.COMMIT_REQUEST_TYPE:
+            if audio_feature in self.staged:
+                self.registers[audio_feature] = self.staged.pop(audio_feature)
+            if self.respond_values:
+                struct.pack_into('>I', response, 6, self.registers.get(audio_feature, 0))
+        elif request_type == self.OUTPUT_REQUEST_TYPE and intermediate in self.OUTPUT_INTERMEDIATES:
+            self.output = self.OUTPUT_INTERMEDIATES[intermediate]
+        return list(response)
+
+    def press_output_button(self):
+        """
+        Simulate a press of the output button on the front panel of the G6: the output is toggled and reported to every
+        open handle by the same report as the first report of the output payloads (assumed from the captures, not
+        verified on a real G6).
+        :return: the new output
+        """
+        intermediates = {output: intermediate for intermediate, output in self.OUTPUT_INTERMEDIATES.items()}
+        output = 'Speakers' if self.output == 'Headphones' else 'Headphones'
+        report = bytearray(64)
+        struct.pack_into('>BHH', report, 0, 0x5a, self.OUTPUT_REQUEST_TYPE, intermediates[output])
+        with self.lock:
+            response = self.process(bytes(report))
+            handles = list(self.handles)
+        for handle in handles:
+            handle.deliver(response, time.monotonic(), self.response_latency_seconds)
+        return output
+
+
+class SimulatedTransport(Transport):
+    """
+    A transport to in-memory SimulatedG6s, which lets the CLI and the benchmarks run without hardware.
+    """
+    name = TRANSPORT_SIMULATED
+
+    def __init__(self, simulated_g6s=None):
+        """
+        :param simulated_g6s: the list of attached SimulatedG6s. Defaults to the shared SIMULATED_G6S of this module.
+        """
+        self.simulated_g6s = SIMULATED_G6S if simulated_g6s is None else simulated_g6s
+
+    def enumerate(self, vendor_id=0, product_id=0):
+        return [device_dict for simulated_g6 in self.simulated_g6s for device_dict in simulated_g6.enumerate()
+                if (not vendor_id or device_dict['vendor_id'] == vendor_id)
+                and (not product_id or device_dict['product_id'] == product_id)]
+
+    def device(self):
+        return SimulatedDevice(self.simulated_g6s)
+
+
+class SimulatedDevice:
+    """
+    A device handle to a SimulatedG6 (see SimulatedTransport).
+    """
+
+    def __init__(self, simulated_g6s):
+        self.__simulated_g6s = simulated_g6s
+        self.__simulated_g6 = None
+        self.__responses = []
+        # released, whenever a response is delivered, so that a waiting read returns at once
+        self.__delivered = _thread.allocate_lock()
+        self.__delivered.acquire()
+
+    def open_path(self, device_path):
+        for simulated_g6 in self.__simulated_g6s:
+            if simulated_g6.connected and simulated_g6.device_path == device_path:
+                self.__simulated_g6 = simulated_g6
+                break
+        else:
+            raise IOError(f'No simulated device at path {device_path}')
+        with self.__simulated_g6.lock:
+            self.__simulated_g6.stats['open'] += 1
+            self.__simulated_g6.handles.append(self)
+
+    def close(self):
+        with self.__simulated_g6.lock:
+            self.__simulated_g6.stats['close'] += 1
+            if self in self.__simulated_g6.handles:
+                self.__simulated_g6.handles.remove(self)
+
+    def get_manufacturer_string(self):
+        self.__simulated_g6.stats['descriptor'] += 1
+        return SimulatedG6.MANUFACTURER
+
+    def get_product_string(self):
+        self.__simulated_g6.stats['descriptor'] += 1
+        return SimulatedG6.PRODUCT
+
+    def get_serial_number_string(self):
+        self.__simulated_g6.stats['descriptor'] += 1
+        return self.__simulated_g6.serial_number
+
+    def write(self, data):
+        simulated_g6 = self.__simulated_g6
+        with simulated_g6.lock:
+            simulated_g6.stats['write'] += 1
+            now = time.monotonic()
+            simulated_g6.write_timestamps.append(now)
+            # skip the report_id
+            response = simulated_g6.process(bytes(data[1:]))
+            handles = list(simulated_g6.handles) if simulated_g6.echo else []
+        for handle in handles:
+            handle.deliver(response, now, simulated_g6.response_latency_seconds)
+        return len(data)
+
+    def deliver(self, response, now, latency_seconds):
+        """
+        Queue a response of the device to be read from this handle.
+        :param response: the response as list of integers
+        :param now: the time the report has been written as time.monotonic() value
+        :param latency_seconds: the response latency of the device
+        """
+        # the device works through the reports one after another
+        ready = max(now, self.__responses[-1][0] if self.__responses else now) + latency_seconds
+        self.__responses.append((ready, response))
+        if self.__delivered.locked():
+            try:
+                self.__delivered.release()
+            except RuntimeError:
+                # released by a concurrent delivery
+                pass
+
+    def read(self, max_length, timeout_ms=0):
+        self.__simulated_g6.stats['read'] += 1
+        # block like hidapi, until a response is ready or the timeout has been reached
+        deadline = time.monotonic() + max(timeout_ms, 0) / 1000
+        while True:
+            remaining = deadline - time.monotonic()
+            if self.__responses:
+                wait = self.__responses[0][0] - time.monotonic()
+                if wait <= remaining:
+                    time.sleep(max(wait, 0))
+                    return self.__responses.pop(0)[1][:max_length]
+                time.sleep(max(remaining, 0))
+                return []
+            # sleep until a response is delivered or the timeout has been reached, without polling
+            if remaining <= 0 or not self.__delivered.acquire(timeout=remaining):
+                return []
+
+
+# The simulated G6 shared by all SimulatedTransports of the process. Further SimulatedG6s may be appended to the
+# attached SimulatedG6s.
+SIMULATED_G6 = SimulatedG6()
+SIMULATED_G6S = [SIMULATED_G6]
+
+
+def get_transport(name):
+    """
+    :param name: the name of the transport: 'hidapi', 'hidraw' or 'simulated'
+    :return: a new instance of the transport
+    """
+    if name == TRANSPORT_HIDAPI:
+        return HidapiTransport()
+    elif name == TRANSPORT_HIDRAW:
+        return HidrawTransport()
+    elif name == TRANSPORT_SIMULATED:
+        return SimulatedTransport()
+    raise ValueError(f'Argument \'name\' should be one of {TRANSPORT_NAMES}, but was \'{name}\'!')
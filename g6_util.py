@@ -1,3 +1,12 @@
+import os
+
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows
+    fcntl = None
+
+
 def read_payload_as_hex_lines(payload_file_path):
     """
     Read the hex data from a payload text file as list, omitting any line separators
@@ -6,3 +15,64 @@ def read_payload_as_hex_lines(payload_file_path):
     """
     with open(payload_file_path, 'r') as file:
         return [line.strip() for line in file.readlines()]
+
+
+def write_text_file_atomically(text_file_path, text):
+    """
+    Write a text file atomically. See write_file_atomically().
+    :param text_file_path: the path to the text file
+    :param text: the content to write
+    """
+    write_file_atomically(text_file_path, text.encode())
+
+
+def write_file_atomically(file_path, data):
+    """
+    Write a file by writing a temporary file next to it first, which replaces the file afterwards. Readers never see a
+    partially written file, even if the writer is interrupted.
+    :param file_path: the path to the file
+    :param data: the content to write as bytes
+    """
+    # unique per write, so that concurrent writers do not share their temporary file. Random instead of the thread's
+    # ident, since threading is costly to import for the fast path (g6_fast.py).
+    temp_file_path = f'{file_path}.{os.getpid()}.{os.urandom(8).hex()}.tmp'
+    try:
+        with open(temp_file_path, 'wb') as file:
+            file.write(data)
+        os.replace(temp_file_path, file_path)
+    finally:
+        if os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
+
+
+class FileLock:
+    """
+    An exclusive advisory lock (flock) on a lock file, which is held while in the context. Used to serialise the
+    read-modify-write of the runtime files between concurrent CLI runs, e.g. two quick hotkey presses. Every FileLock
+    opens the lock file by itself, so that it excludes other threads of the same process, too.
+
+    Where fcntl is not available (Windows), nothing is locked.
+
+    Usage:
+        with FileLock(state_file_path + LOCK_FILE_EXTENSION):
+            ...
+    """
+
+    def __init__(self, lock_file_path):
+        """
+        :param lock_file_path: the path to the lock file, which is created if it does not exist
+        """
+        self.lock_file_path = lock_file_path
+        self.__fd = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.__fd = os.open(self.lock_file_path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(self.__fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.__fd is not None:
+            # closing the file releases the lock
+            os.close(self.__fd)
+            self.__fd = None
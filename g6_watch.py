@@ -0,0 +1,272 @@
+import json
+import os
+import time
+
+from g6_cli import get_last_profile_file_path, get_state_file_path, get_toggle_state_file_path, write_toggle_state_file
+from g6_encoder import decode_value
+from g6_fast import LOCK_FILE_EXTENSION
+from g6_spec import OUTPUT_INTERMEDIATES, OUTPUT_REQUEST_TYPE, AudioBatch, AudioFeatureExtended, \
+    AudioFeatureSpecialValueEnum, Frame, RequestTypeEnum, StaticsEnum
+from g6_state import DeviceState
+from g6_util import FileLock
+
+# The kinds of events decoded from the reports of the G6
+EVENT_OUTPUT_CHANGED = 'output_changed'
+EVENT_FEATURE_TOGGLED = 'feature_toggled'
+EVENT_VALUE_CHANGED = 'value_changed'
+# a report, which is neither an output report nor the response to a COMMIT report of a known audio feature
+EVENT_UNKNOWN_REPORT = 'unknown_report'
+# How long a single read of the watcher blocks at most, before it checks whether it has been stopped. Reports wake the
+# read up at once, so this only bounds the idle wake-ups and the time to stop.
+WATCH_READ_TIMEOUT_MS = 1000
+# The key of the output in the last known values of the ReportDecoder
+OUTPUT_KEY = 'output'
+
+
+class DeviceEvent:
+    """
+    A change of the G6, decoded from a report read from the device: the output, the toggle or the slider value of an
+    audio feature, or an unknown report.
+    """
+
+    def __init__(self, kind, value=None, audio_feature_enum=None, slot=None, report=None):
+        """
+        :param kind: one of the EVENT_* kinds
+        :param value: the output, a bool (toggle), an int or float (slider) or an AudioFeatureSpecialValueEnum (slider)
+        :param audio_feature_enum: the enum value of the AudioFeature or None for the output and unknown reports
+        :param slot: AudioBatch.SLOT_TOGGLE or AudioBatch.SLOT_SLIDER or None for the output and unknown reports
+        :param report: the payload of the report as bytes
+        """
+        self.kind = kind
+        self.value = value
+        self.audio_feature_enum = audio_feature_enum
+        self.slot = slot
+        self.report = report
+        self.received = time.time()
+
+    def to_dict(self):
+        """
+        :return: the event as dict, e.g. {"event": "value_changed", "time": 1700000000.0, "feature": "BASS",
+                 "slot": "slider", "value": 42}
+        """
+        event_dict = {'event': self.kind, 'time': round(self.received, 6)}
+        if self.kind == EVENT_OUTPUT_CHANGED:
+            event_dict['output'] = self.value
+        elif self.kind == EVENT_UNKNOWN_REPORT:
+            event_dict['report'] = self.report.hex()
+        else:
+            event_dict['feature'] = self.audio_feature_enum.name
+            event_dict['slot'] = DeviceState.SLOT_NAMES[self.slot]
+            event_dict['value'] = self.value.name if isinstance(self.value, AudioFeatureSpecialValueEnum) \
+                else self.value
+        return event_dict
+
+
+class ReportDecoder:
+    """
+    Decodes the reports read from the G6 into DeviceEvents. The G6 reports its state by the same reports, which are
+    written to it (as far as known from the captures): the output by the first report of the output payloads and the
+    value of an audio feature by the response to its COMMIT report. The DATA reports only stage a value and are ignored.
+
+    Neither is verified on a real G6: the captures only contain the reports written by SoundBlaster Command, so
+    whether the G6 reports the changes made on its front panel (the output button and the knob) at all, and by these
+    reports, is an assumption. In particular, a G6, which only echoes the reports (as assumed by G6Session), responds
+    to every COMMIT report by the value 0. Hence, the responses to COMMIT reports are ignored unless decode_values is
+    given, until their format has been checked on a real G6 (like the reads of '--get', see Frame.find_value()).
+
+    Since every response is seen, including the responses to the reads of the CLI, only changes are decoded into
+    events: the last known value of every register is kept.
+    """
+
+    def __init__(self, audio, decode_values=False):
+        """
+        :param audio: an instance of Audio to take the request types, the intermediate and the registers from
+        :param decode_values: whether to decode the responses to COMMIT reports into value_changed and feature_toggled
+                              events. Experimental: unverified on a real G6.
+        """
+        self.audio = audio
+        self.decode_values = decode_values
+        self.prefix = audio.static_dict[StaticsEnum.PREFIX]
+        self.data_request_type = audio.request_type_dict[RequestTypeEnum.DATA]
+        self.commit_request_type = audio.request_type_dict[RequestTypeEnum.COMMIT]
+        self.intermediate = audio.static_dict[StaticsEnum.INTERMEDIATE]
+        # the audio feature and the slot of every known register, e.g. {0x19: (AudioFeatureEnum.BASS, SLOT_SLIDER)}
+        self.registers = {}
+        self.special_registers = set()
+        for audio_feature_enum, audio_feature in audio.audio_feature_dict.items():
+            self.registers[audio_feature.toggle_hex] = (audio_feature_enum, AudioBatch.SLOT_TOGGLE)
+            self.registers[audio_feature.slider_hex] = (audio_feature_enum, AudioBatch.SLOT_SLIDER)
+            if isinstance(audio_feature, AudioFeatureExtended):
+                self.registers[audio_feature.slider_special_hex] = (audio_feature_enum, AudioBatch.SLOT_SLIDER)
+                self.special_registers.add(audio_feature.slider_special_hex)
+        self.values = {}
+
+    def decode(self, payload):
+        """
+        :param payload: the report as read from the G6 (bytes or list of integers)
+        :return: the DeviceEvent or None, if the report does not change anything
+        """
+        frame = Frame.from_payload(payload)
+        prefix, request_type, intermediate, audio_feature, value = frame.unpack()
+        report = bytes(frame.payload())
+        if prefix == self.prefix and request_type == OUTPUT_REQUEST_TYPE and intermediate in OUTPUT_INTERMEDIATES:
+            output = OUTPUT_INTERMEDIATES[intermediate]
+            if self.__update(OUTPUT_KEY, output):
+                return DeviceEvent(EVENT_OUTPUT_CHANGED, output, report=report)
+            return None
+        if prefix == self.prefix and intermediate == self.intermediate:
+            if request_type == self.data_request_type:
+                return None
+            if request_type == self.commit_request_type and not self.decode_values:
+                return None
+            if request_type == self.commit_request_type:
+                if not self.__update(audio_feature, value):
+                    return None
+                if audio_feature in self.registers:
+                    return self.__decode_register(audio_feature, value, report)
+        return DeviceEvent(EVENT_UNKNOWN_REPORT, report=report)
+
+    def __update(self, key, value):
+        """
+        :return: true, if the value differs from the last known value
+        """
+        if key in self.values and self.values[key] == value:
+            return False
+        self.values[key] = value
+        return True
+
+    def __decode_register(self, audio_feature, value_hex, report):
+        audio_feature_enum, slot = self.registers[audio_feature]
+        if slot == AudioBatch.SLOT_TOGGLE:
+            return DeviceEvent(EVENT_FEATURE_TOGGLED, value_hex != 0, audio_feature_enum, slot, report)
+        if audio_feature in self.special_registers:
+            special_value = self.audio.decode_slider_special(audio_feature_enum, value_hex)
+            # the slider value takes effect instead, if no special value is set
+            if special_value is None:
+                return None
+            return DeviceEvent(EVENT_VALUE_CHANGED, special_value, audio_feature_enum, slot, report)
+        value = decode_value(value_hex)
+        return DeviceEvent(EVENT_VALUE_CHANGED, int(value) if value.is_integer() else value, audio_feature_enum, slot,
+                           report)
+
+
+def sync_device_state(serial_number, event):
+    """
+    Apply an output event to the DeviceState of the device and the toggle state file, so that the next runs of the CLI
+    act on the output switched by the front panel or by other software. The state is only written, if the event differs
+    from it: the changes made by the CLI itself have been saved already. The last applied profile is forgotten, since
+    the device has been changed otherwise.
+
+    The audio feature events are never applied: they are decoded from the responses to COMMIT reports, which are
+    unverified on a real G6 (see ReportDecoder). A wrong value in the DeviceState would let the CLI skip a setting as
+    already set.
+    :param serial_number: the serial number of the G6
+    :param event: the DeviceEvent to apply
+    :return: true, if the state has been changed
+    """
+    if event.kind != EVENT_OUTPUT_CHANGED:
+        return False
+    state_file_path = get_state_file_path(serial_number)
+    with FileLock(state_file_path + LOCK_FILE_EXTENSION):
+        state = DeviceState.load(state_file_path)
+        if state.output == event.value:
+            return False
+        state.output = event.value
+        write_toggle_state_file(get_toggle_state_file_path(serial_number), event.value)
+        state.save()
+    last_profile_file_path = get_last_profile_file_path(serial_number)
+    if os.path.exists(last_profile_file_path):
+        os.remove(last_profile_file_path)
+    return True
+
+
+class DeviceWatcher:
+    """
+    Watches the reports of the G6 through its own device handle, besides the handles of the CLI runs or the daemon: the
+    kernel delivers every input report to every open handle. The watcher blocks in the read of its handle (epoll for
+    hidraw, the read thread of hidapi), so that it does not use any CPU while the G6 is idle.
+    """
+
+    def __init__(self, transport, device_path, audio, sync_state=True, read_timeout_ms=WATCH_READ_TIMEOUT_MS,
+                 decode_values=False):
+        """
+        :param transport: the Transport to open the device with (see g6_transport.py)
+        :param device_path: the detected usb device path of the G6
+        :param audio: an instance of Audio to decode the reports with
+        :param sync_state: whether to apply the output events to the DeviceState (see sync_device_state())
+        :param read_timeout_ms: how long a single read blocks at most, before the watcher checks whether it has been
+                                stopped
+        :param decode_values: whether to decode the responses to COMMIT reports (see ReportDecoder)
+        """
+        self.transport = transport
+        self.device_path = device_path
+        self.decoder = ReportDecoder(audio, decode_values)
+        self.sync_state = sync_state
+        self.read_timeout_ms = read_timeout_ms
+        self.report_count = 0
+        self.event_count = 0
+        self.__stopped = False
+
+    def stop(self):
+        """
+        Let watch() return after its current read.
+        """
+        self.__stopped = True
+
+    def watch(self, on_event):
+        """
+        Read and decode the reports of the G6, until the watcher is stopped. Raises an IOError, if the device is gone.
+        :param on_event: the function to call with every DeviceEvent, after an output event has been applied to the
+                         DeviceState
+        """
+        device = self.transport.device()
+        device.open_path(self.device_path)
+        try:
+            serial_number = device.get_serial_number_string()
+            while not self.__stopped:
+                data = device.read(Frame.PAYLOAD_LENGTH, self.read_timeout_ms)
+                if not data:
+                    continue
+                self.report_count += 1
+                event = self.decoder.decode(data)
+                if event is None:
+                    continue
+                self.event_count += 1
+                if self.sync_state and event.kind == EVENT_OUTPUT_CHANGED:
+                    sync_device_state(serial_number, event)
+                on_event(event)
+        finally:
+            device.close()
+
+
+def print_event_dict(event_dict):
+    # flushed at once, since the JSON lines are usually read through a pipe
+    print(json.dumps(event_dict), flush=True)
+
+
+def execute_watch(transport, device_path, audio, args):
+    """
+    Print the events of the G6 as JSON lines, until an interrupt (Ctrl+C).
+    :param transport: the Transport to open the device with (see g6_transport.py)
+    :param device_path: the detected usb device path of the G6
+    :param audio: an instance of Audio to decode the reports with
+    :param args: the CLI arguments, recently parsed by argparse in parse_cli_args()
+    """
+    watcher = DeviceWatcher(transport, device_path, audio, sync_state=not args.dry_run)
+    try:
+        watcher.watch(lambda event: print_event_dict(event.to_dict()))
+    except KeyboardInterrupt:
+        pass
+
+
+def watch_via_daemon(socket_path):
+    """
+    Print the events pushed by the running g6d daemon as JSON lines, until an interrupt (Ctrl+C).
+    :param socket_path: the path to the unix socket of the daemon
+    """
+    from g6_daemon import subscribe
+    try:
+        for event_dict in subscribe(socket_path):
+            print_event_dict(event_dict)
+    except KeyboardInterrupt:
+        pass
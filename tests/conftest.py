@@ -0,0 +1,26 @@
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+# the CLI modules take the transport and the runtime directory from the environment, when they are imported
+os.environ['G6_TRANSPORT'] = 'simulated'
+os.environ['XDG_RUNTIME_DIR'] = tempfile.mkdtemp(prefix='g6-test-')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from g6_transport import SimulatedG6, SimulatedTransport  # noqa: E402
+
+# every test gets a G6 with its own serial number, so that the device states of the tests do not interfere
+SERIAL_NUMBERS = (f'TEST{index:04d}' for index in itertools.count())
+
+
+@pytest.fixture
+def simulated_g6():
+    return SimulatedG6(serial_number=next(SERIAL_NUMBERS))
+
+
+@pytest.fixture
+def transport(simulated_g6):
+    return SimulatedTransport([simulated_g6])
@@ -0,0 +1,50 @@
+from g6_capture import Replayer, convert_hex_lines
+from g6_cli import get_output_payload_path
+from g6_util import read_payload_as_hex_lines
+
+
+class LossyDevice:
+    """
+    A device handle, which loses the responses of the given frames of a replay.
+    """
+
+    def __init__(self, simulated_g6, device, lost_indices):
+        self.simulated_g6 = simulated_g6
+        self.device = device
+        self.lost_indices = lost_indices
+        self.write_count = 0
+
+    def write(self, data):
+        self.simulated_g6.echo = self.write_count not in self.lost_indices
+        self.write_count += 1
+        return self.device.write(data)
+
+    def read(self, max_length, timeout_ms=0):
+        return self.device.read(max_length, timeout_ms)
+
+
+def replay(simulated_g6, transport, lost_indices, window):
+    capture_frames = convert_hex_lines(read_payload_as_hex_lines(get_output_payload_path('Headphones')))
+    device = transport.device()
+    device.open_path(simulated_g6.device_path)
+    try:
+        return Replayer(LossyDevice(simulated_g6, device, lost_indices), window, response_timeout_ms=20)\
+            .replay(capture_frames)
+    finally:
+        device.close()
+
+
+def test_replay_matches_the_capture(simulated_g6, transport):
+    results = replay(simulated_g6, transport, [], 8)
+
+    assert [result.index for result in results] == list(range(len(results)))
+    assert not any(result.is_timeout() or result.is_diverged() for result in results)
+
+
+def test_lost_response_only_times_out_its_own_frame(simulated_g6, transport):
+    for window in [1, 8]:
+        results = replay(simulated_g6, transport, [2], window)
+
+        assert [result.index for result in results] == list(range(len(results)))
+        assert [result.index for result in results if result.is_timeout()] == [2]
+        assert not any(result.is_diverged() for result in results)
@@ -0,0 +1,47 @@
+import pytest
+
+from g6_cli import parse_cli_args
+from g6_spec import AudioFeatureEnum
+
+
+def test_slider_values_accept_fractions():
+    args = parse_cli_args(['--set-bass-value', '42.5', '--set-surround-value', '50.0'])
+
+    assert args.set_bass_value == 42.5
+    # whole numbers stay integers, so that they compare equal to the saved state
+    assert args.set_surround_value == 50
+    assert type(args.set_surround_value) is int
+
+
+@pytest.mark.parametrize('value', ['-0.5', '100.1', 'nan', 'inf', 'loud'])
+def test_slider_values_out_of_range_are_rejected(value, capsys):
+    with pytest.raises(SystemExit):
+        parse_cli_args(['--set-bass-value', value])
+
+    assert 'argument --set-bass-value' in capsys.readouterr().err
+
+
+def test_ramps_are_converted_while_parsing():
+    args = parse_cli_args(['--ramp', 'bass', '0..80', '--ramp', 'Surround', '100..0'])
+
+    assert [(ramp.audio_feature_enum, ramp.start_value, ramp.end_value) for ramp in args.ramp] == [
+        (AudioFeatureEnum.BASS, 0, 80), (AudioFeatureEnum.SURROUND, 100, 0)]
+
+
+def test_ramps_accept_fractions_like_the_sliders():
+    ramp, = parse_cli_args(['--ramp', 'bass', '0.5..42.5']).ramp
+
+    assert (ramp.start_value, ramp.end_value) == (0.5, 42.5)
+
+
+@pytest.mark.parametrize('effect, start_end, message', [
+    ('treble', '0..80', 'sound effects for --ramp'),
+    ('bass', '0-80', '\'START..END\''),
+    ('bass', '0..101', 'should be between'),
+    ('bass', '0..x', 'invalid number'),
+])
+def test_invalid_ramps_are_rejected_by_the_parser(effect, start_end, message, capsys):
+    with pytest.raises(SystemExit):
+        parse_cli_args(['--ramp', effect, start_end])
+
+    assert message in capsys.readouterr().err
@@ -0,0 +1,65 @@
+import os
+
+from g6_cli import resolve_trace_args
+from g6_daemon import G6Daemon
+from g6_transport import SimulatedTransport
+
+
+def test_daemon_starts_without_a_device_and_detects_it_with_the_first_command(simulated_g6, tmp_path, capsys):
+    simulated_g6s = []
+    daemon = G6Daemon(str(tmp_path / 'g6d.sock'), False, SimulatedTransport(simulated_g6s))
+    try:
+        response = daemon.execute(['--set-bass-value', '50'])
+        assert not response['ok']
+        assert 'No SoundBlaster X G6 device could be found' in response['error']
+
+        # plugged in
+        simulated_g6s.append(simulated_g6)
+        response = daemon.execute(['--set-bass-value', '50'])
+        assert response['ok'], response['error']
+        assert simulated_g6.stats['write'] == 2
+    finally:
+        daemon.stop()
+
+
+def test_daemon_returns_the_output_of_each_command_to_its_client(simulated_g6, tmp_path, capsys):
+    daemon = G6Daemon(str(tmp_path / 'g6d.sock'), False, SimulatedTransport([simulated_g6]))
+    daemon.start()
+    capsys.readouterr()
+    try:
+        responses = {value: daemon.execute(['--quiet', '--set-bass-value', str(value)]) for value in (10, 20)}
+        invalid = daemon.execute(['--set-bass-value', '101'])
+    finally:
+        daemon.stop()
+
+    assert responses[10]['output'] == 'Planned audio effects: 1 DATA and 1 COMMIT reports\n'
+    assert responses[20]['output'] == 'Planned audio effects: 1 DATA and 1 COMMIT reports\n'
+    assert not invalid['ok']
+    assert 'argument --set-bass-value' in invalid['output']
+    # nothing of the commands leaks to the console of the daemon
+    captured = capsys.readouterr()
+    assert 'Planned audio effects' not in captured.out
+    assert 'argument --set-bass-value' not in captured.err
+
+
+def test_daemon_awaits_the_acknowledgements_again_after_a_missing_echo(simulated_g6, tmp_path, capsys):
+    daemon = G6Daemon(str(tmp_path / 'g6d.sock'), False, SimulatedTransport([simulated_g6]))
+    daemon.start()
+    try:
+        simulated_g6.echo = False
+        assert daemon.execute(['--quiet', '--set-bass-value', '10'])['ok']
+        assert daemon.session.timeout_count == 2
+
+        simulated_g6.echo = True
+        assert daemon.execute(['--quiet', '--set-bass-value', '20'])['ok']
+        assert daemon.session.acknowledged_count == 2
+    finally:
+        daemon.stop()
+
+
+def test_trace_file_is_resolved_by_the_client():
+    trace_file_path = os.path.abspath('trace.json')
+
+    assert resolve_trace_args(['--trace', 'trace.json', '--toggle-output']) == \
+           ['--trace', trace_file_path, '--toggle-output']
+    assert resolve_trace_args(['--trace=trace.json']) == [f'--trace={trace_file_path}']
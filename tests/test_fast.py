@@ -0,0 +1,75 @@
+import json
+import time
+
+from g6_fast import STATE_FILE_NAME_FORMAT, TOGGLE_STATE_FILE_NAME_FORMAT, find_json_string, get_device_key, \
+    set_output
+from g6_transport import RESPONSE_TIMEOUT_MS
+
+
+def test_fast_set_output_is_sent_even_if_the_state_tells_it_is_set(simulated_g6, transport, tmp_path):
+    state_file_path = tmp_path / STATE_FILE_NAME_FORMAT.format(device_key=get_device_key(simulated_g6.serial_number))
+    state_file_path.write_text('{"output": "Headphones"}')
+    device = transport.device()
+    device.open_path(simulated_g6.device_path)
+    try:
+        assert set_output(device, str(tmp_path), 'Headphones')
+    finally:
+        device.close()
+
+    assert simulated_g6.stats['write'] > 0
+    assert simulated_g6.output == 'Headphones'
+    assert state_file_path.read_text() == '{"output": "Headphones"}'
+
+
+def test_fast_set_output_without_echo_stalls_only_once(simulated_g6, transport, tmp_path):
+    simulated_g6.echo = False
+    state_file_path = tmp_path / STATE_FILE_NAME_FORMAT.format(device_key=get_device_key(simulated_g6.serial_number))
+    state_file_path.write_text('{"output": "Headphones"}')
+    device = transport.device()
+    device.open_path(simulated_g6.device_path)
+    start = time.perf_counter()
+    try:
+        assert set_output(device, str(tmp_path), None)
+    finally:
+        device.close()
+
+    assert time.perf_counter() - start < 2 * RESPONSE_TIMEOUT_MS / 1000
+    assert simulated_g6.output == 'Speakers'
+    assert state_file_path.read_text() == '{"output": "Speakers"}'
+    device_key = get_device_key(simulated_g6.serial_number)
+    assert (tmp_path / TOGGLE_STATE_FILE_NAME_FORMAT.format(device_key=device_key)).read_text() == 'Speakers'
+
+
+# a nested 'output' key and strings, which look like the key, before the top-level key
+TRICKY_STATE_JSON = json.dumps({
+    'note': 'say "output": "Headphones", \\"output\\": "Headphones"',
+    'audio_features': {'output': {'output': 'Headphones'}, 'list': ['"output": "Headphones"', {'output': None}]},
+    'output': 'Speakers',
+}, indent=2)
+
+
+def test_find_json_string_only_finds_top_level_keys():
+    start, end, value = find_json_string(TRICKY_STATE_JSON, 'output')
+
+    assert value == 'Speakers'
+    assert TRICKY_STATE_JSON[start:end] == '"Speakers"'
+    assert find_json_string(json.dumps({'audio_features': {'output': 'Speakers'}}), 'output') is None
+    assert find_json_string(json.dumps({'output': None}), 'output')[2] is None
+    # escaped values are not supported
+    assert find_json_string(json.dumps({'output': 'Spea"kers'}), 'output') is None
+    assert find_json_string('{"output": "Speakers', 'output') is None
+    assert find_json_string(json.dumps({'hidapi:041e': 'path'}), 'hidapi:', key_prefix=True)[2] == 'path'
+
+
+def test_fast_toggle_rewrites_only_the_top_level_output(simulated_g6, transport, tmp_path):
+    state_file_path = tmp_path / STATE_FILE_NAME_FORMAT.format(device_key=get_device_key(simulated_g6.serial_number))
+    state_file_path.write_text(TRICKY_STATE_JSON)
+    device = transport.device()
+    device.open_path(simulated_g6.device_path)
+    try:
+        assert set_output(device, str(tmp_path), None)
+    finally:
+        device.close()
+
+    assert simulated_g6.output == 'Headphones'
+    assert json.loads(state_file_path.read_text()) == dict(json.loads(TRICKY_STATE_JSON), output='Headphones')
@@ -0,0 +1,33 @@
+import pytest
+
+from g6_fast import OUTPUT_HEADPHONES, OUTPUT_SPEAKERS, get_output_payload_path
+from g6_minimize import CHECK_OUTPUT, VERIFIED_BY_HARDWARE, VERIFIED_BY_SIMULATION, read_payload_verification, \
+    record_payload_verification
+from g6_spec import Frame
+from g6_util import read_payload_as_hex_lines
+
+# The intermediate of the first report of an output payload, which selects the output: 5a2c0500 02 or 04
+OUTPUT_INTERMEDIATES = {OUTPUT_SPEAKERS: 0x0002, OUTPUT_HEADPHONES: 0x0004}
+
+
+@pytest.mark.parametrize('minimal', [False, True])
+@pytest.mark.parametrize('output', [OUTPUT_SPEAKERS, OUTPUT_HEADPHONES])
+def test_output_payload_switches_to_its_output(output, minimal):
+    hex_lines = read_payload_as_hex_lines(get_output_payload_path(output, minimal))
+
+    _, request_type, intermediate, _, _ = Frame.from_hex_line(hex_lines[0]).unpack()
+
+    assert request_type == 0x2c05
+    assert intermediate == OUTPUT_INTERMEDIATES[output]
+
+
+def test_payload_verification_is_recorded_per_output(tmp_path):
+    verification_file_path = str(tmp_path / 'set-output-verification.json')
+    record_payload_verification(OUTPUT_SPEAKERS, VERIFIED_BY_SIMULATION, CHECK_OUTPUT, verification_file_path)
+    record_payload_verification(OUTPUT_HEADPHONES, VERIFIED_BY_HARDWARE, CHECK_OUTPUT, verification_file_path)
+
+    verification = read_payload_verification(verification_file_path)
+
+    assert verification[OUTPUT_SPEAKERS]['checker'] == VERIFIED_BY_SIMULATION
+    assert verification[OUTPUT_HEADPHONES]['checker'] == VERIFIED_BY_HARDWARE
+    assert read_payload_verification(str(tmp_path / 'missing.json')) == {}
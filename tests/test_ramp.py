@@ -0,0 +1,96 @@
+import pytest
+
+from g6_ramp import Ramp, RampScheduler
+from g6_spec import Acknowledgement, Audio, AudioFeatureEnum, RequestTypeEnum, ResponseStatusEnum
+
+
+# Rates with intervals, which are exact binary fractions, so that the deadlines can be compared exactly
+RATE_HZ = 64
+COMMIT_RATE_HZ = 16
+
+
+class FakeClock:
+    """
+    A monotonic clock, which only advances by sleeping and by the round trips of the FakeSession.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        assert seconds >= 0
+        self.now += seconds
+
+
+class FakeSession:
+    """
+    A device, which records the timestamp of every written frame and acknowledges every frame after the round trip.
+    """
+
+    def __init__(self, clock, round_trip_seconds=0.0):
+        self.clock = clock
+        self.round_trip_seconds = round_trip_seconds
+        self.writes = []
+
+    def send(self, frames, pipelined=False):
+        self.writes += [(self.clock(), frame) for frame in frames]
+        self.clock.now += self.round_trip_seconds
+        return [Acknowledgement(frame, ResponseStatusEnum.ACKNOWLEDGED, self.round_trip_seconds) for frame in frames]
+
+
+def run_ramp(ramp, duration_seconds, round_trip_seconds=0.0):
+    audio = Audio()
+    clock = FakeClock()
+    session = FakeSession(clock, round_trip_seconds)
+    scheduler = RampScheduler(session, audio, RATE_HZ, clock, clock.sleep, COMMIT_RATE_HZ)
+    scheduler.run([ramp], duration_seconds)
+    data_request_type = audio.request_type_dict[RequestTypeEnum.DATA]
+    writes = [(timestamp, frame.unpack()[1] == data_request_type) for timestamp, frame in session.writes]
+    return scheduler, session, writes
+
+
+def test_steps_are_paced_by_deadlines_without_drift():
+    scheduler, _, writes = run_ramp(Ramp(AudioFeatureEnum.BASS, 0, 100), 0.5)
+
+    data_timestamps = [timestamp for timestamp, is_data in writes if is_data]
+    # 64 steps per second over 500 ms, including the start and the end value
+    assert scheduler.steps == 33
+    assert data_timestamps == [index / RATE_HZ for index in range(33)]
+
+
+def test_intermediate_commits_are_coalesced():
+    scheduler, session, writes = run_ramp(Ramp(AudioFeatureEnum.BASS, 0, 100), 0.5)
+
+    commit_timestamps = [timestamp for timestamp, is_data in writes if not is_data]
+    # the start value, one commit per commit interval and the end value
+    assert commit_timestamps == [index / COMMIT_RATE_HZ for index in range(9)]
+    assert scheduler.commits == 9
+    # the last frame commits the end value, after its DATA frame
+    assert [frame.to_hex_line() for _, frame in session.writes[-2:]] == \
+           [frame.to_hex_line() for frame in Audio().build_frames_slider(AudioFeatureEnum.BASS, 100)]
+
+
+def test_slow_acknowledgements_stretch_the_steps_and_missed_steps_are_dropped():
+    scheduler, _, writes = run_ramp(Ramp(AudioFeatureEnum.BASS, 0, 100), 0.5, round_trip_seconds=0.07)
+
+    data_timestamps = [timestamp for timestamp, is_data in writes if is_data]
+    intervals = [b - a for a, b in zip(data_timestamps, data_timestamps[1:])]
+    assert scheduler.interval == pytest.approx(0.07)
+    assert all(interval >= 0.07 - 1e-9 for interval in intervals)
+    # the steps missed by the slow round trips are dropped instead of being caught up
+    assert scheduler.steps <= 9
+    # the end value is acknowledged, when the duration elapses
+    assert data_timestamps[-1] + 0.07 == pytest.approx(0.5, abs=0.07)
+
+
+def test_fractional_end_value_is_sent_exactly():
+    ramp = Ramp(AudioFeatureEnum.BASS, 0, 42.5)
+
+    _, session, _ = run_ramp(ramp, 0.1)
+
+    assert [frame.to_hex_line() for _, frame in session.writes[-2:]] == \
+           [frame.to_hex_line() for frame in Audio().build_frames_slider(AudioFeatureEnum.BASS, 42.5)]
+    assert ramp.value_at(0.5) == 21
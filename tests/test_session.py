@@ -0,0 +1,186 @@
+import contextlib
+import io
+import time
+
+from g6_cli import execute_cli_args, get_state_file_path, parse_cli_args
+from g6_encoder import encode_value
+from g6_fast import get_output_payload_path
+from g6_profile import build_profile_frames, compile_profile
+from g6_session import G6Session
+from g6_spec import Audio, AudioBatch, AudioFeatureEnum, AudioFeatureSpecialValueEnum, RequestTypeEnum
+from g6_state import DeviceState
+from g6_transport import RESPONSE_TIMEOUT_MS
+from g6_util import read_payload_as_hex_lines
+
+
+def run_cli_args(simulated_g6, transport, cli_args, dry_run=False):
+    """
+    Execute the CLI arguments through a session to the simulated G6.
+    :return: the console output
+    """
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output), \
+            G6Session(simulated_g6.device_path, dry_run, transport=transport, verbose=False) as session:
+        execute_cli_args(session, Audio(), parse_cli_args(cli_args))
+    return output.getvalue()
+
+
+def get_request_types(frames):
+    return [frame.unpack()[1] for frame in frames]
+
+
+def test_batch_orders_data_before_commit():
+    audio = Audio()
+    batch = AudioBatch(audio)
+    batch.add_slider(AudioFeatureEnum.BASS, 50)
+    batch.add_toggle(AudioFeatureEnum.SURROUND, True)
+    batch.add_toggle(AudioFeatureEnum.BASS, True)
+
+    data_frames, commit_frames = batch.build_frames()
+
+    assert get_request_types(data_frames) == [audio.request_type_dict[RequestTypeEnum.DATA]] * 3
+    assert get_request_types(commit_frames) == [audio.request_type_dict[RequestTypeEnum.COMMIT]] * 3
+    # ordered by feature, the toggle before the slider
+    assert [frame.unpack()[3] for frame in data_frames] == [0x00, 0x18, 0x19]
+
+
+def test_batch_drops_superseded_changes():
+    batch = AudioBatch(Audio())
+    batch.add_slider(AudioFeatureEnum.BASS, 10)
+    batch.add_slider(AudioFeatureEnum.BASS, 20)
+    batch.add_slider(AudioFeatureEnum.SMART_VOLUME, 30)
+    batch.add_slider_special(AudioFeatureEnum.SMART_VOLUME, AudioFeatureSpecialValueEnum.SMART_VOLUME_NIGHT)
+
+    data_frames, commit_frames = batch.build_frames()
+
+    assert batch.get_changes() == [
+        (AudioFeatureEnum.BASS, AudioBatch.SLOT_SLIDER, 20),
+        (AudioFeatureEnum.SMART_VOLUME, AudioBatch.SLOT_SLIDER, AudioFeatureSpecialValueEnum.SMART_VOLUME_NIGHT)
+    ]
+    assert len(data_frames) == 2
+    assert len(commit_frames) == 2
+    assert data_frames[0].unpack()[4] == encode_value(20)
+
+
+def test_profile_burst_is_planned_like_a_batch():
+    audio = Audio()
+    entries = compile_profile({'output': 'Speakers', 'Surround': {'enabled': True, 'value': 60},
+                               'Smart-Volume': {'enabled': False, 'special': 'Night'}, 'Bass': {'value': 42.5}}, audio)
+    batch = AudioBatch(audio)
+    batch.add_toggle(AudioFeatureEnum.SURROUND, True)
+    batch.add_slider(AudioFeatureEnum.SURROUND, 60)
+    batch.add_toggle(AudioFeatureEnum.SMART_VOLUME, False)
+    batch.add_slider_special(AudioFeatureEnum.SMART_VOLUME, AudioFeatureSpecialValueEnum.SMART_VOLUME_NIGHT)
+    batch.add_slider(AudioFeatureEnum.BASS, 42.5)
+
+    output_frames, audio_frames = build_profile_frames(entries, audio, lambda output: [])
+
+    data_frames, commit_frames = batch.build_frames()
+    assert output_frames == []
+    assert [frame.to_hex_line() for frame in audio_frames] == \
+           [frame.to_hex_line() for frame in data_frames + commit_frames]
+
+
+def test_pipelined_send_writes_every_frame_once(simulated_g6, transport):
+    audio = Audio()
+    frames = audio.build_frames_toggle(AudioFeatureEnum.BASS, True) \
+        + audio.build_frames_slider(AudioFeatureEnum.BASS, 42)
+
+    with G6Session(simulated_g6.device_path, False, transport=transport, verbose=False) as session:
+        acknowledgements = session.send(frames, pipelined=True)
+
+    assert simulated_g6.stats['write'] == 4
+    assert simulated_g6.stats['open'] == 1
+    assert all(acknowledgement.is_acknowledged() for acknowledgement in acknowledgements)
+    assert simulated_g6.registers[0x19] == encode_value(42)
+
+
+def test_set_audio_effects_is_sent_as_one_burst(simulated_g6, transport):
+    run_cli_args(simulated_g6, transport, ['--set-surround', 'Enabled', '--set-bass', 'Enabled',
+                                           '--set-bass-value', '50', '--set-dialog-plus-value', '20'])
+
+    assert simulated_g6.stats['write'] == 8
+    # 4 DATA and 4 COMMIT reports in a single pipelined burst
+    assert simulated_g6.registers == {0x00: encode_value(100), 0x18: encode_value(100), 0x19: encode_value(50),
+                                      0x03: encode_value(20)}
+
+
+def test_dry_run_reports_the_planned_burst(simulated_g6, transport):
+    output = run_cli_args(simulated_g6, transport, ['--set-surround', 'Enabled', '--set-surround-value', '30',
+                                                    '--set-smart-volume-value', '40',
+                                                    '--set-smart-volume-special-value', 'Loud'], dry_run=True)
+
+    assert 'Planned audio effects: 3 DATA and 3 COMMIT reports' in output
+    assert simulated_g6.stats['write'] == 0
+
+
+def test_unchanged_settings_are_skipped(simulated_g6, transport):
+    run_cli_args(simulated_g6, transport, ['--set-bass-value', '50'])
+    simulated_g6.reset_stats()
+
+    output = run_cli_args(simulated_g6, transport, ['--set-bass-value', '50', '--set-surround', 'Disabled'])
+
+    assert 'BASS is already set to 50' in output
+    assert simulated_g6.stats['write'] == 2
+
+
+def test_fractional_slider_value_is_encoded_exactly(simulated_g6, transport):
+    run_cli_args(simulated_g6, transport, ['--set-crystalizer-value', '33.3'])
+
+    assert simulated_g6.registers == {0x08: encode_value(33.3)}
+
+
+def test_set_output_is_sent_even_if_the_state_tells_it_is_set(simulated_g6, transport):
+    run_cli_args(simulated_g6, transport, ['--set-output', 'Headphones'])
+    simulated_g6.press_output_button()
+    simulated_g6.reset_stats()
+
+    run_cli_args(simulated_g6, transport, ['--set-output', 'Headphones'])
+
+    assert simulated_g6.stats['write'] > 0
+    assert simulated_g6.output == 'Headphones'
+
+
+def test_missing_echo_stalls_only_once_and_updates_the_state(simulated_g6, transport):
+    simulated_g6.echo = False
+    start = time.perf_counter()
+
+    output = run_cli_args(simulated_g6, transport, ['--set-output', 'Speakers', '--set-bass-value', '50'])
+
+    # a single response timeout instead of one per report
+    assert time.perf_counter() - start < 2 * RESPONSE_TIMEOUT_MS / 1000
+    assert output.count('Warning: the G6 did not acknowledge') == 1
+    assert simulated_g6.output == 'Speakers'
+    state = DeviceState.load(get_state_file_path(simulated_g6.serial_number))
+    assert state.output == 'Speakers'
+    assert state.get_audio_feature(AudioFeatureEnum.BASS, AudioBatch.SLOT_SLIDER) == 50
+
+
+def test_set_output_sends_the_captured_payload_by_default(simulated_g6, transport):
+    output = run_cli_args(simulated_g6, transport, ['--set-output', 'Speakers'])
+
+    assert simulated_g6.stats['write'] == len(read_payload_as_hex_lines(get_output_payload_path('Speakers')))
+    assert 'Warning' not in output
+
+
+def test_minimal_output_payload_is_opt_in_and_warns_until_confirmed(simulated_g6, transport):
+    output = run_cli_args(simulated_g6, transport, ['--minimal-output-payload', '--set-output', 'Headphones'])
+
+    assert simulated_g6.stats['write'] == 2
+    assert simulated_g6.output == 'Headphones'
+    assert 'has not been confirmed on a real G6 yet' in output
+
+
+def test_profile_output_payload_follows_the_cli_arguments(simulated_g6, transport, tmp_path, monkeypatch):
+    monkeypatch.setattr('g6_cli.PROFILE_DIR_PATH', str(tmp_path))
+    (tmp_path / 'night.json').write_text('{"output": "Headphones"}')
+    run_cli_args(simulated_g6, transport, ['--apply-profile', 'night'])
+    captured_writes = simulated_g6.stats['write']
+
+    # the compiled profile is cached by now, but must not pin the captured payload
+    run_cli_args(simulated_g6, transport, ['--force', '--minimal-output-payload', '--apply-profile', 'night'])
+
+    assert (tmp_path / 'night.frames').exists()
+    assert captured_writes == len(read_payload_as_hex_lines(get_output_payload_path('Headphones')))
+    assert simulated_g6.stats['write'] - captured_writes == 2
+    assert simulated_g6.output == 'Headphones'
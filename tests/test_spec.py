@@ -0,0 +1,132 @@
+import pytest
+
+from g6_cli import PAYLOAD_NUMBER_VALUES_PATH
+from g6_encoder import decode_value
+from g6_spec import OUTPUT_INTERMEDIATES, OUTPUT_REQUEST_TYPE, Audio, AudioFeatureEnum, AudioFeatureSpecialValueEnum, \
+    Frame
+from g6_table import KIND_SLIDER, KIND_SLIDER_SPECIAL, KIND_TOGGLE
+from g6_transport import SimulatedG6
+from g6_util import read_payload_as_hex_lines
+
+# No capture of a response of the G6 exists yet: the tests decode the recorded request frames of the slider values of
+# Surround (0-100.hex), which carry the same header and value layout as the assumed responses.
+RECORDED_HEX_LINES = read_payload_as_hex_lines(PAYLOAD_NUMBER_VALUES_PATH)
+RECORDED_DATA_HEX_LINES = RECORDED_HEX_LINES[0::2]
+RECORDED_COMMIT_HEX_LINES = RECORDED_HEX_LINES[1::2]
+
+
+def get_read_frame(audio_feature_enum, slot_name):
+    return {name: frame for name, _, frame in Audio().build_frames_read(audio_feature_enum)}[slot_name]
+
+
+def to_response(data_hex_line):
+    """
+    :return: the recorded DATA frame with the request type of a COMMIT report, i.e. the assumed response to a read
+    """
+    return Frame.from_hex_line(RECORDED_COMMIT_HEX_LINES[0][:6] + data_hex_line[6:])
+
+
+def test_read_request_is_the_recorded_commit_frame():
+    assert get_read_frame(AudioFeatureEnum.SURROUND, 'slider').to_hex_line() == RECORDED_COMMIT_HEX_LINES[0]
+
+
+@pytest.mark.parametrize('value', [0, 1, 42, 50, 99, 100])
+def test_find_value_decodes_the_recorded_value(value):
+    response = to_response(RECORDED_DATA_HEX_LINES[value])
+
+    value_hex = response.find_value(get_read_frame(AudioFeatureEnum.SURROUND, 'slider'))
+
+    assert decode_value(value_hex) == value
+
+
+def test_find_value_rejects_the_response_of_another_audio_feature():
+    response = to_response(RECORDED_DATA_HEX_LINES[42])
+
+    assert response.find_value(get_read_frame(AudioFeatureEnum.SURROUND, 'toggle')) is None
+    assert response.find_value(get_read_frame(AudioFeatureEnum.BASS, 'slider')) is None
+
+
+def test_find_value_rejects_other_request_types():
+    # the recorded DATA frame carries the value, but is not the response to a read request
+    data_frame = Frame.from_hex_line(RECORDED_DATA_HEX_LINES[42])
+
+    assert data_frame.find_value(get_read_frame(AudioFeatureEnum.SURROUND, 'slider')) is None
+
+
+def test_find_value_rejects_the_marker_at_another_offset():
+    # intermediate and audio feature of the read request, but behind another header
+    hex_line = RECORDED_DATA_HEX_LINES[42]
+    shifted = Frame.from_hex_line(('5a2c0500' + hex_line[6:])[:128])
+
+    assert shifted.find_value(get_read_frame(AudioFeatureEnum.SURROUND, 'slider')) is None
+
+
+def test_simulated_g6_switches_the_output_by_the_output_report_of_the_spec():
+    # the simulated G6 keeps its own copy, since g6_spec.py is costly to import for the fast path
+    assert SimulatedG6.OUTPUT_REQUEST_TYPE == OUTPUT_REQUEST_TYPE
+    assert SimulatedG6.OUTPUT_INTERMEDIATES == OUTPUT_INTERMEDIATES
+
+
+def get_command_space():
+    """
+    :return: every toggle value, a few slider values including fractions and every special value of every audio feature
+    """
+    commands = []
+    for audio_feature_enum in AudioFeatureEnum:
+        commands += [(audio_feature_enum, KIND_TOGGLE, enabled) for enabled in [True, False]]
+        commands += [(audio_feature_enum, KIND_SLIDER, value) for value in [0, 1, 42.5, 99.99, 100]]
+    commands += [(AudioFeatureEnum.SMART_VOLUME, KIND_SLIDER_SPECIAL, special_value_enum)
+                 for special_value_enum in AudioFeatureSpecialValueEnum]
+    return commands
+
+
+def build_frames_singly(audio, audio_feature_enum, kind, value):
+    builders = {KIND_TOGGLE: audio.build_frames_toggle, KIND_SLIDER: audio.build_frames_slider,
+                KIND_SLIDER_SPECIAL: audio.build_frames_slider_special}
+    return builders[kind](audio_feature_enum, value)
+
+
+@pytest.mark.parametrize('with_report_id', [False, True])
+def test_frame_pairs_are_identical_to_the_single_builders(with_report_id):
+    audio = Audio()
+    commands = get_command_space()
+
+    buffer = audio.build_frame_pairs(commands, with_report_id=with_report_id)
+
+    expected = b''.join(bytes(frame.buffer) if with_report_id else bytes(frame.payload())
+                        for command in commands for frame in build_frames_singly(audio, *command))
+    assert buffer == expected
+
+
+def test_frame_pairs_of_no_commands_are_empty():
+    assert Audio().build_frame_pairs([]) == b''
+
+
+@pytest.mark.parametrize('command', [
+    ('BASS', KIND_SLIDER, 50),
+    (AudioFeatureEnum.BASS, KIND_TOGGLE, 1),
+    (AudioFeatureEnum.BASS, KIND_SLIDER, 100.5),
+    (AudioFeatureEnum.BASS, KIND_SLIDER, -1),
+    (AudioFeatureEnum.BASS, KIND_SLIDER, True),
+    (AudioFeatureEnum.BASS, KIND_SLIDER_SPECIAL, AudioFeatureSpecialValueEnum.SMART_VOLUME_NIGHT),
+])
+def test_frame_pairs_reject_what_the_single_builders_reject(command):
+    audio = Audio()
+    with pytest.raises(ValueError):
+        build_frames_singly(audio, *command)
+
+    # a single invalid command fails the whole batch
+    with pytest.raises(ValueError):
+        audio.build_frame_pairs([(AudioFeatureEnum.SURROUND, KIND_TOGGLE, True), command])
+
+
+def test_frame_pairs_as_numpy_array():
+    numpy = pytest.importorskip('numpy')
+    audio = Audio()
+    commands = get_command_space()
+
+    array = audio.build_frame_pairs(commands, as_numpy=True)
+
+    assert array.dtype == numpy.uint8
+    assert array.shape == (len(commands), 2, Frame.PAYLOAD_LENGTH)
+    assert array.tobytes() == audio.build_frame_pairs(commands)
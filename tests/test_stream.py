@@ -0,0 +1,52 @@
+import contextlib
+import io
+
+import pytest
+
+from g6_cli import get_state_file_path
+from g6_encoder import encode_value
+from g6_session import G6Session
+from g6_spec import Audio, AudioBatch, AudioFeatureEnum
+from g6_state import DeviceState
+from g6_stream import CommandCoalescer, StreamExecutor, parse_stream_command
+
+
+def test_coalescer_keeps_the_last_command_per_setting():
+    coalescer = CommandCoalescer()
+    for line in ['bass 10', 'surround on', 'bass 20']:
+        coalescer.put(parse_stream_command(line))
+    coalescer.close()
+
+    commands = coalescer.take()
+
+    assert [(command.audio_feature_enum, command.value) for command in commands] == \
+           [(AudioFeatureEnum.BASS, 20), (AudioFeatureEnum.SURROUND, True)]
+    assert coalescer.coalesced_count == 1
+    assert coalescer.take() is None
+
+
+def test_short_stream_ends_at_the_last_value_of_every_setting(simulated_g6, transport):
+    with contextlib.redirect_stdout(io.StringIO()), \
+            G6Session(simulated_g6.device_path, False, transport=transport, verbose=False) as session:
+        executor = StreamExecutor(session, Audio())
+        executor.run([io.StringIO('bass 1\nsurround on\n')])
+        state = DeviceState.load(get_state_file_path(session.serial_number))
+
+    assert simulated_g6.registers.get(0x19) == encode_value(1)
+    assert simulated_g6.registers.get(0x00) == encode_value(100)
+    assert state.get_audio_feature(AudioFeatureEnum.BASS, AudioBatch.SLOT_SLIDER) == 1
+    assert state.get_audio_feature(AudioFeatureEnum.SURROUND, AudioBatch.SLOT_TOGGLE) is True
+
+
+def test_slider_values_are_parsed_like_the_cli():
+    command = parse_stream_command('bass 42.5')
+
+    assert (command.audio_feature_enum, command.slot, command.value) == \
+           (AudioFeatureEnum.BASS, AudioBatch.SLOT_SLIDER, 42.5)
+    assert type(parse_stream_command('bass 42.0').value) is int
+
+
+@pytest.mark.parametrize('line', ['bass 100.5', 'bass -1', 'bass nan', 'surround night'])
+def test_invalid_slider_values_are_rejected(line):
+    with pytest.raises(ValueError, match='Expected \'on\', \'off\' or a value between'):
+        parse_stream_command(line)
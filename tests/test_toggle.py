@@ -0,0 +1,56 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from g6_cli import RUNTIME_DIR_PATH, execute_cli_args, get_state_file_path, get_toggle_state_file_path, \
+    parse_cli_args
+from g6_fast import set_output
+from g6_session import G6Session
+from g6_spec import Audio
+from g6_state import DeviceState
+
+TOGGLE_COUNT = 300
+
+
+def test_concurrent_toggles_leave_a_consistent_state(simulated_g6, transport):
+    audio = Audio()
+    # the outputs switched to by the output reports, which must alternate
+    outputs = []
+    process = simulated_g6.process
+
+    def record_output(payload):
+        response = process(payload)
+        if payload[1:3] == b'\x2c\x05':
+            outputs.append(simulated_g6.output)
+        return response
+
+    simulated_g6.process = record_output
+
+    def execute(cli_args):
+        with G6Session(simulated_g6.device_path, False, transport=transport, verbose=False) as session:
+            execute_cli_args(session, audio, parse_cli_args(cli_args))
+
+    def toggle(index):
+        # half of the toggles by the fast path, half of them by the full CLI
+        if index % 2 == 0:
+            device = transport.device()
+            device.open_path(simulated_g6.device_path)
+            try:
+                assert set_output(device, RUNTIME_DIR_PATH, None)
+            finally:
+                device.close()
+        else:
+            execute(['--toggle-output'])
+
+    execute(['--set-output', 'Speakers'])
+    # let the reports take a while, so that the toggles really overlap
+    simulated_g6.response_latency_seconds = 0.00005
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        list(executor.map(toggle, range(TOGGLE_COUNT)))
+
+    # no toggle has read the state of a concurrent toggle before it has been written
+    assert len(outputs) == TOGGLE_COUNT + 1
+    assert all(output != next_output for output, next_output in zip(outputs, outputs[1:]))
+    expected_output = 'Speakers' if TOGGLE_COUNT % 2 == 0 else 'Headphones'
+    assert simulated_g6.output == expected_output
+    assert DeviceState.load(get_state_file_path(simulated_g6.serial_number)).output == expected_output
+    with open(get_toggle_state_file_path(simulated_g6.serial_number)) as file:
+        assert file.read() == expected_output
@@ -0,0 +1,75 @@
+import contextlib
+import io
+import threading
+import time
+
+from g6_cli import execute_cli_args, get_state_file_path, parse_cli_args
+from g6_session import G6Session
+from g6_spec import Audio, AudioBatch, AudioFeatureEnum
+from g6_state import DeviceState
+from g6_watch import EVENT_OUTPUT_CHANGED, EVENT_VALUE_CHANGED, DeviceWatcher, ReportDecoder
+
+
+def run_cli_args(simulated_g6, transport, cli_args):
+    with contextlib.redirect_stdout(io.StringIO()), \
+            G6Session(simulated_g6.device_path, False, transport=transport, verbose=False) as session:
+        execute_cli_args(session, Audio(), parse_cli_args(cli_args))
+
+
+@contextlib.contextmanager
+def watching(simulated_g6, transport, events):
+    watcher = DeviceWatcher(transport, simulated_g6.device_path, Audio(), read_timeout_ms=10)
+    thread = threading.Thread(target=watcher.watch, args=(events.append,))
+    thread.start()
+    try:
+        # let the watcher open its handle before the first report
+        while len(simulated_g6.handles) < 1:
+            time.sleep(0.001)
+        yield watcher
+    finally:
+        watcher.stop()
+        thread.join()
+
+
+def wait_for_reports(watcher, report_count):
+    deadline = time.monotonic() + 1
+    while watcher.report_count < report_count and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+def test_commit_responses_are_ignored_by_default():
+    audio = Audio()
+    commit_frame = audio.build_frames_slider(AudioFeatureEnum.BASS, 50)[1]
+
+    assert ReportDecoder(audio).decode(commit_frame.payload()) is None
+    event = ReportDecoder(audio, decode_values=True).decode(commit_frame.payload())
+    assert event.kind == EVENT_VALUE_CHANGED and event.value == 0
+
+
+def test_echo_only_g6_does_not_overwrite_the_device_state(simulated_g6, transport):
+    simulated_g6.respond_values = False
+    events = []
+    with watching(simulated_g6, transport, events) as watcher:
+        run_cli_args(simulated_g6, transport, ['--set-bass', 'Enabled', '--set-bass-value', '50'])
+        wait_for_reports(watcher, 4)
+
+        state = DeviceState.load(get_state_file_path(simulated_g6.serial_number))
+        assert state.get_audio_feature(AudioFeatureEnum.BASS, AudioBatch.SLOT_TOGGLE) is True
+        assert state.get_audio_feature(AudioFeatureEnum.BASS, AudioBatch.SLOT_SLIDER) == 50
+
+        # not skipped as already set
+        run_cli_args(simulated_g6, transport, ['--set-bass', 'Disabled', '--set-bass-value', '0'])
+        wait_for_reports(watcher, 8)
+
+    assert simulated_g6.stats['write'] == 8
+    assert events == []
+
+
+def test_output_button_is_applied_to_the_device_state(simulated_g6, transport):
+    events = []
+    with watching(simulated_g6, transport, events) as watcher:
+        output = simulated_g6.press_output_button()
+        wait_for_reports(watcher, 1)
+
+    assert [(event.kind, event.value) for event in events] == [(EVENT_OUTPUT_CHANGED, output)]
+    assert DeviceState.load(get_state_file_path(simulated_g6.serial_number)).output == output